@@ -0,0 +1,42 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Charm action parameters."""
+
+from typing import Literal
+
+from pydantic import BaseModel, Field, model_validator
+
+
+class SearchConsoleLogParams(BaseModel):
+    """Parameters of the search-console-log action."""
+
+    console: str = Field(min_length=1)
+    pattern: str = ""
+    since: str = "10m"
+    until: str = ""
+    limit: int = Field(default=1000, ge=1)
+
+
+class TailConsoleLogParams(BaseModel):
+    """Parameters of the tail-console-log action."""
+
+    console: str = Field(min_length=1)
+    lines: int = Field(default=100, ge=1)
+
+
+class ConsoleOperationParams(BaseModel):
+    """Parameters of the console-operation action."""
+
+    operation: Literal["status", "reopen", "disconnect", "down", "up"]
+    pattern: str = ""
+    group: str = ""
+    concurrency: int = Field(default=32, ge=1)
+    timeout: float = Field(default=30, gt=0)
+    force: bool = False
+
+    @model_validator(mode="after")
+    def check_selection(self) -> "ConsoleOperationParams":
+        """Check that consoles are selected, so that all are not operated on by mistake."""
+        if not self.pattern and not self.group:
+            raise ValueError("Select consoles with a pattern, e.g. '*' for all, or a group")
+        return self
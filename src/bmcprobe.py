@@ -0,0 +1,116 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Reachability prober for the BMCs of IPMI consoles.
+
+BMCs are probed with an RMCP presence ping, which every IPMI BMC answers on
+UDP port 623 without authentication. Consoles of unreachable BMCs are parked
+with the `ondemand` option, so that conserver stops respawning their
+`ipmitool` process until a client connects to them.
+"""
+
+import asyncio
+from collections.abc import Iterable
+
+from conserver_cf import Block, ConserverCf
+
+RMCP_PORT = 623
+# RMCP header, ASF IANA enterprise number, presence ping message type
+PRESENCE_PING = bytes([0x06, 0x00, 0xFF, 0x06, 0x00, 0x00, 0x11, 0xBE, 0x80, 0x00, 0x00, 0x00])
+PRESENCE_PONG = 0x40
+PARK_OPTION = ("options", "ondemand")
+
+
+def _effective_items(model: ConserverCf, block: Block) -> dict[str, str]:
+    """Get the settings of a console, including the defaults it inherits."""
+    defaults = model.blocks_of("default")
+    items: dict[str, str] = {}
+
+    def apply(block: Block, seen: frozenset[str]):
+        for keyword, value in block.items:
+            if keyword == "include" and value in defaults and value not in seen:
+                apply(defaults[value], seen | {value})
+            else:
+                items[keyword] = value
+
+    if "*" in defaults:
+        apply(defaults["*"], frozenset({"*"}))
+    apply(block, frozenset())
+    return items
+
+
+def bmc_hosts(model: ConserverCf, master: str | None = None) -> dict[str, str]:
+    """Get the BMC address of each IPMI console, from its `host` setting.
+
+    Args:
+        model: conserver.cf model.
+        master: only get the consoles with this master, if set.
+    """
+    hosts = {}
+    for name, block in model.consoles.items():
+        items = _effective_items(model, block)
+        if master is not None and items.get("master") != master:
+            continue
+        host = items.get("host", "").strip("\"'")
+        if host and (items.get("type") == "ipmi" or "ipmitool" in items.get("exec", "")):
+            hosts[name] = host
+    return hosts
+
+
+def park_consoles(model: ConserverCf, consoles: Iterable[str]) -> ConserverCf:
+    """Park consoles, so that conserver only connects them when a client does."""
+    parked = set(consoles)
+    blocks = []
+    for block in model.blocks:
+        if block.kind == "console" and block.name in parked:
+            block = Block(block.kind, block.name, (*block.items, PARK_OPTION))
+        blocks.append(block)
+    return ConserverCf(blocks)
+
+
+class _PingProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.pong: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data: bytes, addr):
+        if len(data) > 8 and data[8] == PRESENCE_PONG and not self.pong.done():
+            self.pong.set_result(True)
+
+    def error_received(self, exc: Exception):
+        # e.g. ICMP port unreachable, nothing answers IPMI on the address
+        if not self.pong.done():
+            self.pong.set_result(False)
+
+
+async def ping(host: str, port: int = RMCP_PORT, timeout: float = 1.0, attempts: int = 2) -> bool:
+    """Check whether a BMC answers an RMCP presence ping."""
+    loop = asyncio.get_running_loop()
+    try:
+        transport, protocol = await loop.create_datagram_endpoint(
+            _PingProtocol, remote_addr=(host, port)
+        )
+    except OSError:
+        return False
+    try:
+        for _ in range(attempts):
+            transport.sendto(PRESENCE_PING)
+            try:
+                return await asyncio.wait_for(asyncio.shield(protocol.pong), timeout)
+            except asyncio.TimeoutError:
+                continue
+        return False
+    finally:
+        transport.close()
+
+
+async def unreachable_hosts(
+    hosts: Iterable[str], concurrency: int, port: int = RMCP_PORT, timeout: float = 1.0
+) -> set[str]:
+    """Ping BMCs concurrently, with at most `concurrency` pings in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(host: str) -> tuple[str, bool]:
+        async with semaphore:
+            return host, await ping(host, port, timeout)
+
+    results = await asyncio.gather(*(check(host) for host in sorted(set(hosts))))
+    return {host for host, up in results if not up}
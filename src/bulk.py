@@ -0,0 +1,140 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Operations on many consoles at once, through the conserver client.
+
+Each console is operated on by its own `console` client process, with at
+most `concurrency` of them running at a time. Reopening and downing a console
+attach to it read-write and send the client escape sequences, as the client
+has no command line option for them. Consoles with clients attached are
+skipped as busy, unless forced: force attaching bumps the client attached
+read-write down to spy mode.
+"""
+
+import asyncio
+import fnmatch
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+from conserver_cf import ConserverCf
+
+# Default escape sequence of the console client, ^Ec
+ESCAPE = b"\x05c"
+# Sent after the command, to detach from the console
+DETACH = ESCAPE + b"."
+# Escape commands of the operations attaching to the console
+ESCAPE_COMMANDS = {"reopen": b"o", "up": b"o", "down": b"d"}
+OPERATIONS = ("status", "reopen", "disconnect", "down", "up")
+
+
+@dataclass(frozen=True)
+class Result:
+    """Result of an operation on a console."""
+
+    console: str
+    ok: bool
+    message: str
+    seconds: float = 0.0
+
+
+def select_consoles(
+    model: ConserverCf, pattern: str = "", group: str = "", master: str | None = None
+) -> list[str]:
+    """Get the consoles matching a name pattern and including a group.
+
+    Args:
+        model: conserver.cf model.
+        pattern: shell-style pattern the console names match, any name if empty.
+        group: `default` block the consoles include, any if empty.
+        master: only get the consoles with this master, if set.
+    """
+    consoles = []
+    for name, block in model.consoles.items():
+        if pattern and not fnmatch.fnmatchcase(name, pattern):
+            continue
+        values: dict[str, list[str]] = {"include": [], "master": []}
+        for keyword, value in block.items:
+            if keyword in values:
+                values[keyword].append(value.strip("\"'"))
+        if group and group not in values["include"]:
+            continue
+        # The last master wins, as sharding appends one to each console
+        if master is not None and values["master"][-1:] != [master]:
+            continue
+        consoles.append(name)
+    return consoles
+
+
+def client_command(
+    operation: str, console: str, port: int, force: bool = False
+) -> tuple[list[str], bytes]:
+    """Get the console client command running an operation, and its input."""
+    command = ["console", "-M", "127.0.0.1", "-p", str(port)]
+    if operation == "disconnect":
+        return [*command, "-d", f"@{console}"], b""
+    if force:
+        command.append("-f")
+    return [*command, console], ESCAPE + ESCAPE_COMMANDS[operation] + DETACH
+
+
+async def _run(operation: str, console: str, port: int, timeout: float, force: bool) -> Result:
+    """Run an operation on a console with the console client."""
+    command, stdin = client_command(operation, console, port, force)
+    start = time.monotonic()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+    except OSError as e:
+        return Result(console, False, str(e))
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(stdin), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return Result(console, False, f"Timed out after {timeout}s", time.monotonic() - start)
+    seconds = time.monotonic() - start
+    # The client echoes the console output, only its last line is of interest
+    lines = stdout.decode("utf-8", errors="replace").strip().splitlines()
+    message = lines[-1].strip() if lines else ""
+    if process.returncode:
+        return Result(console, False, message or f"Exited with {process.returncode}", seconds)
+    return Result(console, True, message, seconds)
+
+
+async def run_operation(
+    operation: str,
+    consoles: Mapping[str, tuple[int, bool, int]],
+    concurrency: int,
+    timeout: float,
+    force: bool = False,
+) -> list[Result]:
+    """Run an operation on consoles concurrently, with at most `concurrency` at once.
+
+    Args:
+        operation: one of OPERATIONS.
+        consoles: port of the conserver process serving each console, whether
+            it is up and its number of clients, by console name.
+        concurrency: maximum number of console clients running at once.
+        timeout: seconds before the client operating on a console is killed.
+        force: attach to the consoles with clients attached too, bumping the
+            client attached read-write down to spy mode.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def operate(console: str, port: int, up: bool, clients: int) -> Result:
+        if operation == "status":
+            return Result(console, True, f"{'up' if up else 'down'}, {clients} clients")
+        if operation == "up" and up:
+            return Result(console, True, "Already up")
+        if operation in ESCAPE_COMMANDS and clients and not force:
+            return Result(console, False, f"Busy, {clients} clients attached")
+        async with semaphore:
+            return await _run(operation, console, port, timeout, force)
+
+    return await asyncio.gather(
+        *(operate(console, *state) for console, state in sorted(consoles.items()))
+    )
@@ -0,0 +1,169 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Capacity of a unit for consoles, projected from what conserver uses.
+
+The memory, file descriptors and CPU time of the processes of the conserver
+services, conserver and the console commands it runs such as ipmitool, are
+measured from /proc and divided by the number of consoles they serve. The
+free resources of the unit then give the number of consoles each resource can
+sustain, the smallest of which is the capacity of the unit.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from conserver import CONSERVER_INSTANCE_SERVICE, CONSERVER_SERVICE
+from tuning import ResourcePlan
+
+# Shares of the free memory and of the CPUs left to conserver, keeping some
+# for the charm, the exporter and log rotation
+MEMORY_BUDGET = 0.8
+CPU_BUDGET = 0.8
+
+# Control group of the conserver service, or of any of its instances
+_SERVICE_CGROUP_RE = re.compile(
+    rf"/(?:{re.escape(CONSERVER_SERVICE)}|{re.escape(CONSERVER_INSTANCE_SERVICE)}@\d+)\.service$"
+)
+
+
+@dataclass(frozen=True)
+class Usage:
+    """Resources used by the processes of the conserver services."""
+
+    processes: int = 0
+    # Proportional set size, so that memory shared by the children counts once
+    memory: int = 0
+    fds: int = 0
+    # Average number of CPUs used since each process started
+    cpu: float = 0.0
+
+
+@dataclass(frozen=True)
+class Resources:
+    """Free resources of the unit."""
+
+    memory: int
+    fds: int
+    cpus: int
+
+
+def _pss(pid: Path) -> int:
+    """Get the proportional set size of a process, in bytes."""
+    for line in (pid / "smaps_rollup").read_text().splitlines():
+        if line.startswith("Pss:"):
+            return int(line.split()[1]) * 1024
+    return 0
+
+
+def _in_service(pid: Path) -> bool:
+    """Check whether a process runs in the control group of a conserver service."""
+    # One line per hierarchy with cgroup v1, a single one with cgroup v2
+    return any(
+        _SERVICE_CGROUP_RE.search(line.split(":", 2)[-1])
+        for line in (pid / "cgroup").read_text().splitlines()
+    )
+
+
+def _cpu(pid: Path, uptime: float, ticks: int) -> float:
+    """Get the average number of CPUs a process used since it started."""
+    # Fields after the command name, which may contain spaces
+    fields = (pid / "stat").read_text().rpartition(")")[2].split()
+    utime, stime, start = int(fields[11]), int(fields[12]), int(fields[19])
+    return (utime + stime) / ticks / max(uptime - start / ticks, 1.0)
+
+
+def measure_usage(proc: Path = Path("/proc")) -> Usage:
+    """Measure the resources used by the conserver services, including the console commands.
+
+    The console commands, e.g. `ipmitool sol activate`, use most of the
+    memory and CPU per console, so every process of the services is measured
+    rather than conserver alone.
+    """
+    uptime = float((proc / "uptime").read_text().split()[0])
+    ticks = os.sysconf("SC_CLK_TCK")
+    processes, memory, fds, cpu = 0, 0, 0, 0.0
+    for pid in proc.iterdir():
+        if not pid.name.isdigit():
+            continue
+        try:
+            if not _in_service(pid):
+                continue
+            memory += _pss(pid)
+            fds += len(os.listdir(pid / "fd"))
+            cpu += _cpu(pid, uptime, ticks)
+        except (OSError, ValueError, IndexError):
+            # Exited while being measured
+            continue
+        processes += 1
+    return Usage(processes, memory, fds, cpu)
+
+
+def measure_resources(proc: Path = Path("/proc")) -> Resources:
+    """Measure the free memory and file descriptors of the unit, and its CPUs."""
+    meminfo = dict(
+        line.split(":", 1) for line in (proc / "meminfo").read_text().splitlines() if ":" in line
+    )
+    memory = int(meminfo["MemAvailable"].split()[0]) * 1024
+    allocated, _, maximum = map(int, (proc / "sys/fs/file-nr").read_text().split())
+    return Resources(memory, maximum - allocated, os.cpu_count() or 1)
+
+
+@dataclass(frozen=True)
+class Capacity:
+    """Number of consoles a unit serves, and can sustain by resource."""
+
+    consoles: int
+    usage: Usage
+    limits: dict[str, int]
+
+    @property
+    def max_consoles(self) -> int:
+        """Get the number of consoles the unit can sustain."""
+        return min(self.limits.values())
+
+    @property
+    def bottleneck(self) -> str:
+        """Get the resource limiting the number of consoles."""
+        return min(self.limits, key=lambda resource: self.limits[resource])
+
+    @property
+    def headroom(self) -> int:
+        """Get the number of consoles the unit can take on top of its own."""
+        return max(0, self.max_consoles - self.consoles)
+
+    @property
+    def headroom_percent(self) -> float:
+        """Get the headroom, as a percentage of the capacity."""
+        return 100 * self.headroom / self.max_consoles if self.max_consoles else 0.0
+
+    def per_console(self, resource: str) -> float:
+        """Get the usage of a resource, e.g. `memory`, per console."""
+        return getattr(self.usage, resource) / self.consoles if self.consoles else 0.0
+
+
+def project_capacity(
+    consoles: int, usage: Usage, resources: Resources, plan: ResourcePlan
+) -> Capacity:
+    """Project the number of consoles a unit can sustain by resource.
+
+    Args:
+        consoles: number of consoles served by the conserver processes.
+        usage: resources used by the conserver processes.
+        resources: free resources of the unit.
+        plan: resource plan of the conserver processes, for their ports.
+    """
+    limits = {"ports": plan.port_capacity}
+    capacity = Capacity(consoles, usage, limits)
+    # Nothing to project from until conserver serves consoles
+    if not consoles or not usage.processes:
+        return capacity
+    if usage.memory:
+        budget = resources.memory * MEMORY_BUDGET
+        limits["memory"] = consoles + int(budget / capacity.per_console("memory"))
+    if usage.fds:
+        limits["fds"] = consoles + int(resources.fds / capacity.per_console("fds"))
+    if usage.cpu:
+        limits["cpu"] = int(resources.cpus * CPU_BUDGET / capacity.per_console("cpu"))
+    return capacity
@@ -4,64 +4,1125 @@
 
 """Charm the application."""
 
+import asyncio
+import io
+import itertools
+import json
 import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
 
 import ops
+from charmlibs import apt
 
+from actions import ConsoleOperationParams, SearchConsoleLogParams, TailConsoleLogParams
+from bmcprobe import bmc_hosts, park_consoles, unreachable_hosts
+from bulk import run_operation, select_consoles
+from capacity import measure_resources, measure_usage, project_capacity
 from config import ConserverConfig
-from conserver import Conserver
+from conserver import (
+    BASE_PORT,
+    CONSERVER_LOG_DIR,
+    PRIMARY_PORT,
+    ConfigValidationError,
+    Conserver,
+    file_digest,
+)
+from conserver_cf import (
+    Action,
+    Block,
+    ConfigParseError,
+    ConserverCf,
+    diff_configs,
+    parse_config,
+)
+from debs import DEBS_DIR, LocalDeb, extract_debs, read_debs
+from failover import FloatingAddress, FloatingAddressError
+from inventory import (
+    Inventory,
+    InventoryConsole,
+    InventoryError,
+    load_inventory,
+    render_consoles,
+    render_inventory,
+)
+from logrotate import log_paths
+from logsearch import parse_time, search_log, tail_log
+from metrics import METRICS_PATH, METRICS_RELATION, record_duration
+from passwd import PASSWD_CACHE, USERS_KEY, HashCache, PasswdError, parse_users, render_passwd
+from payload import ChecksumError, decompress_file, verify_checksum
+from registry import (
+    CONSOLES_KEY,
+    CREDENTIALS_KEY,
+    REGISTRY_RELATION,
+    merge_registrations,
+    render_due,
+)
+from sharding import shard_consoles
+from tracing import set_attributes, traced
+from tuning import CapacityError
+from upgrade import (
+    ACTIVE_KEY,
+    DRAINING_KEY,
+    TAKEOVER_KEY,
+    TURN_KEY,
+    UPGRADE_KEY,
+    next_turn,
+    takeover_unit,
+)
 
 logger = logging.getLogger(__name__)
 
+PEER_RELATION = "conserver-peers"
+TRACING_RELATION = "charm-tracing"
+# Seconds for the last console to connect once conserver initialized it
+STARTUP_GRACE = 60
 
+
+@traced
 class ConserverCharm(ops.CharmBase):
     """Charm the application."""
 
+    _stored = ops.StoredState()
+
     def __init__(self, framework: ops.Framework):
         super().__init__(framework)
+        self._hook_started = time.monotonic()
+        self._stored.set_default(
+            config_digest="",
+            passwd_digest="",
+            config_error="",
+            failover_error="",
+            arping_error="",
+            deploy_error="",
+            instances=1,
+            binary_id="",
+            version="",
+            log_paths=[],
+            startup_time=0.0,
+            parked=[],
+            ports=[PRIMARY_PORT, BASE_PORT],
+            console_count=0,
+            registrations_pending_since=0.0,
+            registrations_changed_at=0.0,
+            staged_version="",
+            upgrade_error="",
+            packages_attachment="",
+            served_count=0,
+            low_headroom="",
+        )
         self.typed_config = self.load_config(ConserverConfig, errors="blocked")
-        self.conserver = Conserver()
+        self.conserver = Conserver(
+            instances=self.typed_config.instances,
+            port=self.typed_config.port,
+            base_port=self.typed_config.base_port,
+        )
+        self._setup_tracing()
         self.framework.observe(self.on.install, self._on_install)
+        self.framework.observe(self.on.upgrade_charm, self._on_upgrade_charm)
         self.framework.observe(self.on.config_changed, self._on_config_changed)
         self.framework.observe(self.on.start, self._on_start)
         self.framework.observe(self.on.stop, self._on_stop)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.on.leader_elected, self._on_leader_elected)
+        self.framework.observe(self.on.secret_changed, self._on_config_changed)
+        self.framework.observe(self.on[PEER_RELATION].relation_joined, self._on_peers_changed)
+        self.framework.observe(self.on[PEER_RELATION].relation_changed, self._on_peers_changed)
+        self.framework.observe(self.on[PEER_RELATION].relation_departed, self._on_peers_changed)
+        self.framework.observe(
+            self.on[METRICS_RELATION].relation_joined, self._on_metrics_relation_joined
+        )
+        for event in (
+            self.on[REGISTRY_RELATION].relation_changed,
+            self.on[REGISTRY_RELATION].relation_departed,
+            self.on[REGISTRY_RELATION].relation_broken,
+        ):
+            self.framework.observe(event, self._on_registrations_changed)
+        self.framework.observe(self.on.search_console_log_action, self._on_search_console_log)
+        self.framework.observe(self.on.tail_console_log_action, self._on_tail_console_log)
+        self.framework.observe(self.on.console_operation_action, self._on_console_operation)
+        self.framework.observe(self.on.capacity_report_action, self._on_capacity_report)
+        self.framework.observe(self.framework.on.commit, self._on_commit)
+
+    def _setup_tracing(self):
+        """Export traces to the tracing-endpoint collector, or else through charm-tracing."""
+        if self.typed_config.tracing_endpoint:
+            ops.tracing.set_destination(url=self.typed_config.tracing_endpoint, ca=None)
+        else:
+            self.tracing = ops.tracing.Tracing(self, TRACING_RELATION)
 
     def _on_install(self, _):
         """Handle install event."""
         self.unit.status = ops.MaintenanceStatus("Installing conserver-server")
-        self.conserver.install()
+        self.conserver.install(self.typed_config.conserver_version, self._local_debs())
+
+    def _on_upgrade_charm(self, _):
+        """Handle upgrade-charm event, keeping conserver running with its configuration."""
+        # Also emitted when resources are attached, e.g. after the packages
+        # resource failed to install conserver
+        if not self.conserver.package_version:
+            self._on_install(None)
+        else:
+            # Only the packages the new revision may need, conserver itself is
+            # upgraded unit by unit once conserver-version changes
+            self.conserver.install_dependencies(self._local_debs())
+            # Also held when installed by a revision that did not hold them
+            self.conserver.hold_packages(True)
+        # The packages resource may have been attached with arping
+        self._stored.arping_error = ""
+        self.set_status()
 
     def _on_config_changed(self, _):
         """Handle changes in configuration."""
         self.unit.status = ops.MaintenanceStatus("Updating configuration")
-        self.conserver.write_conserver_config(self.typed_config.config_file)
-        self.conserver.write_passwd_file(self.typed_config.passwd_file)
-        # Restart service to apply changes
-        self.conserver.reload(restart_on_failure=True, ignore_errors=True)
+        # Registered consoles are rendered with the rest of the configuration
+        self._stored.registrations_pending_since = 0.0
+        # A failed arping installation is only retried on configuration changes
+        self._stored.arping_error = ""
+        self._publish_address()
+        # Before rendering, so that the consoles of a unit about to upgrade move away
+        self._request_upgrade()
+        # The previous processes are only stopped once the new files are deployed
+        switched = self._instances_changed
+        self.conserver.configure_exporter(
+            self.typed_config.metrics_port, self.charm_dir / "src" / "exporter.py"
+        )
+        self._publish_scrape_jobs()
+
+        files = self._try_load_files()
+        if files is None:
+            return
+        config_file, passwd_file = files
+
+        action = Action.NONE
+        config_file = self._render_config(config_file)
+        config_digest = file_digest(config_file)
+        # The consoles are redistributed across the new processes
+        config_changed = switched or config_digest != self._stored.config_digest
+        consoles, model = self._stored.console_count, None
+        set_attributes(config_size=len(config_file))
+        if config_changed:
+            action, model = self._config_action(
+                self.conserver.read_conserver_config(), config_file
+            )
+            if model is not None:
+                consoles = len(model.consoles)
+        set_attributes(consoles=consoles)
+        plan = self.conserver.resource_plan(consoles)
+        try:
+            plan.check()
+        except CapacityError as e:
+            logger.error("Not enough resources for the consoles: %s", e)
+            self._block_deploy(f"Cannot scale: {e}")
+            return
+        if config_changed:
+            if not self._write_config(config_file, model):
+                return
+            self._stored.config_digest = config_digest
+            self._stored.console_count = consoles
+            self._stored.served_count = self._served_count(model, consoles)
+            self._stored.log_paths = self._log_paths(config_file)
+        # Only once conserver accepted the files, so that rejected ones keep the limits
+        if self.conserver.write_resource_limits(plan):
+            action = Action.RESTART
+
+        passwd_digest = file_digest(passwd_file)
+        if passwd_digest != self._stored.passwd_digest:
+            self.conserver.write_passwd_file(passwd_file)
+            self._stored.passwd_digest = passwd_digest
+            action = max(action, Action.RELOAD)
+
+        self._configure_log_rotation()
+        if self._apply_changes(action, switched) and config_changed:
+            self._check_rollout()
+        self._sync_role()
+        self._acknowledge_takeover()
+        self._upgrade_on_turn()
         self.set_status()
 
+    def _on_peers_changed(self, event):
+        """Handle units joining or leaving the peer relation."""
+        # Consoles are re-sharded across the new set of units
+        self._on_config_changed(event)
+
+    def _on_metrics_relation_joined(self, _):
+        """Handle a Prometheus joining the metrics-endpoint relation."""
+        self._publish_scrape_jobs()
+
+    def _on_search_console_log(self, event: ops.ActionEvent):
+        """Handle the search-console-log action."""
+        params = event.load_params(SearchConsoleLogParams, errors="fail")
+        log = self._console_log(params.console)
+        if log is None:
+            event.fail(f"No log found for console {params.console}")
+            return
+        now = time.time()
+        try:
+            since = parse_time(params.since, now)
+            until = parse_time(params.until, now) if params.until else now
+            lines, truncated = search_log(log, params.pattern, since, until, params.limit)
+        except (ValueError, re.error) as e:
+            event.fail(str(e))
+            return
+        event.set_results(
+            {"matches": len(lines), "truncated": truncated, "output": "\n".join(lines)}
+        )
+
+    def _on_tail_console_log(self, event: ops.ActionEvent):
+        """Handle the tail-console-log action."""
+        params = event.load_params(TailConsoleLogParams, errors="fail")
+        log = self._console_log(params.console)
+        if log is None:
+            event.fail(f"No log found for console {params.console}")
+            return
+        event.set_results({"output": "\n".join(tail_log(log, params.lines))})
+
+    def _on_console_operation(self, event: ops.ActionEvent):
+        """Handle the console-operation action."""
+        params = event.load_params(ConsoleOperationParams, errors="fail")
+        try:
+            model = parse_config(self.conserver.read_conserver_config())
+        except ConfigParseError as e:
+            event.fail(f"Failed to parse conserver.cf: {e}")
+            return
+        addresses = self._shard_addresses()
+        # Consoles served by other units are left to the action on those units
+        master = addresses.get(self.unit.name) if self._sharded(addresses) else None
+        selected = select_consoles(model, params.pattern, params.group, master)
+        served = self.conserver.console_users()
+        consoles = {name: served[name] for name in selected if name in served}
+        event.log(f"Running {params.operation} on {len(consoles)} consoles")
+        start = time.monotonic()
+        results = asyncio.run(
+            run_operation(
+                params.operation, consoles, params.concurrency, params.timeout, params.force
+            )
+        )
+        failed = [result.console for result in results if not result.ok]
+        event.set_results(
+            {
+                "consoles": len(results),
+                "failed": len(failed),
+                # Selected consoles that conserver does not know, e.g. not reloaded yet
+                "missing": len(selected) - len(consoles),
+                "seconds": round(time.monotonic() - start, 3),
+                "results": json.dumps(
+                    [dict(asdict(result), seconds=round(result.seconds, 3)) for result in results]
+                ),
+            }
+        )
+        if failed:
+            event.fail(f"{params.operation} failed on {len(failed)} of {len(results)} consoles")
+
+    def _on_capacity_report(self, event: ops.ActionEvent):
+        """Handle the capacity-report action."""
+        try:
+            model = parse_config(self.conserver.read_conserver_config())
+        except ConfigParseError as e:
+            event.fail(f"Failed to parse conserver.cf: {e}")
+            return
+        served = self._served_count(model, len(model.consoles))
+        plan = self.conserver.resource_plan(served)
+        try:
+            usage, resources = measure_usage(), measure_resources()
+        except (OSError, ValueError, KeyError) as e:
+            event.fail(f"Failed to measure the resources of the unit: {e}")
+            return
+        capacity = project_capacity(served, usage, resources, plan)
+        event.set_results(
+            {
+                "consoles": len(model.consoles),
+                "served": capacity.consoles,
+                "processes": capacity.usage.processes,
+                "per-console": {
+                    "memory-bytes": round(capacity.per_console("memory")),
+                    "fds": round(capacity.per_console("fds"), 2),
+                    "cpu": round(capacity.per_console("cpu"), 6),
+                },
+                "ports": {
+                    "base-port": self.typed_config.base_port,
+                    "used": plan.children * plan.instances,
+                    "available": plan.available_ports * plan.instances,
+                },
+                "max-consoles": capacity.limits,
+                "capacity": capacity.max_consoles,
+                "headroom": capacity.headroom,
+                "headroom-percent": round(capacity.headroom_percent, 1),
+                "bottleneck": capacity.bottleneck,
+            }
+        )
+
+    def _served_count(self, model: ConserverCf | None, consoles: int) -> int:
+        """Get the number of consoles this unit connects to, out of those of conserver.cf."""
+        addresses = self._shard_addresses()
+        if model is None or not self._sharded(addresses):
+            return consoles
+        return len(select_consoles(model, master=addresses.get(self.unit.name, "")))
+
+    def _check_headroom(self):
+        """Report in the status when the unit has little headroom left for more consoles."""
+        threshold = self.typed_config.capacity_headroom
+        if not threshold or self._standby or not self.conserver.running:
+            self._stored.low_headroom = ""
+            return
+        served = self._stored.served_count
+        try:
+            usage, resources = measure_usage(), measure_resources()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Failed to measure the capacity of the unit: %s", e)
+            return
+        capacity = project_capacity(served, usage, resources, self.conserver.resource_plan(served))
+        # Only the ports could be projected without conserver processes to measure
+        if not usage.processes or capacity.headroom_percent >= threshold:
+            self._stored.low_headroom = ""
+            return
+        self._stored.low_headroom = (
+            f"Low headroom: {capacity.headroom} more consoles, limited by {capacity.bottleneck}"
+        )
+
+    def _console_log(self, console: str) -> Path | None:
+        """Get the current log file of a console."""
+        if "/" in console or console.startswith("."):
+            return None
+        for glob in list(self._stored.log_paths) or [f"{CONSERVER_LOG_DIR}/*.log"]:
+            path = Path(glob.replace("*", console))
+            if path.is_file():
+                return path
+        return None
+
+    def _on_commit(self, _):
+        """Record the duration of the hook once all its events were handled."""
+        hook = Path(os.environ.get("JUJU_DISPATCH_PATH", "unknown")).name
+        record_duration("hook", hook, time.monotonic() - self._hook_started)
+
     def _on_start(self, _):
         """Handle start event."""
-        self.conserver.start(ignore_errors=True)
-        self.unit.set_workload_version(self.conserver.version)
+        if self._standby:
+            self._demote()
+        else:
+            self.conserver.start(ignore_errors=True)
+            self._stored.startup_time = time.time()
+        self.unit.set_workload_version(self._workload_version())
+        self.set_status()
+
+    def _on_registrations_changed(self, event):
+        """Handle changes in the consoles registered by other charms."""
+        now = time.time()
+        self._stored.registrations_changed_at = now
+        if not self._stored.registrations_pending_since:
+            self._stored.registrations_pending_since = now
+        self._render_registrations(event)
+
+    def _render_registrations(self, event):
+        """Render the registered consoles once their registrations settled."""
+        if render_due(
+            self._stored.registrations_pending_since,
+            self._stored.registrations_changed_at,
+            self.typed_config.registration_delay,
+        ):
+            self._on_config_changed(event)
+
+    def _on_leader_elected(self, _):
+        """Handle leader-elected event."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is not None and not relation.data[self.app].get(TURN_KEY):
+            # The active unit follows leadership again, unless a unit fails
+            # over to upgrade
+            relation.data[self.app][ACTIVE_KEY] = ""
+        # conserver is already configured on standby units, so it only needs
+        # to be started to take over the consoles
+        self._sync_role()
+        self.set_status()
+
+    def _on_update_status(self, event):
+        """Handle update-status event."""
+        self._sync_role()
+        self._render_registrations(event)
+        if self.typed_config.bmc_probe:
+            self._probe_bmcs(event)
+        self._check_headroom()
         self.set_status()
 
+    def _probe_bmcs(self, event):
+        """Park the consoles of unreachable BMCs, and unpark those that came back."""
+        try:
+            model = parse_config(self.conserver.read_conserver_config())
+        except ConfigParseError as e:
+            logger.warning("Failed to parse conserver.cf, not probing BMCs: %s", e)
+            return
+        addresses = self._shard_addresses()
+        # With several units, only probe the consoles this unit connects to
+        master = addresses.get(self.unit.name) if self._sharded(addresses) else None
+        hosts = bmc_hosts(model, master)
+        unreachable = asyncio.run(
+            unreachable_hosts(hosts.values(), self.typed_config.bmc_probe_concurrency)
+        )
+        parked = sorted(name for name, host in hosts.items() if host in unreachable)
+        if parked == list(self._stored.parked):
+            return
+        logger.info("Parking %d consoles with unreachable BMCs: %s", len(parked), parked)
+        self._stored.parked = parked
+        self._on_config_changed(event)
+
+    def _workload_version(self) -> str:
+        """Get the conserver version, only running conserver when its package changed."""
+        binary_id = self.conserver.binary_id
+        if not binary_id or binary_id != self._stored.binary_id:
+            self._stored.version = self.conserver.version
+            self._stored.binary_id = binary_id
+        return self._stored.version
+
     def _on_stop(self, _):
         """Handle stop event."""
         self.conserver.stop(ignore_errors=True)
+        self._move_floating_address(assign=False)
+        self.conserver.remove_exporter()
+        self.conserver.remove_log_rotation()
         self.conserver.uninstall()
 
+    @property
+    def _instances_changed(self) -> bool:
+        """Check whether the number or ports of the conserver processes changed."""
+        ports = [self.typed_config.port, self.typed_config.base_port]
+        return self._stored.instances != self.typed_config.instances or self._stored.ports != ports
+
+    def _switch_instances(self):
+        """Stop the previous group of conserver processes, and configure the new one."""
+        Conserver(instances=self._stored.instances).stop(ignore_errors=True)
+        self.conserver.write_server_config()
+        self._stored.instances = self.typed_config.instances
+        self._stored.ports = [self.typed_config.port, self.typed_config.base_port]
+
+    def _write_config(self, contents: str, model: ConserverCf | None) -> bool:
+        """Deploy a new conserver.cf file, returning whether it was accepted."""
+        try:
+            self.conserver.write_conserver_config(contents, model)
+        except ConfigParseError as e:
+            logger.error("Failed to split conserver.cf across instances: %s", e)
+            self._stored.config_error = "Invalid config-file, cannot split consoles"
+            self.unit.status = ops.BlockedStatus(self._stored.config_error)
+            return False
+        except ConfigValidationError as e:
+            logger.error("Conserver rejected the new conserver.cf: %s", e)
+            self._stored.config_error = "Invalid config-file, rejected by conserver"
+            self.unit.status = ops.BlockedStatus(self._stored.config_error)
+            return False
+        self._stored.config_error = ""
+        return True
+
+    def _check_rollout(self):
+        """Roll back to the previous conserver.cf if conserver failed with the new one."""
+        self.conserver.settle()
+        if not self.conserver.failed:
+            return
+        logger.error("Conserver failed with the new conserver.cf, rolling back")
+        if self.conserver.rollback_conserver_config():
+            self.conserver.restart(ignore_errors=True)
+            self._stored.startup_time = time.time()
+        # Apply the new file again on the next config change, in case it was not at fault
+        self._stored.config_digest = ""
+        self._stored.config_error = "Conserver failed with the new config-file, rolled back"
+
+    def _apply_changes(self, action: Action, switched: bool) -> bool:
+        """Apply changes with the least disruptive action that picks them up.
+
+        Returns:
+            Whether conserver was started, restarted or reloaded.
+        """
+        if switched:
+            self._switch_instances()
+        if self._standby:
+            logger.info("Standby unit, changes are applied when it is promoted")
+            return False
+        if switched:
+            self.conserver.start(ignore_errors=True)
+        elif action == Action.RESTART:
+            self.conserver.restart(ignore_errors=True)
+        elif action == Action.RELOAD:
+            self.conserver.reload(restart_on_failure=True, ignore_errors=True)
+        else:
+            logger.info("Configuration unchanged, skipping reload")
+            return False
+        if switched or action == Action.RESTART:
+            self._stored.startup_time = time.time()
+        return True
+
+    @property
+    def _standby(self) -> bool:
+        """Check whether this unit is a standby unit, keeping conserver stopped."""
+        if self.typed_config.ha_mode != "active-standby":
+            return False
+        active = self._active_override()
+        return self.unit.name != active if active else not self.unit.is_leader()
+
+    def _active_override(self) -> str:
+        """Get the unit active in place of the leader, after the active unit failed over."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None:
+            return ""
+        active = relation.data[self.app].get(ACTIVE_KEY, "")
+        # Leadership decides again once the unit left
+        units = {unit.name for unit in {self.unit, *relation.units}}
+        return active if active in units else ""
+
+    def _sync_role(self):
+        """Promote or demote this unit in active-standby mode, following leadership."""
+        if self.typed_config.ha_mode != "active-standby":
+            self._stored.failover_error = ""
+            self._stored.arping_error = ""
+            return
+        self._install_arping()
+        if not self._standby:
+            self._promote()
+        elif not self._handing_over():
+            # A unit failing over to upgrade serves until the standby took over
+            self._demote()
+        self._publish_endpoint()
+
+    def _promote(self):
+        """Make this unit the active unit, serving all the consoles."""
+        if not self.conserver.running:
+            logger.info("Promoted to active unit, starting conserver")
+            self.conserver.start(ignore_errors=True)
+            self._stored.startup_time = time.time()
+        # Moved once conserver is started, so that clients directly reach it
+        self._move_floating_address(assign=True)
+
+    def _demote(self):
+        """Make this unit a standby unit, with conserver configured but stopped."""
+        if self.conserver.running or self.conserver.failed:
+            logger.info("Demoted to standby unit, stopping conserver")
+            self.conserver.stop(ignore_errors=True)
+        self._move_floating_address(assign=False)
+
+    def _install_arping(self):
+        """Install arping to announce the floating address, if it is not installed yet.
+
+        A failure blocks the unit, and is retried on config-changed and upgrade-charm
+        rather than on every hook.
+        """
+        if self._stored.arping_error or self.conserver.arping_installed:
+            return
+        try:
+            self.conserver.install_arping(self._local_debs())
+        except (apt.PackageError, ChecksumError) as e:
+            # The address is still moved, switches only learn it later
+            logger.error("Failed to install arping: %s", e)
+            self._stored.arping_error = "Failed to install arping"
+
+    def _floating_address(self) -> FloatingAddress | None:
+        """Get the floating address of the active unit, if configured."""
+        if not self.typed_config.virtual_ip:
+            return None
+        binding = self.model.get_binding(PEER_RELATION)
+        interfaces = binding.network.interfaces if binding else []
+        try:
+            return FloatingAddress.on_interfaces(
+                self.typed_config.virtual_ip,
+                ((interface.name, interface.subnet) for interface in interfaces),
+            )
+        except FloatingAddressError as e:
+            logger.error("Cannot use virtual-ip: %s", e)
+            return None
+
+    def _move_floating_address(self, assign: bool):
+        """Assign the floating address to this unit, or release it, blocking it on failure."""
+        self._stored.failover_error = ""
+        floating = self._floating_address()
+        if floating is None:
+            return
+        action = "assign" if assign else "release"
+        try:
+            if not assign:
+                floating.release()
+            elif not floating.assigned:
+                floating.assign()
+                floating.announce()
+        except FloatingAddressError as e:
+            logger.error("Failed to %s the floating address: %s", action, e)
+            self._stored.failover_error = f"Failed to {action} virtual-ip"
+
+    def _publish_endpoint(self):
+        """Publish the address clients connect to in the peer and consoles relations."""
+        if not self.unit.is_leader():
+            return
+        active = self._active_override() or self.unit.name
+        address = self.typed_config.virtual_ip or self._peer_addresses().get(active)
+        if not address:
+            return
+        endpoint = {"endpoint": address, "port": str(self.typed_config.port)}
+        relations = [self.model.get_relation(PEER_RELATION)]
+        relations += self.model.relations[REGISTRY_RELATION]
+        for relation in relations:
+            if relation is not None:
+                relation.data[self.app].update(endpoint)
+
+    def _publish_address(self):
+        """Publish the address of this unit in the peer relation."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None:
+            return
+        binding = self.model.get_binding(relation)
+        if binding is None or binding.network.ingress_address is None:
+            return
+        relation.data[self.unit]["address"] = str(binding.network.ingress_address)
+
+    def _publish_scrape_jobs(self):
+        """Publish the exporter scrape job in the metrics-endpoint relations."""
+        # Prometheus replaces the "*" host with the address of each unit
+        jobs = [
+            {
+                "metrics_path": METRICS_PATH,
+                "static_configs": [{"targets": [f"*:{self.typed_config.metrics_port}"]}],
+            }
+        ]
+        metadata = {
+            "model": self.model.name,
+            "model_uuid": self.model.uuid,
+            "application": self.app.name,
+            "charm_name": self.meta.name,
+        }
+        binding = self.model.get_binding(METRICS_RELATION)
+        address = binding.network.ingress_address if binding else None
+        for relation in self.model.relations[METRICS_RELATION]:
+            if self.unit.is_leader():
+                relation.data[self.app]["scrape_jobs"] = json.dumps(jobs)
+                relation.data[self.app]["scrape_metadata"] = json.dumps(metadata)
+            relation.data[self.unit]["prometheus_scrape_unit_name"] = self.unit.name
+            if address is not None:
+                relation.data[self.unit]["prometheus_scrape_unit_address"] = str(address)
+
+    def _shard_addresses(self) -> dict[str, str]:
+        """Get the addresses of the units the consoles are sharded across."""
+        if self.typed_config.ha_mode == "active-standby":
+            return {}
+        addresses = self._peer_addresses()
+        upgrading = self._upgrade_turn()
+        if upgrading in addresses and len(addresses) >= 2:
+            # The other units serve its consoles while it restarts
+            del addresses[upgrading]
+        return addresses
+
+    def _sharded(self, addresses: dict[str, str]) -> bool:
+        """Check whether the consoles are sharded, as other units serve some of them."""
+        return bool(addresses.keys() - {self.unit.name})
+
+    @property
+    def _upgrade_pending(self) -> bool:
+        """Check whether the conserver packages are not at the pinned version."""
+        version = self.typed_config.conserver_version
+        return bool(version) and version != self.conserver.package_version
+
+    def _upgrade_turn(self) -> str:
+        """Get the unit whose turn it is to upgrade the conserver packages."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None:
+            return self.unit.name if self._upgrade_pending else ""
+        return relation.data[self.app].get(TURN_KEY, "")
+
+    def _request_upgrade(self):
+        """Request a turn to upgrade the conserver packages, and grant turns as the leader."""
+        version = self.typed_config.conserver_version if self._upgrade_pending else ""
+        if version and self._stored.staged_version != version:
+            # Downloaded ahead of the turn, so that the unit is down for less time
+            try:
+                self.conserver.stage_upgrade(version, self._local_debs())
+                self._stored.staged_version = version
+            except (apt.PackageError, ChecksumError) as e:
+                logger.warning("Failed to download conserver %s packages: %s", version, e)
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None:
+            return
+        relation.data[self.unit][UPGRADE_KEY] = version
+        if not self.unit.is_leader():
+            return
+        requests = {
+            unit.name: relation.data[unit].get(UPGRADE_KEY, "")
+            for unit in {self.unit, *relation.units}
+        }
+        # The active unit goes last, the leader unless another unit took over
+        active = self._active_override() or self.unit.name
+        turn = next_turn(requests, relation.data[self.app].get(TURN_KEY, ""), active)
+        relation.data[self.app][TURN_KEY] = turn
+        if self.typed_config.ha_mode != "active-standby" or turn != active:
+            return
+        # Fail over to a standby unit first, unless the active unit is alone
+        standby = takeover_unit(requests, active)
+        if standby:
+            relation.data[self.app][ACTIVE_KEY] = standby
+
+    def _upgrade_on_turn(self):
+        """Upgrade the conserver packages to the pinned version, on this unit's turn."""
+        if not self._upgrade_pending or self._upgrade_turn() != self.unit.name:
+            return
+        version = self.typed_config.conserver_version
+        self._drain(version)
+        if self._handing_over():
+            logger.info("Waiting for the other units to take over the consoles to upgrade")
+            return
+        if self._standby:
+            # Failed over to a standby unit, which now serves the consoles
+            self._demote()
+        self.unit.status = ops.MaintenanceStatus(f"Upgrading conserver to {version}")
+        try:
+            self.conserver.upgrade(version, self._local_debs())
+        except (apt.PackageError, ChecksumError) as e:
+            # The turn is kept, stopping the upgrade of the other units
+            logger.error("Failed to upgrade conserver to %s: %s", version, e)
+            self._stored.upgrade_error = f"Failed to upgrade conserver to {version}"
+            return
+        self._stored.upgrade_error = ""
+        # The package may have (re)started the service
+        if self._standby:
+            self.conserver.stop(ignore_errors=True)
+        else:
+            self.conserver.restart(ignore_errors=True)
+            self._stored.startup_time = time.time()
+        self.unit.set_workload_version(self._workload_version())
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is not None:
+            relation.data[self.unit][UPGRADE_KEY] = ""
+            relation.data[self.unit][DRAINING_KEY] = ""
+
+    def _drain(self, version: str):
+        """Publish that this unit drains its consoles to upgrade, telling its clients once."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None or relation.data[self.unit].get(DRAINING_KEY) == version:
+            return
+        relation.data[self.unit][DRAINING_KEY] = version
+        self.conserver.broadcast(f"{self.unit.name} is upgrading conserver, please reconnect")
+
+    def _takeover_units(self) -> list[ops.Unit]:
+        """Get the units taking over the consoles of this unit while it upgrades."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None:
+            return []
+        if self.typed_config.ha_mode == "active-standby":
+            # Standby units have no consoles to hand over, unless this unit
+            # just failed over to one of them
+            active = self._active_override()
+            return [unit for unit in relation.units if unit.name == active]
+        addresses = self._peer_addresses()
+        return [unit for unit in relation.units if unit.name in addresses]
+
+    def _handing_over(self) -> bool:
+        """Check whether this unit holds the turn to upgrade, and waits for others to take over."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None or self._upgrade_turn() != self.unit.name:
+            return False
+        return any(
+            relation.data[unit].get(TAKEOVER_KEY) != self.unit.name
+            for unit in self._takeover_units()
+        )
+
+    def _acknowledge_takeover(self):
+        """Acknowledge that this unit serves the consoles of the unit draining to upgrade."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None:
+            return
+        turn = self._upgrade_turn()
+        draining = any(
+            unit.name == turn and relation.data[unit].get(DRAINING_KEY) for unit in relation.units
+        )
+        # In active-standby mode, only the active unit takes over, and in
+        # sharded mode the deployed conserver.cf no longer includes the turn
+        serving = (
+            draining
+            and not self._standby
+            and not self._stored.config_error
+            and self.conserver.running
+        )
+        relation.data[self.unit][TAKEOVER_KEY] = turn if serving else ""
+
+    def _peer_addresses(self) -> dict[str, str]:
+        """Get the addresses of all units in the peer relation, including this one."""
+        relation = self.model.get_relation(PEER_RELATION)
+        if relation is None:
+            return {}
+        addresses = {}
+        for unit in {self.unit, *relation.units}:
+            address = relation.data[unit].get("address")
+            if address:
+                addresses[unit.name] = address
+        return addresses
+
+    def _resource_path(self, name: str) -> Path | None:
+        """Get the path of an attached resource, if it is not empty."""
+        try:
+            path = self.model.resources.fetch(name)
+        except (NameError, ops.ModelError):
+            return None
+        return path if path.stat().st_size else None
+
+    def _local_debs(self) -> dict[str, LocalDeb]:
+        """Get the package files of the packages resource, extracted once per attachment."""
+        path = self._resource_path("packages")
+        if path is None:
+            return {}
+        stat = path.stat()
+        checksum = self.typed_config.packages_sha256
+        attachment = f"{stat.st_size}:{stat.st_mtime_ns}:{checksum}"
+        directory = Path(DEBS_DIR)
+        if attachment != self._stored.packages_attachment or not directory.is_dir():
+            try:
+                extract_debs(path, directory, checksum)
+            except ChecksumError as e:
+                raise ChecksumError(f"Invalid packages: {e}") from e
+            self._stored.packages_attachment = attachment
+        return read_debs(directory)
+
+    def _read_file(self, name: str, contents: str, checksum: str) -> str:
+        """Get the contents of a file, from its resource if attached or else from config."""
+        path = self._resource_path(name)
+        if path is None:
+            digest = file_digest(contents)
+        else:
+            # Only the compressed resource is streamed: the file is then read
+            # whole, as it is rendered, parsed and sharded as a string
+            with tempfile.TemporaryDirectory() as tmp:
+                dest = Path(tmp, name)
+                digest = decompress_file(path, dest)
+                contents = dest.read_text(encoding="utf-8")
+        try:
+            verify_checksum(digest, checksum)
+        except ChecksumError as e:
+            raise ChecksumError(f"Invalid {name}: {e}") from e
+        return contents
+
+    def _try_load_files(self) -> tuple[str, str] | None:
+        """Get the files to deploy, or block the unit if they cannot be loaded."""
+        try:
+            files = self._load_files()
+        except ChecksumError as e:
+            logger.error("Failed to verify configuration files: %s", e)
+            self._block_deploy(str(e))
+        except InventoryError as e:
+            logger.error("Failed to load inventory: %s", e)
+            self._block_deploy("Invalid inventory in config")
+        except PasswdError as e:
+            logger.error("Failed to load users: %s", e)
+            self._block_deploy(f"Invalid users-secret: {e}")
+        else:
+            self._stored.deploy_error = ""
+            return files
+        return None
+
+    def _block_deploy(self, message: str):
+        """Block the unit until the configuration files can be deployed again."""
+        # Kept until the next hook loading the files, so that update-status
+        # does not report the unit as active with the files not deployed
+        self._stored.deploy_error = message
+        self.unit.status = ops.BlockedStatus(message)
+
+    def _load_files(self) -> tuple[str, str]:
+        """Get the contents of the conserver.cf and conserver.passwd files to deploy."""
+        config_file = self._read_file(
+            "config-file", self.typed_config.config_file, self.typed_config.config_file_sha256
+        )
+        passwd_file = self._read_file(
+            "passwd-file", self.typed_config.passwd_file, self.typed_config.passwd_file_sha256
+        )
+        if self.typed_config.users_secret:
+            passwd_file = self._render_users(passwd_file)
+        inventory = load_inventory(self.typed_config.inventory or "{}")
+        blocks = itertools.chain(
+            render_inventory(inventory),
+            render_consoles(
+                self._registered_consoles(inventory), include_defaults=bool(inventory.defaults)
+            ),
+        )
+        first = next(blocks, None)
+        if first is None:
+            return config_file, passwd_file
+        # Written block by block, so that only the rendered file is held in memory
+        rendered = io.StringIO()
+        rendered.write(config_file)
+        if config_file and not config_file.endswith("\n"):
+            rendered.write("\n")
+        rendered.write(first)
+        rendered.writelines(blocks)
+        return rendered.getvalue(), passwd_file
+
+    def _render_users(self, passwd_file: str) -> str:
+        """Add the users of users-secret to the conserver.passwd file, hashing new passwords."""
+        try:
+            secret = self.model.get_secret(id=self.typed_config.users_secret)
+            content = secret.get_content(refresh=True)
+        except (ops.SecretNotFoundError, ops.ModelError) as e:
+            raise PasswdError(f"cannot read secret: {e}") from e
+        users = parse_users(content.get(USERS_KEY, ""))
+        cache_path = Path(PASSWD_CACHE)
+        cache = HashCache.load(cache_path)
+        entries = dict(cache.entries)
+        hashes = cache.hash_users(users)
+        if cache.entries != entries:
+            try:
+                cache.save(cache_path)
+            except OSError as e:
+                logger.warning("Failed to save the password hashes: %s", e)
+        return render_passwd(hashes, passwd_file)
+
+    def _registered_consoles(self, inventory: Inventory) -> dict[str, InventoryConsole]:
+        """Get the consoles registered by other charms, with their credentials.
+
+        Consoles already in the inventory, or in groups it does not define, are ignored.
+        """
+        consoles = merge_registrations(
+            (unit.name, relation.data[unit][CONSOLES_KEY])
+            for relation in self.model.relations[REGISTRY_RELATION]
+            for unit in relation.units
+            if relation.data[unit].get(CONSOLES_KEY)
+        )
+        for name, console in list(consoles.items()):
+            if name in inventory.consoles or (
+                console.group and console.group not in inventory.groups
+            ):
+                logger.warning(
+                    "Ignoring registered console %s, in conflict with the inventory", name
+                )
+                del consoles[name]
+                continue
+            extra = console.model_extra or {}
+            secret_id = extra.pop(CREDENTIALS_KEY, None)
+            if not secret_id:
+                continue
+            try:
+                content = self.model.get_secret(id=str(secret_id)).get_content(refresh=True)
+            except (ops.SecretNotFoundError, ops.ModelError) as e:
+                logger.warning("Ignoring console %s, cannot read its credentials: %s", name, e)
+                del consoles[name]
+                continue
+            extra.update((key, content[key]) for key in ("username", "password") if key in content)
+        return consoles
+
+    def _render_config(self, contents: str) -> str:
+        """Render the conserver.cf file for this unit."""
+        if self.typed_config.startup_delay:
+            # Prepended so that a config block of the file can override it
+            delay = Block("config", "*", (("initdelay", str(self.typed_config.startup_delay)),))
+            contents = delay.render() + contents
+        addresses = self._shard_addresses()
+        parked = list(self._stored.parked) if self.typed_config.bmc_probe else []
+        if not self._sharded(addresses) and not parked:
+            return contents
+        try:
+            model = parse_config(contents)
+        except ConfigParseError as e:
+            logger.warning(
+                "Failed to parse conserver.cf, not sharding nor parking consoles: %s", e
+            )
+            return contents
+        if self._sharded(addresses):
+            model = shard_consoles(model, addresses)
+        if parked:
+            model = park_consoles(model, parked)
+        return model.render()
+
+    def _log_paths(self, contents: str) -> list[str]:
+        """Get the globs matching the console logs of a conserver.cf file."""
+        try:
+            return log_paths(parse_config(contents), CONSERVER_LOG_DIR)
+        except ConfigParseError as e:
+            logger.warning("Failed to find console logs, rotating default paths: %s", e)
+            return [f"{CONSERVER_LOG_DIR}/*.log"]
+
+    def _configure_log_rotation(self):
+        """Rotate the console logs with the configured limits."""
+        # Paths are only looked up when conserver.cf changes, parsing it is
+        # the slowest part of a hook with tens of thousands of consoles
+        paths = list(self._stored.log_paths) or [f"{CONSERVER_LOG_DIR}/*.log"]
+        self.conserver.configure_log_rotation(
+            self.typed_config.log_rotation.render(paths, self.conserver.services)
+        )
+
+    def _config_action(self, old: str, new: str) -> tuple[Action, ConserverCf | None]:
+        """Get the action needed to apply a conserver.cf change, and the new parsed file."""
+        try:
+            new_model = parse_config(new)
+            changes = diff_configs(parse_config(old), new_model)
+        except ConfigParseError as e:
+            logger.warning("Failed to compare conserver.cf changes, reloading: %s", e)
+            return Action.RELOAD, None
+        logger.info("conserver.cf changes: %s", changes.summary())
+        if changes.consoles_changed:
+            self.unit.status = ops.MaintenanceStatus(f"Applying {changes.summary()}")
+        return changes.action, new_model
+
+    def _startup_status(self) -> ops.MaintenanceStatus | None:
+        """Get the status of a running conserver while its consoles are starting up."""
+        delay = self.typed_config.startup_delay
+        if not delay:
+            return None
+        states = self.conserver.console_states()
+        up = sum(states.values())
+        # Consoles that are still down once they all had time to start have failed
+        # to connect, e.g. to an unreachable BMC, and are not reported as starting
+        ramp_end = self._stored.startup_time + delay * len(states) + STARTUP_GRACE
+        if up < len(states) and time.time() < ramp_end:
+            return ops.MaintenanceStatus(f"Starting consoles: {up}/{len(states)} up")
+        return None
+
+    def _active_status(self) -> ops.ActiveStatus:
+        """Get the status of a running conserver, reporting parked consoles and low headroom."""
+        messages = []
+        parked = len(self._stored.parked) if self.typed_config.bmc_probe else 0
+        if parked:
+            messages.append(f"{parked} consoles parked, BMC unreachable")
+        if self._stored.low_headroom:
+            messages.append(self._stored.low_headroom)
+        return ops.ActiveStatus(", ".join(messages))
+
+    def _upgrade_status(self) -> ops.StatusBase:
+        """Get the status of a unit waiting to upgrade the conserver packages."""
+        if self._stored.upgrade_error:
+            return ops.BlockedStatus(self._stored.upgrade_error)
+        version = self.typed_config.conserver_version
+        if self._handing_over():
+            return ops.MaintenanceStatus(
+                f"Waiting for the other units to take over the consoles to upgrade to {version}"
+            )
+        return ops.MaintenanceStatus(f"Waiting to upgrade conserver to {version}")
+
     def set_status(self):
         """Calculate and set the unit status."""
-        if not self.typed_config.config_file:
+        if not (
+            self.typed_config.config_file
+            or self.typed_config.inventory
+            or self._resource_path("config-file")
+        ):
             self.unit.status = ops.BlockedStatus("Missing config-file in config")
             return
-        if not self.typed_config.passwd_file:
+        if not (
+            self.typed_config.passwd_file
+            or self.typed_config.users_secret
+            or self._resource_path("passwd-file")
+        ):
             self.unit.status = ops.BlockedStatus("Missing passwd-file in config")
             return
+        if self._stored.deploy_error or self._stored.config_error:
+            self.unit.status = ops.BlockedStatus(
+                self._stored.deploy_error or self._stored.config_error
+            )
+            return
+        if self._stored.failover_error:
+            self.unit.status = ops.BlockedStatus(self._stored.failover_error)
+            return
+        if self._stored.arping_error:
+            self.unit.status = ops.BlockedStatus(self._stored.arping_error)
+            return
+        if self._upgrade_pending:
+            self.unit.status = self._upgrade_status()
+            return
+        if self._standby:
+            self.unit.status = ops.ActiveStatus("Standby")
+            return
 
         if self.conserver.running:
-            self.unit.status = ops.ActiveStatus()
+            self.unit.status = self._startup_status() or self._active_status()
         elif self.conserver.failed:
             self.unit.status = ops.BlockedStatus("Conserver service has failed")
         else:
@@ -2,17 +2,93 @@
 # See LICENSE file for licensing details.
 """Charm configuration."""
 
-from pydantic import Base64Str, BaseModel
+import base64
+import binascii
+import ipaddress
+import subprocess
+import zlib
+from typing import Literal
+
+from pydantic import BaseModel, Field, field_validator
+
+from logrotate import LogRotation, parse_size
+from payload import decompress
+from tracing import set_attributes, tracer
 
 PASSWD_FILE = """\
 # Conserver passwd file
-# Format: username:$1$Y0ZjMm2h$oMX5UyLi1/y0Q9IRWf3v/0
-# you can generate the hashed password using `openssl passwd -1`
+# Format: username:$6$salt$hash
+# you can generate the hashed password using `openssl passwd -6`
 """
 
 
 class ConserverConfig(BaseModel):
     """Conserver Charm configuration."""
 
-    config_file: Base64Str = ""
-    passwd_file: Base64Str = PASSWD_FILE
+    config_file: str = ""
+    passwd_file: str = PASSWD_FILE
+    config_file_sha256: str = ""
+    passwd_file_sha256: str = ""
+    packages_sha256: str = ""
+    users_secret: str = ""
+    inventory: str = ""
+    instances: int = Field(default=1, ge=1)
+    ha_mode: Literal["sharded", "active-standby"] = "sharded"
+    virtual_ip: str = ""
+    tracing_endpoint: str = ""
+    conserver_version: str = ""
+    port: int = Field(default=3109, ge=1, le=65535)
+    base_port: int = Field(default=33000, ge=1024, le=65535)
+    metrics_port: int = Field(default=9469, ge=1, le=65535)
+    startup_delay: int = Field(default=0, ge=0)
+    registration_delay: int = Field(default=60, ge=0)
+    capacity_headroom: int = Field(default=20, ge=0, le=100)
+    bmc_probe: bool = False
+    bmc_probe_concurrency: int = Field(default=128, ge=1)
+    log_rotate_size: int = Field(default=100 * 1024**2, gt=0)
+    log_rotate_interval: Literal["daily", "weekly", "monthly"] = "weekly"
+    log_console_quota: int = Field(default=1024**3, gt=0)
+    log_retention_days: int = Field(default=90, ge=0)
+
+    @field_validator("config_file", "passwd_file", mode="before")
+    @classmethod
+    def decode_file(cls, value: str) -> str:
+        """Decode Base64 encoded, and optionally gzip or zstd compressed, file contents."""
+        try:
+            with tracer.start_as_current_span("ConserverConfig.decode_file"):
+                set_attributes(encoded_size=len(value))
+                return decompress(base64.b64decode(value)).decode("utf-8")
+        except (binascii.Error, EOFError, OSError, zlib.error) as e:
+            raise ValueError(f"Invalid Base64 encoded file: {e}") from e
+        except subprocess.CalledProcessError as e:
+            raise ValueError(f"Invalid zstd compressed file: {e}") from e
+
+    @field_validator("users_secret", mode="before")
+    @classmethod
+    def secret_id(cls, value: object) -> object:
+        """Get the ID of secret options, which are loaded as secrets."""
+        return getattr(value, "id", None) or value
+
+    @field_validator("virtual_ip")
+    @classmethod
+    def check_virtual_ip(cls, value: str) -> str:
+        """Check that the floating address is an IP address."""
+        if value:
+            ipaddress.ip_address(value)
+        return value
+
+    @field_validator("log_rotate_size", "log_console_quota", mode="before")
+    @classmethod
+    def decode_size(cls, value: str | int) -> int:
+        """Parse sizes such as `100M` into bytes."""
+        return value if isinstance(value, int) else parse_size(value)
+
+    @property
+    def log_rotation(self) -> LogRotation:
+        """Get the rotation settings for the console logs."""
+        return LogRotation(
+            max_size=self.log_rotate_size,
+            console_quota=self.log_console_quota,
+            interval=self.log_rotate_interval,
+            retention_days=self.log_retention_days,
+        )
@@ -1,36 +1,299 @@
 """Functions for managing and interacting with conserver."""
 
+import functools
+import hashlib
 import logging
 import os
 import pwd
 import re
+import shutil
 import subprocess
+import tempfile
+import time
+from collections.abc import Mapping
 from pathlib import Path
 
 from charmlibs import apt, systemd
 
+from conserver_cf import ConfigParseError, ConserverCf, parse_config
+from debs import LocalDeb, apt_install, install_debs
+from exporter import CONSOLE_TIMEOUT, parse_console_users
+from fragments import expand_includes, has_includes, render_includes, split_config
+from metrics import METRICS_DIR, TEXTFILE, timed
+from sharding import partition_consoles
+from tracing import set_attributes, traced
+from tuning import ResourcePlan
+
 logger = logging.getLogger(__name__)
 
 CONSERVER_DEB = "conserver-server"
+CONSERVER_CLIENT_DEB = "conserver-client"
 IPMITOOL_DEB = "ipmitool"
+ZSTD_DEB = "zstd"
+LOGROTATE_DEB = "logrotate"
+ARPING_DEB = "iputils-arping"
+# Packages pinned to the conserver-version config option, and held at it
+CONSERVER_DEBS = (CONSERVER_DEB, CONSERVER_CLIENT_DEB)
 CONSERVER_SERVICE = "conserver-server"
+CONSERVER_INSTANCE_SERVICE = "conserver"
 CONSERVER_USER = "conservr"
+CONSERVER_BIN = "/usr/sbin/conserver"
+CONSERVER_LOG_DIR = "/var/log/conserver"
+EXPORTER_SERVICE = "conserver-exporter"
+LOGROTATE_SERVICE = "conserver-logrotate"
 
 SERVER_CONF = "/etc/conserver/server.conf"
 CONSERVER_CF = "/etc/conserver/conserver.cf"
 CONSERVER_PASSWD = "/etc/conserver/conserver.passwd"
+INSTANCE_SERVER_CONF = "/etc/conserver/server-{instance}.conf"
+INSTANCE_CONSERVER_CF = "/etc/conserver/conserver-{instance}.cf"
+# Fragments of each conserver.cf file are in a directory named after it
+CONF_D = "/etc/conserver/conf.d"
+INSTANCE_UNIT_FILE = f"/etc/systemd/system/{CONSERVER_INSTANCE_SERVICE}@.service"
+EXPORTER_UNIT_FILE = f"/etc/systemd/system/{EXPORTER_SERVICE}.service"
+LOGROTATE_CONF = "/etc/conserver/logrotate.conf"
+LOGROTATE_STATE = "/var/lib/logrotate/conserver.status"
+LOGROTATE_UNIT_FILE = f"/etc/systemd/system/{LOGROTATE_SERVICE}.service"
+LOGROTATE_TIMER_FILE = f"/etc/systemd/system/{LOGROTATE_SERVICE}.timer"
+# Rotation configuration shipped by the conserver-server package, superseded
+# by the charm so that logs are not rotated twice
+PACKAGE_LOGROTATE_CONF = "/etc/logrotate.d/conserver-server"
+LIMITS_DROPIN = "/etc/systemd/system/{unit}.d/50-charm-limits.conf"
+SYSCTL_CONF = "/etc/sysctl.d/60-conserver-charm.conf"
+
+# conserver.cf files may hold the BMC credentials of registered consoles, so
+# they are only readable by root and the conserver group
+CONFIG_MODE = 0o640
+
+# Seconds to watch the services after a reload or restart, at most, for
+# conserver to either answer or fail with its new configuration, and between
+# two looks at their state
+SETTLE_WINDOW = 5.0
+SETTLE_INTERVAL = 0.5
+
+# Default port for incoming connections at 3109
+# and base port for established connections at 33000
+PRIMARY_PORT = 3109
+BASE_PORT = 33000
+SERVER_CONFIG = "OPTS='-p {primary_port} -b {base_port}  '\nASROOT=\n"
+
+# Each extra conserver instance listens on the next primary port and gets its
+# own range of ports for established connections
+INSTANCE_PORT_RANGE = 1000
+INSTANCE_SERVER_CONFIG = "OPTS='-p {primary_port} -b {base_port} -C {config} -P {passwd}'\n"
+INSTANCE_UNIT = f"""\
+[Unit]
+Description=Conserver serial console server instance %i
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+EnvironmentFile={INSTANCE_SERVER_CONF.format(instance="%i")}
+ExecStart=/usr/sbin/conserver $OPTS
+ExecReload=/bin/kill -HUP $MAINPID
+User={CONSERVER_USER}
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+# The exporter runs as root to read the open file descriptors of conserver
+EXPORTER_UNIT = f"""\
+[Unit]
+Description=Prometheus exporter for conserver
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+ExecStart=/usr/bin/python3 {{script}} --listen-port {{port}} {{conserver_ports}} \\
+    --log-dir {CONSERVER_LOG_DIR} --textfile {TEXTFILE}
+ProtectSystem=strict
+ProtectHome=yes
+NoNewPrivileges=yes
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+# Run at the lowest CPU and IO priority so compressing logs does not slow down conserver
+LOGROTATE_UNIT = f"""\
+[Unit]
+Description=Rotate and compress conserver console logs
+
+[Service]
+Type=oneshot
+ExecStart=/usr/sbin/logrotate --state {LOGROTATE_STATE} {LOGROTATE_CONF}
+Nice=19
+IOSchedulingClass=idle
+"""
+
+# Logs are checked hourly so that size based rotation is not delayed by a day
+LOGROTATE_TIMER = """\
+[Unit]
+Description=Rotate and compress conserver console logs hourly
+
+[Timer]
+OnCalendar=hourly
+RandomizedDelaySec=5m
+Persistent=true
+
+[Install]
+WantedBy=timers.target
+"""
+
+
+class ConfigValidationError(Exception):
+    """Raised when conserver rejects a configuration file."""
+
+
+def _stage_file(path: Path, contents: str, uid: int, mode: int, gid: int = 0) -> Path:
+    """Write contents to a temporary file next to the given path, flushed to disk."""
+    fd, staged = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(contents)
+            f.flush()
+            os.fchown(f.fileno(), uid, gid)
+            os.fchmod(f.fileno(), mode)
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(staged)
+        raise
+    return Path(staged)
+
+
+def _restrict(path: Path, gid: int) -> None:
+    """Make a deployed conserver.cf file only readable by root and the conserver group."""
+    stat = path.stat()
+    if stat.st_mode & 0o777 != CONFIG_MODE or stat.st_uid != 0 or stat.st_gid != gid:
+        os.chown(path, 0, gid)
+        os.chmod(path, CONFIG_MODE)
+
+
+def _fsync_dir(path: Path) -> None:
+    """Flush a directory to disk, making renames in it durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _copy_file(src: Path, dest: Path) -> None:
+    """Atomically replace a file with a hard link to another one."""
+    link = dest.with_name(f".{dest.name}.link")
+    link.unlink(missing_ok=True)
+    os.link(src, link)
+    os.replace(link, dest)
+
+
+def _last_good(path: Path) -> Path:
+    """Get the path of the copy of the previously deployed version of a file."""
+    return path.with_name(f"{path.name}.last-good")
+
+
+def _fragment_dir(path: Path) -> Path:
+    """Get the directory of the fragments of a conserver.cf file."""
+    return Path(CONF_D, path.stem)
 
-# Keep default port for incoming connections at 3109
-# and set base port for established connections at 33000
-SERVER_CONFIG = "OPTS='-p 3109 -b 33000  '\nASROOT=\n"
 
+def _fragment_files(directory: Path) -> set[str]:
+    """Get the names of the fragments in a directory, without staged files."""
+    if not directory.is_dir():
+        return set()
+    return {path.name for path in directory.iterdir() if not path.name.startswith(".")}
 
+
+def _sync_dir(src: Path, dest: Path) -> None:
+    """Make a directory hold hard links to the fragments of another one, and nothing else."""
+    names = _fragment_files(src)
+    if not names and not dest.is_dir():
+        return
+    dest.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        _copy_file(src / name, dest / name)
+    for name in _fragment_files(dest) - names:
+        (dest / name).unlink()
+
+
+def _read_text(path: Path) -> str | None:
+    """Read a file, or get None if it is missing."""
+    try:
+        return path.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+
+def _conserver_debs(version: str, local: Mapping[str, LocalDeb]) -> list[LocalDeb]:
+    """Get the attached conserver package files, if they are all at the version, or any."""
+    debs = [local[name] for name in CONSERVER_DEBS if name in local]
+    if len(debs) < len(CONSERVER_DEBS) or any(version not in ("", deb.version) for deb in debs):
+        return []
+    return debs
+
+
+def file_digest(contents: str) -> str:
+    """Get the SHA-256 digest of the contents of a file."""
+    return hashlib.sha256(contents.encode("utf-8")).hexdigest()
+
+
+@traced
 class Conserver:
-    """Represents the conserver application/workload."""
+    """Represents the conserver application/workload.
+
+    With more than one instance, the consoles are partitioned across several
+    conserver processes run as `conserver@<n>` systemd template instances.
+    """
+
+    def __init__(self, instances: int = 1, port: int = PRIMARY_PORT, base_port: int = BASE_PORT):
+        self.instances = instances
+        self.port = port
+        self.base_port = base_port
+
+    # Package metadata is only looked up in the hooks that (un)install packages
+    @functools.cached_property
+    def conserver_deb(self) -> apt.DebianPackage:
+        """Get the conserver-server package."""
+        return apt.DebianPackage.from_system(CONSERVER_DEB)
+
+    @functools.cached_property
+    def conserver_client_deb(self) -> apt.DebianPackage:
+        """Get the conserver-client package."""
+        return apt.DebianPackage.from_system(CONSERVER_CLIENT_DEB)
+
+    @functools.cached_property
+    def logrotate_deb(self) -> apt.DebianPackage:
+        """Get the logrotate package."""
+        return apt.DebianPackage.from_system(LOGROTATE_DEB)
 
-    def __init__(self):
-        self.conserver_deb = apt.DebianPackage.from_system(CONSERVER_DEB)
-        self.ipmitool_deb = apt.DebianPackage.from_system(IPMITOOL_DEB)
+    @functools.cached_property
+    def arping_deb(self) -> apt.DebianPackage:
+        """Get the iputils-arping package."""
+        return apt.DebianPackage.from_system(ARPING_DEB)
+
+    @functools.cached_property
+    def ipmitool_deb(self) -> apt.DebianPackage:
+        """Get the ipmitool package."""
+        return apt.DebianPackage.from_system(IPMITOOL_DEB)
+
+    @functools.cached_property
+    def zstd_deb(self) -> apt.DebianPackage:
+        """Get the zstd package."""
+        return apt.DebianPackage.from_system(ZSTD_DEB)
+
+    @property
+    def services(self) -> list[str]:
+        """Get the systemd services running conserver."""
+        if self.instances == 1:
+            return [CONSERVER_SERVICE]
+        return [f"{CONSERVER_INSTANCE_SERVICE}@{i}" for i in range(self.instances)]
+
+    @property
+    def ports(self) -> list[int]:
+        """Get the ports conserver listens on for client connections."""
+        return [self.port + i for i in range(self.instances)]
 
     @property
     def version(self) -> str:
@@ -41,88 +304,559 @@ class Conserver:
             return match.group(1)
         return "unknown"
 
+    @property
+    def package_version(self) -> str:
+        """Get the installed version of the conserver-server package, empty if not installed.
+
+        The version has the `[epoch:]upstream-revision` form of `apt-cache
+        policy`, which is also how conserver-version is set, without the
+        architecture of `DebianPackage.fullversion`.
+        """
+        try:
+            return str(apt.DebianPackage.from_installed_package(CONSERVER_DEB).version)
+        except apt.PackageNotFoundError:
+            return ""
+
+    @property
+    def binary_id(self) -> str:
+        """Get an identifier of the installed conserver binary, which changes with the package."""
+        try:
+            stat = os.stat(CONSERVER_BIN)
+        except OSError:
+            return ""
+        return f"{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
     @property
     def uid(self) -> int:
         """Get the conserver user identifier."""
         return pwd.getpwnam(CONSERVER_USER).pw_uid
 
+    @property
+    def gid(self) -> int:
+        """Get the conserver group identifier."""
+        return pwd.getpwnam(CONSERVER_USER).pw_gid
+
+    @functools.cached_property
+    def _active_states(self) -> dict[str, str]:
+        """Get the active state of each conserver service, with a single systemctl call."""
+        try:
+            stdout = subprocess.check_output(
+                ["systemctl", "show", "--property=ActiveState", "--", *self.services], text=True
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.error("Failed to get the state of %s: %s", ", ".join(self.services), e)
+            return {}
+        # systemctl prints one block of properties per unit, in the requested order
+        states = [block.partition("=")[2].strip() for block in stdout.strip().split("\n\n")]
+        return dict(zip(self.services, states))
+
+    def _invalidate_state(self) -> None:
+        """Forget the cached service state, after acting on the services."""
+        self.__dict__.pop("_active_states", None)
+
     @property
     def running(self) -> bool:
-        """Check if the conserver service is running."""
-        return systemd.service_running(CONSERVER_SERVICE)
+        """Check if all the conserver services are running."""
+        states = self._active_states
+        return all(states.get(service) == "active" for service in self.services)
 
     @property
     def failed(self) -> bool:
-        """Check if the conserver service has failed."""
-        return systemd.service_failed(CONSERVER_SERVICE)
+        """Check if any of the conserver services has failed."""
+        return "failed" in self._active_states.values()
+
+    def settle(self, window: float = SETTLE_WINDOW) -> None:
+        """Watch the services after a reload or restart, until they are up or one failed.
+
+        conserver may only exit a moment after loading a configuration it
+        cannot use, so `failed` is only meaningful once it had time to. It is
+        up once every service is active and its conserver answers clients,
+        which it does after handling the reload. The whole window is only
+        waited for when it is not.
+        """
+        deadline = time.monotonic() + window
+        while not self.failed:
+            if self.running and self._answering():
+                return
+            if time.monotonic() >= deadline:
+                logger.warning("conserver did not answer within %s seconds", window)
+                return
+            time.sleep(SETTLE_INTERVAL)
+            self._invalidate_state()
+
+    def _answering(self) -> bool:
+        """Check whether every conserver process answers clients on its port."""
+        for port in self.ports:
+            try:
+                subprocess.run(
+                    ["console", "-M", "127.0.0.1", "-p", str(port), "-u"],
+                    check=True,
+                    capture_output=True,
+                    timeout=CONSOLE_TIMEOUT,
+                )
+            except (OSError, subprocess.SubprocessError):
+                return False
+        return True
+
+    def console_states(self) -> dict[str, bool]:
+        """Get whether each console is up, from all the conserver processes."""
+        return {name: up for name, (_, up, _) in self.console_users().items()}
 
-    def install(self) -> None:
-        """Install conserver."""
-        self.conserver_deb.ensure(apt.PackageState.Latest)
-        self.ipmitool_deb.ensure(apt.PackageState.Latest)
+    def console_users(self) -> dict[str, tuple[int, bool, int]]:
+        """Get the port of the conserver process serving each console, its state and clients."""
+        consoles = {}
+        for port in self.ports:
+            try:
+                output = subprocess.check_output(
+                    ["console", "-M", "127.0.0.1", "-p", str(port), "-u"],
+                    text=True,
+                    stderr=subprocess.DEVNULL,
+                    timeout=CONSOLE_TIMEOUT,
+                )
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.warning("Failed to get the state of the consoles on port %d: %s", port, e)
+                continue
+            consoles.update(
+                (name, (port, up, clients))
+                for name, (up, clients) in parse_console_users(output).items()
+            )
+        return consoles
+
+    def install_dependencies(self, local: Mapping[str, LocalDeb] | None = None) -> None:
+        """Install the packages the charm uses besides conserver, from the attached ones if any."""
+        # Attached packages go first, so that apt finds them installed instead
+        # of downloading them
+        install_debs(deb for deb in (local or {}).values() if deb.name not in CONSERVER_DEBS)
+        # Used to decompress zstd compressed configuration files, not removed
+        # on uninstall as it is usually part of the base system
+        self.zstd_deb.ensure(apt.PackageState.Present)
+        self.logrotate_deb.ensure(apt.PackageState.Present)
+        self.ipmitool_deb.ensure(apt.PackageState.Present)
+
+    @property
+    def arping_installed(self) -> bool:
+        """Check whether arping is installed."""
+        return shutil.which("arping") is not None
+
+    def install_arping(self, local: Mapping[str, LocalDeb] | None = None) -> None:
+        """Install arping, used to announce the floating address in active-standby mode."""
+        local = local or {}
+        if ARPING_DEB in local:
+            install_debs([local[ARPING_DEB]])
+        else:
+            self.arping_deb.ensure(apt.PackageState.Present)
+
+    def install(self, version: str = "", local: Mapping[str, LocalDeb] | None = None) -> None:
+        """Install conserver, at the given package version or else the latest one.
+
+        Args:
+            version: version of the conserver packages, the latest one if empty.
+            local: attached package files by name, installed instead of the
+                packages of the apt mirror when at the version.
+        """
+        self.install_dependencies(local)
+        debs = _conserver_debs(version, local or {})
+        if debs:
+            install_debs(debs)
+        elif version:
+            if self.package_version != version:
+                self._apt_install(version)
+        else:
+            self.conserver_deb.ensure(apt.PackageState.Present)
+            self.conserver_client_deb.ensure(apt.PackageState.Present)
+        # Upgrading conserver-server restarts conserver, dropping every console
+        # session, so it is only upgraded through conserver-version
+        self.hold_packages(True)
         self.write_server_config()
 
+    def stage_upgrade(self, version: str, local: Mapping[str, LocalDeb] | None = None) -> None:
+        """Download the conserver packages of a version, ahead of upgrading to it."""
+        if _conserver_debs(version, local or {}):
+            # Already on disk
+            return
+        self._apt_install(version, "--download-only")
+        logger.info("Downloaded conserver %s packages", version)
+
+    def upgrade(self, version: str, local: Mapping[str, LocalDeb] | None = None) -> None:
+        """Upgrade, or downgrade, the conserver packages to a version."""
+        self._invalidate_state()
+        debs = _conserver_debs(version, local or {})
+        if debs:
+            install_debs(debs)
+        else:
+            self._apt_install(version, "--allow-downgrades")
+        logger.info("Upgraded conserver packages to %s", version)
+
+    @staticmethod
+    def _apt_install(version: str, *options: str) -> None:
+        """Install the conserver packages at a version from the apt mirror."""
+        apt_install([f"{deb}={version}" for deb in CONSERVER_DEBS], *options)
+
+    @staticmethod
+    def hold_packages(hold: bool) -> None:
+        """Hold the conserver packages at their version, or release them."""
+        try:
+            subprocess.run(
+                ["apt-mark", "hold" if hold else "unhold", *CONSERVER_DEBS],
+                check=True,
+                capture_output=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning("Failed to %s conserver packages: %s", "hold" if hold else "unhold", e)
+
+    def broadcast(self, message: str) -> None:
+        """Send a message to the clients connected to all the conserver processes."""
+        for port in self.ports:
+            try:
+                subprocess.run(
+                    ["console", "-M", "127.0.0.1", "-p", str(port), "-b", message],
+                    check=True,
+                    stdin=subprocess.DEVNULL,
+                    capture_output=True,
+                    timeout=CONSOLE_TIMEOUT,
+                )
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.warning("Failed to message the clients on port %d: %s", port, e)
+
     def uninstall(self) -> None:
         """Uninstall conserver."""
+        self.hold_packages(False)
         self.conserver_deb.ensure(apt.PackageState.Absent)
+        self.conserver_client_deb.ensure(apt.PackageState.Absent)
         self.ipmitool_deb.ensure(apt.PackageState.Absent)
+        Path(INSTANCE_UNIT_FILE).unlink(missing_ok=True)
+        for unit in (CONSERVER_SERVICE, f"{CONSERVER_INSTANCE_SERVICE}@"):
+            Path(LIMITS_DROPIN.format(unit=f"{unit}.service")).unlink(missing_ok=True)
+        Path(SYSCTL_CONF).unlink(missing_ok=True)
+
+    def configure_exporter(self, port: int, script: Path) -> None:
+        """Install the Prometheus exporter service, restarting it if its configuration changed."""
+        unit = EXPORTER_UNIT.format(
+            script=script,
+            port=port,
+            conserver_ports=" ".join(f"--conserver-port {p}" for p in self.ports),
+        )
+        path = Path(EXPORTER_UNIT_FILE)
+        try:
+            Path(METRICS_DIR).mkdir(parents=True, exist_ok=True)
+            if path.exists() and path.read_text(encoding="utf-8") == unit:
+                return
+            path.write_text(unit, encoding="utf-8")
+            systemd.daemon_reload()
+            systemd.service_enable(EXPORTER_SERVICE)
+            systemd.service_restart(EXPORTER_SERVICE)
+            logger.info("Started %s service on port %d", EXPORTER_SERVICE, port)
+        except (OSError, systemd.SystemdError) as e:
+            logger.error("Failed to configure %s service: %s", EXPORTER_SERVICE, e)
+            raise
+
+    def remove_exporter(self) -> None:
+        """Stop and remove the Prometheus exporter service."""
+        try:
+            systemd.service_disable("--now", EXPORTER_SERVICE)
+        except systemd.SystemdError as e:
+            logger.warning("Failed to stop %s service: %s", EXPORTER_SERVICE, e)
+        Path(EXPORTER_UNIT_FILE).unlink(missing_ok=True)
+
+    def configure_log_rotation(self, contents: str) -> None:
+        """Install the logrotate configuration and the timer running it for the console logs."""
+        path = Path(LOGROTATE_CONF)
+        try:
+            if path.exists() and path.read_text(encoding="utf-8") == contents:
+                return
+            path.write_text(contents, encoding="utf-8")
+            package_conf = Path(PACKAGE_LOGROTATE_CONF)
+            if package_conf.exists():
+                package_conf.write_text(f"# Console logs are rotated by {LOGROTATE_CONF}\n")
+            Path(LOGROTATE_UNIT_FILE).write_text(LOGROTATE_UNIT, encoding="utf-8")
+            Path(LOGROTATE_TIMER_FILE).write_text(LOGROTATE_TIMER, encoding="utf-8")
+            systemd.daemon_reload()
+            systemd.service_enable("--now", f"{LOGROTATE_SERVICE}.timer")
+            logger.info("Updated console log rotation")
+        except (OSError, systemd.SystemdError) as e:
+            logger.error("Failed to configure console log rotation: %s", e)
+            raise
+
+    def remove_log_rotation(self) -> None:
+        """Stop rotating the console logs."""
+        try:
+            systemd.service_disable("--now", f"{LOGROTATE_SERVICE}.timer")
+        except systemd.SystemdError as e:
+            logger.warning("Failed to stop %s timer: %s", LOGROTATE_SERVICE, e)
+        for path in (LOGROTATE_TIMER_FILE, LOGROTATE_UNIT_FILE, LOGROTATE_CONF):
+            Path(path).unlink(missing_ok=True)
 
     def start(self, ignore_errors: bool = False) -> None:
-        """Start the conserver service."""
+        """Start the conserver services."""
+        self._invalidate_state()
         try:
-            systemd.service_enable("--now", CONSERVER_SERVICE)
-            logger.info("Started %s service", CONSERVER_SERVICE)
+            with timed("operation", "start"):
+                systemd.service_enable("--now", *self.services)
+            logger.info("Started %s services", ", ".join(self.services))
         except systemd.SystemdError as e:
-            logger.error("Failed to start %s service: %s", CONSERVER_SERVICE, e)
+            logger.error("Failed to start %s services: %s", ", ".join(self.services), e)
             if not ignore_errors:
                 raise
 
     def reload(self, restart_on_failure: bool = False, ignore_errors: bool = False) -> None:
-        """Reload the conserver service."""
+        """Reload the conserver services."""
+        self._invalidate_state()
+        for service in self.services:
+            try:
+                with timed("operation", "reload"):
+                    systemd.service_reload(service, restart_on_failure=restart_on_failure)
+                logger.info("Reloaded %s service", service)
+            except systemd.SystemdError as e:
+                logger.error("Failed to reload %s service: %s", service, e)
+                if not ignore_errors:
+                    raise
+
+    def restart(self, ignore_errors: bool = False) -> None:
+        """Restart the conserver services."""
+        self._invalidate_state()
         try:
-            systemd.service_reload(CONSERVER_SERVICE, restart_on_failure=restart_on_failure)
-            logger.info("Reloaded %s service", CONSERVER_SERVICE)
+            with timed("operation", "restart"):
+                systemd.service_restart(*self.services)
+            logger.info("Restarted %s services", ", ".join(self.services))
         except systemd.SystemdError as e:
-            logger.error("Failed to reload %s service: %s", CONSERVER_SERVICE, e)
+            logger.error("Failed to restart %s services: %s", ", ".join(self.services), e)
             if not ignore_errors:
                 raise
 
     def stop(self, ignore_errors: bool = False) -> None:
-        """Stop the conserver service."""
+        """Stop the conserver services."""
+        self._invalidate_state()
         try:
-            systemd.service_disable("--now", CONSERVER_SERVICE)
-            logger.info("Stopped %s service", CONSERVER_SERVICE)
+            systemd.service_disable("--now", *self.services)
+            logger.info("Stopped %s services", ", ".join(self.services))
         except systemd.SystemdError as e:
-            logger.error("Failed to stop %s service: %s", CONSERVER_SERVICE, e)
+            logger.error("Failed to stop %s services: %s", ", ".join(self.services), e)
             if not ignore_errors:
                 raise
 
     def write_server_config(self) -> None:
-        """Write the server.conf file."""
+        """Write the server.conf file, and the instances' files if there are several."""
         try:
-            Path(SERVER_CONF).write_text(SERVER_CONFIG, encoding="utf-8")
+            config = SERVER_CONFIG.format(primary_port=self.port, base_port=self.base_port)
+            Path(SERVER_CONF).write_text(config, encoding="utf-8")
+            if self.instances > 1:
+                self._write_instance_server_configs()
         except (OSError, UnicodeError) as e:
-            logger.error("Failed to write %s: %s", SERVER_CONF, e)
+            logger.error("Failed to write server configuration: %s", e)
+            raise
+
+    def _write_instance_server_configs(self) -> None:
+        """Write the systemd template unit and the server.conf of each instance."""
+        Path(INSTANCE_UNIT_FILE).write_text(INSTANCE_UNIT, encoding="utf-8")
+        for i in range(self.instances):
+            config = INSTANCE_SERVER_CONFIG.format(
+                primary_port=self.port + i,
+                base_port=self.base_port + i * INSTANCE_PORT_RANGE,
+                config=INSTANCE_CONSERVER_CF.format(instance=i),
+                passwd=CONSERVER_PASSWD,
+            )
+            Path(INSTANCE_SERVER_CONF.format(instance=i)).write_text(config, encoding="utf-8")
+        systemd.daemon_reload()
+
+    def resource_plan(self, consoles: int) -> ResourcePlan:
+        """Get the resource limits of the conserver processes for a number of consoles."""
+        return ResourcePlan(
+            consoles=consoles,
+            instances=self.instances,
+            port=self.port,
+            base_port=self.base_port,
+            port_range=INSTANCE_PORT_RANGE,
+        )
+
+    def write_resource_limits(self, plan: ResourcePlan) -> bool:
+        """Write the resource limits and kernel settings, returning whether limits changed.
+
+        The new limits only apply once the conserver services are restarted.
+        """
+        unit = CONSERVER_SERVICE if self.instances == 1 else f"{CONSERVER_INSTANCE_SERVICE}@"
+        dropin = Path(LIMITS_DROPIN.format(unit=f"{unit}.service"))
+        sysctl = Path(SYSCTL_CONF)
+        changed = False
+        try:
+            if not dropin.exists() or dropin.read_text(encoding="utf-8") != plan.render_dropin():
+                dropin.parent.mkdir(parents=True, exist_ok=True)
+                dropin.write_text(plan.render_dropin(), encoding="utf-8")
+                systemd.daemon_reload()
+                changed = True
+            if not sysctl.exists() or sysctl.read_text(encoding="utf-8") != plan.render_sysctl():
+                sysctl.write_text(plan.render_sysctl(), encoding="utf-8")
+                self._apply_sysctl()
+        except (OSError, systemd.SystemdError) as e:
+            logger.error("Failed to write resource limits: %s", e)
             raise
+        return changed
 
-    def write_conserver_config(self, contents: str) -> None:
-        """Write the conserver.cf file."""
-        path = Path(CONSERVER_CF)
+    def _apply_sysctl(self) -> None:
+        """Apply the kernel settings, which may not be allowed in containers."""
+        result = subprocess.run(
+            ["sysctl", "-p", SYSCTL_CONF], capture_output=True, text=True, check=False
+        )
+        if result.returncode:
+            logger.warning("Failed to apply %s: %s", SYSCTL_CONF, result.stderr.strip())
+
+    def read_conserver_config(self) -> str:
+        """Read the currently deployed conserver.cf file, if any, with its fragments."""
         try:
-            path.write_text(contents, encoding="utf-8")
+            contents = Path(CONSERVER_CF).read_text(encoding="utf-8")
+            if has_includes(contents):
+                contents = expand_includes(contents, CONF_D, self._read_fragment)
+            return contents
+        except FileNotFoundError:
+            return ""
+        except (OSError, UnicodeError) as e:
+            logger.warning("Failed to read %s: %s", CONSERVER_CF, e)
+            return ""
+
+    @staticmethod
+    def _read_fragment(path: str) -> str:
+        """Read a conserver.cf fragment, missing ones being empty as for conserver."""
+        contents = _read_text(Path(path))
+        if contents is None:
+            logger.warning("Missing conserver.cf fragment %s", path)
+        return contents or ""
+
+    def check_config(self, path: Path) -> None:
+        """Check the syntax of a conserver.cf file with conserver itself."""
+        try:
+            result = subprocess.run(
+                [CONSERVER_BIN, "-S", "-C", str(path), "-P", CONSERVER_PASSWD],
+                capture_output=True,
+                text=True,
+            )
+        except OSError as e:
+            logger.warning("Unable to check %s with conserver: %s", path, e)
+            return
+        if result.returncode != 0:
+            raise ConfigValidationError(result.stderr.strip() or result.stdout.strip())
+
+    @property
+    def _conserver_cf_paths(self) -> list[Path]:
+        """Get the paths of the conserver.cf files, including the instances' ones."""
+        paths = [Path(CONSERVER_CF)]
+        if self.instances > 1:
+            paths.extend(
+                Path(INSTANCE_CONSERVER_CF.format(instance=i)) for i in range(self.instances)
+            )
+        return paths
+
+    def write_conserver_config(self, contents: str, model: ConserverCf | None = None) -> None:
+        """Write the conserver.cf file, and the instances' files if there are several.
+
+        The files are staged and checked by conserver before atomically replacing
+        the deployed ones, whose previous version is kept to roll back to.
+
+        Args:
+            contents: contents of the conserver.cf file.
+            model: parsed contents, if already parsed by the caller.
+        """
+        set_attributes(config_size=len(contents))
+        if model is not None:
+            set_attributes(consoles=len(model.consoles))
+        files = {Path(CONSERVER_CF): (contents, model)}
+        if self.instances > 1:
+            parts = partition_consoles(
+                model or parse_config(contents), map(str, range(self.instances))
+            )
+            for instance, part in parts.items():
+                path = Path(INSTANCE_CONSERVER_CF.format(instance=instance))
+                files[path] = (part.render(), part)
+        staged = {}
+        try:
+            gid = self.gid
+            for path, (text, _) in files.items():
+                staged[path] = _stage_file(path, text, 0, CONFIG_MODE, gid)
+                self.check_config(staged[path])
+            for path, (text, part) in files.items():
+                self._deploy_config(path, staged[path], text, part, gid)
+            _fsync_dir(Path(CONSERVER_CF).parent)
         except (OSError, UnicodeError) as e:
             logger.error("Failed to write %s: %s", CONSERVER_CF, e)
             raise
-        os.chown(path, 0, 0)
-        path.chmod(0o644)
+        finally:
+            for staged_path in staged.values():
+                staged_path.unlink(missing_ok=True)
+
+    def _deploy_config(
+        self, path: Path, staged: Path, contents: str, model: ConserverCf | None, gid: int
+    ) -> None:
+        """Deploy a checked conserver.cf file, splitting its consoles into fragments.
+
+        Only the fragments that changed are rewritten. A file that includes
+        other files itself, or whose consoles cannot be split, is deployed as is.
+        """
+        fragment_dir = _fragment_dir(path)
+        if path.exists():
+            _copy_file(path, _last_good(path))
+            _sync_dir(fragment_dir, _last_good(fragment_dir))
+        split = None
+        if not has_includes(contents):
+            try:
+                split = split_config(model or parse_config(contents))
+            except ConfigParseError as e:
+                logger.warning("Failed to split %s into fragments: %s", path, e)
+        if split is None:
+            os.replace(staged, path)
+            for name in _fragment_files(fragment_dir):
+                (fragment_dir / name).unlink()
+            return
+        head, fragments = split
+        fragment_dir.mkdir(parents=True, exist_ok=True)
+        changed = []
+        for name, text in fragments.items():
+            fragment = fragment_dir / name
+            if _read_text(fragment) != text:
+                os.replace(_stage_file(fragment, text, 0, CONFIG_MODE, gid), fragment)
+                changed.append(name)
+            else:
+                # Deployed before the files were restricted
+                _restrict(fragment, gid)
+        _fsync_dir(fragment_dir)
+        main = render_includes(head, [str(fragment_dir / name) for name in sorted(fragments)])
+        if _read_text(path) != main:
+            os.replace(_stage_file(path, main, 0, CONFIG_MODE, gid), path)
+        else:
+            _restrict(path, gid)
+        # Stale fragments are only removed once the main file no longer includes them
+        for name in _fragment_files(fragment_dir) - fragments.keys():
+            (fragment_dir / name).unlink()
+        logger.info(
+            "Rewrote %d of %d fragments of %s: %s",
+            len(changed),
+            len(fragments),
+            path,
+            ", ".join(changed) or "none",
+        )
+
+    def rollback_conserver_config(self) -> bool:
+        """Restore the previous version of the conserver.cf files.
+
+        Returns:
+            Whether there was a previous version to restore.
+        """
+        restored = False
+        for path in self._conserver_cf_paths:
+            if _last_good(path).exists():
+                _copy_file(_last_good(path), path)
+                fragment_dir = _fragment_dir(path)
+                _sync_dir(_last_good(fragment_dir), fragment_dir)
+                restored = True
+        if restored:
+            _fsync_dir(Path(CONSERVER_CF).parent)
+            logger.info("Restored the previous version of %s", CONSERVER_CF)
+        return restored
 
     def write_passwd_file(self, contents: str) -> None:
         """Write the conserver.passwd file."""
+        set_attributes(passwd_size=len(contents))
         path = Path(CONSERVER_PASSWD)
         try:
-            path.write_text(contents, encoding="utf-8")
+            os.replace(_stage_file(path, contents, self.uid, 0o600), path)
+            _fsync_dir(path.parent)
         except (OSError, UnicodeError) as e:
             logger.error("Failed to write %s: %s", CONSERVER_PASSWD, e)
             raise
-        os.chown(path, self.uid, 0)
-        path.chmod(0o600)
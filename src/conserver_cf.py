@@ -0,0 +1,188 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Parser and diff engine for the conserver.cf configuration file."""
+
+import enum
+import re
+from dataclasses import dataclass, field
+
+BLOCK_KINDS = ("default", "access", "group", "console", "config", "break")
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<space>\s+)
+    | (?P<comment>\#[^\n]*)
+    | (?P<punct>[{};])
+    | (?P<word>(?:"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|\\.|[^\s{};"'\\])+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+_UNQUOTED_RE = re.compile(r"[^\s{};#\"'\\]+")
+
+
+def quote(value: str) -> str:
+    """Quote a value for conserver.cf if it contains special characters."""
+    if _UNQUOTED_RE.fullmatch(value):
+        return value
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+class ConfigParseError(ValueError):
+    """Raised when a conserver.cf file cannot be parsed."""
+
+
+class Action(enum.IntEnum):
+    """Action needed for conserver to apply a configuration change."""
+
+    NONE = 0
+    RELOAD = 1
+    RESTART = 2
+
+
+@dataclass(frozen=True)
+class Block:
+    """A single block of a conserver.cf file, e.g. `console name { ... }`."""
+
+    kind: str
+    name: str
+    items: tuple[tuple[str, str], ...] = ()
+
+    def render(self) -> str:
+        """Render the block back into conserver.cf syntax."""
+        lines = [f"{self.kind} {self.name} {{\n"]
+        for keyword, value in self.items:
+            lines.append(f"  {keyword} {value};\n" if value else f"  {keyword};\n")
+        lines.append("}\n")
+        return "".join(lines)
+
+
+@dataclass
+class ConserverCf:
+    """In-memory model of a conserver.cf file."""
+
+    blocks: list[Block] = field(default_factory=list)
+
+    @property
+    def consoles(self) -> dict[str, Block]:
+        """Get the console blocks, indexed by console name."""
+        return self.blocks_of("console")
+
+    def blocks_of(self, kind: str) -> dict[str, Block]:
+        """Get the blocks of a given kind, indexed by name."""
+        # Later blocks with the same name override earlier ones, as in conserver
+        return {block.name: block for block in self.blocks if block.kind == kind}
+
+    def render(self) -> str:
+        """Render the model back into conserver.cf syntax."""
+        return "".join(block.render() for block in self.blocks)
+
+
+@dataclass(frozen=True)
+class ConfigDiff:
+    """Differences between two conserver.cf files."""
+
+    added: tuple[str, ...] = ()
+    removed: tuple[str, ...] = ()
+    changed: tuple[str, ...] = ()
+    changed_kinds: frozenset[str] = frozenset()
+
+    @property
+    def consoles_changed(self) -> bool:
+        """Check whether any console was added, removed or changed."""
+        return bool(self.added or self.removed or self.changed)
+
+    @property
+    def action(self) -> Action:
+        """Get the action needed to apply the differences."""
+        # conserver only reads some settings in `config` blocks (ports, daemon
+        # mode, SSL, ...) when it starts, so those need a full restart.
+        if "config" in self.changed_kinds:
+            return Action.RESTART
+        if self.consoles_changed or self.changed_kinds:
+            return Action.RELOAD
+        return Action.NONE
+
+    def summary(self) -> str:
+        """Get a human readable summary of the console changes."""
+        return (
+            f"{len(self.added)} added, {len(self.removed)} removed, "
+            f"{len(self.changed)} changed consoles"
+        )
+
+
+def _tokenize(contents: str):
+    """Split the contents of a conserver.cf file into (token, line) pairs."""
+    pos = 0
+    line = 1
+    while pos < len(contents):
+        match = _TOKEN_RE.match(contents, pos)
+        if not match:
+            raise ConfigParseError(f"Unexpected character {contents[pos]!r} on line {line}")
+        token = match.group()
+        if match.lastgroup in ("punct", "word"):
+            yield token, line
+        line += token.count("\n")
+        pos = match.end()
+
+
+def parse_config(contents: str) -> ConserverCf:
+    """Parse the contents of a conserver.cf file."""
+    blocks = []
+    tokens = _tokenize(contents)
+    for token, line in tokens:
+        if token not in BLOCK_KINDS:
+            raise ConfigParseError(f"Unknown block type {token!r} on line {line}")
+        name, line = next(tokens, (None, line))
+        if name is None or name in ("{", "}", ";"):
+            raise ConfigParseError(f"Missing name for {token} block on line {line}")
+        brace, line = next(tokens, (None, line))
+        if brace != "{":
+            raise ConfigParseError(f"Expected '{{' after {token} {name} on line {line}")
+        blocks.append(Block(token, name, _parse_items(tokens, token, name, line)))
+    return ConserverCf(blocks)
+
+
+def _parse_items(tokens, kind: str, name: str, line: int) -> tuple[tuple[str, str], ...]:
+    """Parse the `keyword value;` items of a block, up to its closing brace."""
+    items = []
+    words = []
+    for token, line in tokens:
+        if token == "}":
+            if words:
+                raise ConfigParseError(f"Missing ';' before '}}' on line {line}")
+            return tuple(items)
+        if token == ";":
+            if words:
+                items.append((words[0], " ".join(words[1:])))
+            words = []
+        elif token == "{":
+            raise ConfigParseError(f"Unexpected '{{' on line {line}")
+        else:
+            words.append(token)
+    raise ConfigParseError(f"Unterminated {kind} {name} block on line {line}")
+
+
+def diff_configs(old: ConserverCf, new: ConserverCf) -> ConfigDiff:
+    """Compute the differences between two conserver.cf models."""
+    old_consoles = old.consoles
+    new_consoles = new.consoles
+    changed_kinds = frozenset(
+        kind
+        for kind in BLOCK_KINDS
+        if kind != "console" and old.blocks_of(kind) != new.blocks_of(kind)
+    )
+    return ConfigDiff(
+        added=tuple(sorted(new_consoles.keys() - old_consoles.keys())),
+        removed=tuple(sorted(old_consoles.keys() - new_consoles.keys())),
+        changed=tuple(
+            sorted(
+                name
+                for name in old_consoles.keys() & new_consoles.keys()
+                if old_consoles[name] != new_consoles[name]
+            )
+        ),
+        changed_kinds=changed_kinds,
+    )
@@ -0,0 +1,123 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Installation of Debian packages attached as a resource, without an apt mirror.
+
+The packages are attached as a tar archive of .deb files, which is extracted
+once into a cache directory. apt installs them from their files with
+`--no-download`, resolving their dependencies from the other attached files
+and the installed packages, and never refreshes its indexes.
+"""
+
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+from charmlibs import apt
+
+from payload import decompress_file, verify_checksum
+
+DEBS_DIR = "/var/lib/conserver-charm/debs"
+
+
+@dataclass(frozen=True)
+class LocalDeb:
+    """Debian package file."""
+
+    name: str
+    version: str
+    path: Path
+
+
+def extract_debs(archive: Path, dest: Path, checksum: str = "") -> None:
+    """Extract the .deb files of a tar archive into a directory, replacing its contents.
+
+    Args:
+        archive: tar archive, optionally gzip or zstd compressed.
+        dest: directory the .deb files are extracted into.
+        checksum: expected SHA-256 checksum of the uncompressed archive, if any.
+
+    Raises:
+        ChecksumError: if the archive does not match the checksum.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=dest.parent) as tmp:
+        tar_path = Path(tmp, "packages.tar")
+        verify_checksum(decompress_file(archive, tar_path), checksum)
+        staged = Path(tmp, "debs")
+        staged.mkdir()
+        with tarfile.open(tar_path) as tar:
+            for member in tar:
+                source = tar.extractfile(member) if member.name.endswith(".deb") else None
+                if source is None:
+                    continue
+                # Flattened, so that no member is written outside the directory
+                with source, (staged / Path(member.name).name).open("wb") as out:
+                    shutil.copyfileobj(source, out)
+        shutil.rmtree(dest, ignore_errors=True)
+        staged.rename(dest)
+
+
+def read_debs(directory: Path) -> dict[str, LocalDeb]:
+    """Get the package files of a directory, by package name."""
+    debs = {}
+    for path in sorted(directory.glob("*.deb")):
+        try:
+            stdout = subprocess.check_output(
+                ["dpkg-deb", "--show", "--showformat=${Package}\t${Version}", str(path)],
+                text=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise apt.PackageError(f"Invalid package {path.name}: {e}") from e
+        name, _, version = stdout.partition("\t")
+        debs[name] = LocalDeb(name, version.strip(), path)
+    return debs
+
+
+def installed_versions(names: Iterable[str]) -> dict[str, str]:
+    """Get the installed version of packages, leaving out those not installed."""
+    names = list(names)
+    if not names:
+        return {}
+    # Exits with an error for unknown packages, while still listing the others
+    stdout = subprocess.run(
+        ["dpkg-query", "--show", "--showformat=${Package}\t${Version}\t${db:Status-Status}\n"]
+        + names,
+        capture_output=True,
+        text=True,
+    ).stdout
+    versions = {}
+    for line in stdout.splitlines():
+        name, version, status = (line.split("\t") + ["", ""])[:3]
+        if status == "installed":
+            versions[name] = version
+    return versions
+
+
+def apt_install(packages: list[str], *options: str) -> None:
+    """Install packages, as names with an optional version or as files, even if held."""
+    command = ["apt-get", "install", "--yes", "--allow-change-held-packages", *options]
+    command += ["--option=Dpkg::Options::=--force-confold", *packages]
+    env = {**os.environ, "DEBIAN_FRONTEND": "noninteractive"}
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True, env=env)
+    except subprocess.CalledProcessError as e:
+        raise apt.PackageError(f"Could not install {' '.join(packages)}: {e.stderr}") from e
+
+
+def install_debs(debs: Iterable[LocalDeb]) -> list[str]:
+    """Install the package files whose version is not installed, without downloading.
+
+    Returns:
+        The names of the installed packages.
+    """
+    debs = list(debs)
+    installed = installed_versions(deb.name for deb in debs)
+    pending = [deb for deb in debs if installed.get(deb.name) != deb.version]
+    if pending:
+        apt_install([str(deb.path) for deb in pending], "--no-download", "--allow-downgrades")
+    return [deb.name for deb in pending]
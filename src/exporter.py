@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Prometheus exporter for conserver.
+
+Runs as a standalone service with the system Python, so it only uses the
+standard library. On each scrape it collects:
+
+- the state and attached clients of each console, from `console -u`
+- the number of conserver processes and their open file descriptors, from /proc
+- the size of the console log files, to compute bytes logged per second
+- the metrics recorded by the charm, e.g. hook and reload durations
+"""
+
+import argparse
+import os
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+CONSOLE_TIMEOUT = 10
+# Rotated segments are moved to a hidden directory next to each log, so that
+# they are not matched again by globs such as `/var/log/conserver/*`
+ROTATED_DIR = ".rotated"
+COMPRESSED_SUFFIXES = (".zst", ".gz")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def parse_console_users(output: str) -> dict[str, tuple[bool, int]]:
+    """Parse the output of `console -u` into the state and client count of each console."""
+    consoles = {}
+    for line in output.splitlines():
+        fields = line.split(None, 2)
+        if len(fields) < 2:
+            continue
+        name, state = fields[0], fields[1]
+        users = fields[2].strip() if len(fields) > 2 else ""
+        clients = 0 if not users or users == "<none>" else len(users.split(","))
+        consoles[name] = (state == "up", clients)
+    return consoles
+
+
+def collect_consoles(ports: list[int]) -> list[str]:
+    """Collect the state and attached clients of each console, from each conserver."""
+    lines = [
+        "# HELP conserver_up Whether conserver answered on its port.",
+        "# TYPE conserver_up gauge",
+    ]
+    console_lines = [
+        "# HELP conserver_console_up Whether the console is up.",
+        "# TYPE conserver_console_up gauge",
+        "# HELP conserver_console_clients Number of clients attached to the console.",
+        "# TYPE conserver_console_clients gauge",
+    ]
+    for port in ports:
+        try:
+            output = subprocess.check_output(
+                ["console", "-M", "127.0.0.1", "-p", str(port), "-u"],
+                text=True,
+                stderr=subprocess.DEVNULL,
+                timeout=CONSOLE_TIMEOUT,
+            )
+        except (OSError, subprocess.SubprocessError):
+            lines.append(f'conserver_up{{port="{port}"}} 0')
+            continue
+        lines.append(f'conserver_up{{port="{port}"}} 1')
+        for name, (up, clients) in sorted(parse_console_users(output).items()):
+            console = _escape(name)
+            console_lines.append(f'conserver_console_up{{console="{console}"}} {int(up)}')
+            console_lines.append(f'conserver_console_clients{{console="{console}"}} {clients}')
+    return lines + console_lines
+
+
+def collect_processes(proc: Path = Path("/proc")) -> list[str]:
+    """Collect the number of conserver processes and their open file descriptors."""
+    processes = 0
+    fds = 0
+    for pid in proc.iterdir():
+        if not pid.name.isdigit():
+            continue
+        try:
+            if (pid / "comm").read_text().strip() != "conserver":
+                continue
+            fds += len(os.listdir(pid / "fd"))
+        except OSError:
+            continue
+        processes += 1
+    return [
+        "# HELP conserver_processes Number of conserver processes, including children.",
+        "# TYPE conserver_processes gauge",
+        f"conserver_processes {processes}",
+        "# HELP conserver_open_fds Number of file descriptors open by conserver processes.",
+        "# TYPE conserver_open_fds gauge",
+        f"conserver_open_fds {fds}",
+    ]
+
+
+def collect_logs(log_dir: Path) -> list[str]:
+    """Collect the size of the live console log files.
+
+    Rotated segments are skipped, as each rotation would otherwise add a
+    series named after the date of the segment.
+    """
+    lines = [
+        "# HELP conserver_log_bytes Size of the console log file, rate() gives bytes per second.",
+        "# TYPE conserver_log_bytes gauge",
+    ]
+    if not log_dir.is_dir():
+        return lines
+    for root, dirs, files in os.walk(log_dir):
+        dirs[:] = [name for name in dirs if name != ROTATED_DIR]
+        for name in sorted(files):
+            if name.endswith(COMPRESSED_SUFFIXES):
+                continue
+            path = Path(root, name)
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            file = _escape(str(path.relative_to(log_dir)))
+            lines.append(f'conserver_log_bytes{{file="{file}"}} {size}')
+    return lines
+
+
+def collect(ports: list[int], log_dir: Path, textfile: Path) -> str:
+    """Collect all the metrics, in the Prometheus text format."""
+    lines = collect_consoles(ports) + collect_processes() + collect_logs(log_dir)
+    try:
+        lines.append(textfile.read_text().rstrip("\n"))
+    except OSError:
+        pass
+    return "\n".join(lines) + "\n"
+
+
+def main():  # pragma: nocover
+    """Serve the metrics over HTTP."""
+    parser = argparse.ArgumentParser(description="Prometheus exporter for conserver.")
+    parser.add_argument("--listen-port", type=int, required=True)
+    parser.add_argument("--conserver-port", type=int, action="append", required=True)
+    parser.add_argument("--log-dir", type=Path, required=True)
+    parser.add_argument("--textfile", type=Path, required=True)
+    args = parser.parse_args()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = collect(args.conserver_port, args.log_dir, args.textfile).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    ThreadingHTTPServer(("", args.listen_port), Handler).serve_forever()
+
+
+if __name__ == "__main__":  # pragma: nocover
+    main()
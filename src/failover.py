@@ -0,0 +1,100 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Floating address of the active unit in active/standby mode.
+
+The address is added to the interface of the unit in its subnet, and
+announced with gratuitous ARP so that clients and switches update their ARP
+caches right away, instead of sending traffic to the failed unit until their
+entries expire.
+"""
+
+import ipaddress
+import json
+import logging
+import subprocess
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+ARPING_COUNT = 3
+
+Subnet = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+class FloatingAddressError(ValueError):
+    """Raised when the floating address cannot be assigned to, or released from, the unit."""
+
+
+@dataclass(frozen=True)
+class FloatingAddress:
+    """Floating address, with the prefix of its subnet, on an interface of the unit."""
+
+    address: ipaddress.IPv4Interface | ipaddress.IPv6Interface
+    device: str
+
+    @classmethod
+    def on_interfaces(
+        cls, address: str, interfaces: Iterable[tuple[str, Subnet | None]]
+    ) -> "FloatingAddress":
+        """Get the floating address on the interface whose subnet contains it.
+
+        Args:
+            address: floating IP address.
+            interfaces: (name, subnet) pairs of the interfaces of the unit.
+        """
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError as e:
+            raise FloatingAddressError(str(e)) from e
+        for device, subnet in interfaces:
+            if subnet is not None and ip in subnet:
+                return cls(ipaddress.ip_interface(f"{ip}/{subnet.prefixlen}"), device)
+        raise FloatingAddressError(f"{address} is not in a subnet of the unit")
+
+    @property
+    def assigned(self) -> bool:
+        """Check whether the address is assigned to the interface."""
+        try:
+            stdout = subprocess.check_output(
+                ["ip", "-json", "address", "show", "dev", self.device], text=True
+            )
+            links = json.loads(stdout)
+        except (OSError, subprocess.CalledProcessError, ValueError) as e:
+            logger.warning("Failed to get the addresses of %s: %s", self.device, e)
+            return False
+        ip = str(self.address.ip)
+        return any(info.get("local") == ip for link in links for info in link["addr_info"])
+
+    def assign(self) -> None:
+        """Assign the address to the interface."""
+        try:
+            subprocess.run(
+                ["ip", "address", "replace", str(self.address), "dev", self.device], check=True
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise FloatingAddressError(f"cannot assign {self.address}: {e}") from e
+        logger.info("Assigned floating address %s to %s", self.address, self.device)
+
+    def announce(self) -> None:
+        """Announce the address with gratuitous ARP, for IPv4 addresses."""
+        if self.address.version != 4:
+            # IPv6 neighbors notice the move with neighbor unreachability detection
+            return
+        command = ["arping", "-q", "-U", "-c", str(ARPING_COUNT), "-I", self.device]
+        try:
+            subprocess.run([*command, str(self.address.ip)], check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning("Failed to announce floating address %s: %s", self.address, e)
+
+    def release(self) -> None:
+        """Remove the address from the interface, if it is assigned."""
+        if not self.assigned:
+            return
+        try:
+            subprocess.run(
+                ["ip", "address", "delete", str(self.address), "dev", self.device], check=True
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise FloatingAddressError(f"cannot release {self.address}: {e}") from e
+        logger.info("Released floating address %s from %s", self.address, self.device)
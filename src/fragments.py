@@ -0,0 +1,77 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Storage of conserver.cf as a main file including a fragment per console group.
+
+The consoles of each group, the `default` block they include first, are
+written to their own fragment, which the main file includes with conserver's
+`#include` directive after all the other blocks. Only the fragments whose
+consoles changed are rewritten, and the main file only when groups are added
+or removed.
+"""
+
+import hashlib
+import re
+from collections.abc import Callable
+
+from conserver_cf import ConserverCf
+
+INCLUDE = "#include"
+UNGROUPED = "ungrouped"
+
+_INCLUDE_RE = re.compile(rf"^{INCLUDE} (\S+)\n?", re.MULTILINE)
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def fragment_name(group: str | None) -> str:
+    """Get the file name of the fragment of a group, or of the consoles in none."""
+    if group is None:
+        return f"{UNGROUPED}.cf"
+    group = group.strip("\"'")
+    safe = _UNSAFE_RE.sub("_", group)
+    if safe != group:
+        # Keep the names of groups that only differ in unsafe characters apart
+        safe += "-" + hashlib.sha256(group.encode()).hexdigest()[:8]
+    return f"group-{safe}.cf"
+
+
+def split_config(model: ConserverCf) -> tuple[str, dict[str, str]] | None:
+    """Split a conserver.cf model into its main part and its fragments, by file name.
+
+    Returns:
+        None if the consoles cannot be moved after the other blocks without
+        changing their meaning, as a `default` block follows a console.
+    """
+    head = []
+    fragments: dict[str, list[str]] = {}
+    seen_console = False
+    for block in model.blocks:
+        if block.kind != "console":
+            if block.kind == "default" and seen_console:
+                return None
+            head.append(block.render())
+            continue
+        seen_console = True
+        group = next((value for keyword, value in block.items if keyword == "include"), None)
+        fragments.setdefault(fragment_name(group), []).append(block.render())
+    return "".join(head), {name: "".join(blocks) for name, blocks in fragments.items()}
+
+
+def render_includes(head: str, paths: list[str]) -> str:
+    """Render the main file, including the fragments after the other blocks."""
+    return head + "".join(f"{INCLUDE} {path}\n" for path in paths)
+
+
+def has_includes(contents: str) -> bool:
+    """Check whether a conserver.cf file includes other files."""
+    return _INCLUDE_RE.search(contents) is not None
+
+
+def expand_includes(contents: str, directory: str, read: Callable[[str], str]) -> str:
+    """Replace the directives including fragments of a directory by their contents."""
+
+    def expand(match: re.Match) -> str:
+        if not match[1].startswith(f"{directory}/"):
+            return match[0]
+        return read(match[1])
+
+    return _INCLUDE_RE.sub(expand, contents)
@@ -0,0 +1,128 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Generation of conserver.cf from a compact console inventory.
+
+An inventory is a YAML (or JSON) document like::
+
+    defaults:
+      type: exec
+      exec: ipmitool -I lanplus -H H -U admin -f /etc/conserver/ipmi.pass sol activate
+      execsubst: H=hs
+      rw: "*"
+    groups:
+      rack1:
+        logfile: /var/log/conserver/rack1/&
+    consoles:
+      node1: 10.0.0.1
+      node2:
+        bmc: 10.0.0.2
+        group: rack1
+
+`defaults` and each group are rendered as conserver `default` blocks, and each
+console includes its group (or the defaults) and gets its BMC address as `host`.
+"""
+
+from collections.abc import Iterator, Mapping
+from typing import Any
+
+import yaml
+from pydantic import BaseModel, ConfigDict, ValidationError, model_validator
+
+from conserver_cf import Block, quote
+
+# Name of the `default` block holding the inventory defaults
+DEFAULTS_BLOCK = "inventory"
+
+Value = str | int | list[str | int]
+
+try:
+    _Loader = yaml.CSafeLoader
+except AttributeError:  # pragma: nocover
+    _Loader = yaml.SafeLoader
+
+
+class InventoryError(ValueError):
+    """Raised when an inventory cannot be loaded."""
+
+
+class InventoryConsole(BaseModel):
+    """A console in the inventory, with any other conserver console settings."""
+
+    model_config = ConfigDict(extra="allow")
+
+    bmc: str = ""
+    group: str = ""
+
+    @model_validator(mode="before")
+    @classmethod
+    def from_bmc(cls, value: Any) -> Any:
+        """Accept a plain BMC address as a shorthand for a console."""
+        if isinstance(value, str):
+            return {"bmc": value}
+        return value
+
+
+class Inventory(BaseModel):
+    """Inventory of consoles."""
+
+    defaults: dict[str, Value] = {}
+    groups: dict[str, dict[str, Value]] = {}
+    consoles: dict[str, InventoryConsole] = {}
+
+    @model_validator(mode="after")
+    def check_groups(self) -> "Inventory":
+        """Check that consoles only refer to known groups."""
+        for name, console in self.consoles.items():
+            if console.group and console.group not in self.groups:
+                raise ValueError(f"Console {name} refers to unknown group {console.group}")
+        return self
+
+
+def load_inventory(contents: str) -> Inventory:
+    """Load an inventory from its YAML or JSON contents."""
+    try:
+        return Inventory.model_validate(yaml.load(contents, Loader=_Loader) or {})
+    except (yaml.YAMLError, ValidationError) as e:
+        raise InventoryError(str(e)) from e
+
+
+def _items(settings: dict[str, Value]) -> list[tuple[str, str]]:
+    items = []
+    for keyword, value in settings.items():
+        if isinstance(value, list):
+            value = ",".join(str(v) for v in value)
+        items.append((keyword, quote(str(value))))
+    return items
+
+
+def render_inventory(inventory: Inventory) -> Iterator[str]:
+    """Render the inventory into conserver.cf blocks, one block at a time.
+
+    Groups and consoles are sorted by name, so that the same inventory always
+    renders to the same file.
+    """
+    include = []
+    if inventory.defaults:
+        include = [("include", DEFAULTS_BLOCK)]
+        yield Block("default", DEFAULTS_BLOCK, tuple(_items(inventory.defaults))).render()
+    for name in sorted(inventory.groups):
+        items = include + _items(inventory.groups[name])
+        yield Block("default", quote(name), tuple(items)).render()
+    yield from render_consoles(inventory.consoles, include_defaults=bool(include))
+
+
+def render_consoles(
+    consoles: Mapping[str, InventoryConsole], include_defaults: bool = False
+) -> Iterator[str]:
+    """Render consoles into conserver.cf blocks, sorted by name.
+
+    Consoles include their group, or the inventory defaults if `include_defaults`.
+    """
+    include = [("include", DEFAULTS_BLOCK)] if include_defaults else []
+    for name in sorted(consoles):
+        console = consoles[name]
+        items = [("include", quote(console.group))] if console.group else list(include)
+        if console.bmc:
+            items.append(("host", quote(console.bmc)))
+        items.extend(_items(console.model_extra or {}))
+        yield Block("console", quote(name), tuple(items)).render()
@@ -0,0 +1,99 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Rotation and compression of the console logs."""
+
+import re
+from dataclasses import dataclass
+
+from conserver_cf import ConserverCf
+from exporter import ROTATED_DIR
+
+_SIZE_RE = re.compile(r"(?P<number>\d+)\s*(?P<unit>[kmg]?)b?", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def parse_size(value: str) -> int:
+    """Parse a size such as `100M` or `1G` into bytes."""
+    match = _SIZE_RE.fullmatch(value.strip())
+    if not match:
+        raise ValueError(f"Invalid size {value!r}, expected e.g. 500K, 100M or 1G")
+    return int(match["number"]) * _SIZE_UNITS[match["unit"].lower()]
+
+
+def _unquote(value: str) -> str:
+    if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def log_paths(model: ConserverCf, log_dir: str) -> list[str]:
+    """Get the globs matching the console logs of a conserver.cf file.
+
+    `&` in a `logfile` is replaced by the console name, and relative paths are
+    relative to the conserver log directory.
+    """
+    paths = set()
+    for block in model.blocks:
+        if block.kind not in ("default", "console"):
+            continue
+        for keyword, value in block.items:
+            value = _unquote(value)
+            if keyword != "logfile" or not value:
+                continue
+            path = value.replace("&", "*")
+            paths.add(path if path.startswith("/") else f"{log_dir}/{path}")
+    return sorted(paths) or [f"{log_dir}/*.log"]
+
+
+@dataclass(frozen=True)
+class LogRotation:
+    """Rotation settings for the console logs."""
+
+    max_size: int
+    console_quota: int
+    interval: str
+    retention_days: int
+
+    @property
+    def segments(self) -> int:
+        """Get the number of rotated segments kept for each console log."""
+        # Segments are compressed, so the quota is an upper bound on disk usage
+        return max(1, self.console_quota // self.max_size - 1)
+
+    def render(self, paths: list[str], services: list[str]) -> str:
+        """Render the logrotate configuration for the given log paths."""
+        lines = [
+            "# Managed by the conserver charm, changes will be overwritten",
+            " ".join(f'"{path}"' for path in paths) + " {",
+            f"    {self.interval}",
+            f"    maxsize {self.max_size}",
+            f"    rotate {self.segments}",
+        ]
+        if self.retention_days:
+            lines.append(f"    maxage {self.retention_days}")
+        lines += [
+            "    missingok",
+            "    notifempty",
+            f"    olddir {ROTATED_DIR}",
+            "    createolddir 0750 root root",
+            "    dateext",
+            "    dateformat -%Y%m%d-%s",
+            # The last segment is compressed on the next run, as conserver may
+            # still write to it until it reopened its logs
+            "    compress",
+            "    delaycompress",
+            "    compresscmd /usr/bin/zstd",
+            "    uncompresscmd /usr/bin/unzstd",
+            "    compressext .zst",
+            "    compressoptions -q",
+            "    sharedscripts",
+            "    postrotate",
+            # SIGUSR2 makes conserver reopen its logs without dropping clients.
+            # Only the main process is signalled, as the console commands it
+            # runs in the same cgroup would be killed by it, and conserver
+            # passes the signal on to its children itself
+            f"        systemctl kill --kill-whom=main --signal=USR2 {' '.join(services)} || true",
+            "    endscript",
+            "}",
+        ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,243 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Time indexed search of the console logs.
+
+Conserver only timestamps its logs with `[-- ... -- <ctime>]` lines, such as
+the MARK lines written with the `timestamp` console option, so every other
+line is assumed to be logged at the time of the previous timestamp line.
+
+A sparse index of timestamp lines and their offsets is kept for the current
+log of each console and extended as the log grows, so a search only reads the
+part of the log covering the requested time window. Rotated segments are
+selected from the rotation time in their names and decompressed as a stream.
+"""
+
+import bisect
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import subprocess
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+from logrotate import ROTATED_DIR
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = "/var/lib/conserver-charm/log-index"
+# Bytes of log between two index entries
+INDEX_STRIDE = 64 * 1024
+TAIL_BLOCK = 8 * 1024
+
+_MARK_RE = re.compile(
+    rb"^\[-- [^\]\n]* -- (\w{3} \w{3} [ \d]\d \d\d:\d\d:\d\d \d{4})\]", re.MULTILINE
+)
+_SEGMENT_RE = re.compile(r"-\d{8}-(?P<epoch>\d+)(?P<zst>\.zst)?")
+_RELATIVE_RE = re.compile(r"(?P<number>\d+)\s*(?P<unit>[smhd])")
+_RELATIVE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_mark(line: bytes) -> float | None:
+    """Get the time of a conserver timestamp line, as seconds since the epoch."""
+    match = _MARK_RE.search(line)
+    if not match:
+        return None
+    return time.mktime(time.strptime(match[1].decode(), "%a %b %d %H:%M:%S %Y"))
+
+
+def parse_time(value: str, now: float) -> float:
+    """Parse an ISO 8601 time, or a duration before now such as `10m` or `2h`."""
+    match = _RELATIVE_RE.fullmatch(value.strip())
+    if match:
+        return now - int(match["number"]) * _RELATIVE_UNITS[match["unit"]]
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time {value!r}, expected e.g. 10m, 2h or 2025-10-17T09:30")
+
+
+@dataclass
+class LogIndex:
+    """Sparse index from timestamps to byte offsets in a console log."""
+
+    inode: int = 0
+    size: int = 0
+    last_time: float | None = None
+    entries: list[tuple[float, int]] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, path: Path) -> "LogIndex":
+        """Load an index, or get an empty one if it is missing or corrupted."""
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            return cls(
+                inode=data["inode"],
+                size=data["size"],
+                last_time=data["last_time"],
+                entries=[(t, offset) for t, offset in data["entries"]],
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls()
+
+    def save(self, path: Path) -> None:
+        """Save the index."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "inode": self.inode,
+            "size": self.size,
+            "last_time": self.last_time,
+            "entries": self.entries,
+        }
+        staged = path.with_name(f".{path.name}.tmp")
+        staged.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(staged, path)
+
+    def update(self, data: bytes | mmap.mmap, inode: int) -> bool:
+        """Index the part of a log written since the last update, returning if it changed."""
+        if inode != self.inode or len(data) < self.size:
+            # The log was rotated or truncated
+            self.inode, self.size, self.last_time, self.entries = inode, 0, None, []
+        # Only index complete lines, the last one may still be written
+        end = data.rfind(b"\n") + 1
+        if end <= self.size:
+            return False
+        for match in _MARK_RE.finditer(data, self.size, end):
+            mark = parse_mark(match.group())
+            if mark is None or (self.last_time is not None and mark < self.last_time):
+                continue
+            self.last_time = mark
+            if not self.entries or match.start() - self.entries[-1][1] >= INDEX_STRIDE:
+                self.entries.append((mark, match.start()))
+        self.size = end
+        return True
+
+    def span(self, since: float, until: float) -> tuple[int, int, float | None]:
+        """Get the byte range covering a time window, and the time at its start."""
+        times = [t for t, _ in self.entries]
+        first = bisect.bisect_right(times, since) - 1
+        last = bisect.bisect_right(times, until)
+        start, start_time = (0, None) if first < 0 else (self.entries[first][1], times[first])
+        end = self.entries[last][1] if last < len(self.entries) else self.size
+        return start, end, start_time
+
+
+def _index_path(log: Path) -> Path:
+    digest = hashlib.sha256(str(log).encode()).hexdigest()[:16]
+    return Path(INDEX_DIR, f"{log.name}.{digest}.json")
+
+
+def rotated_segments(log: Path) -> list[tuple[float, Path]]:
+    """Get the rotated segments of a log, oldest first, with the time they were rotated."""
+    segments = []
+    rotated_dir = log.parent / ROTATED_DIR
+    if not rotated_dir.is_dir():
+        return segments
+    for path in rotated_dir.iterdir():
+        if not path.name.startswith(log.name):
+            continue
+        match = _SEGMENT_RE.fullmatch(path.name[len(log.name) :])
+        if match:
+            segments.append((float(match["epoch"]), path))
+    return sorted(segments)
+
+
+def _stream(path: Path) -> Iterator[bytes]:
+    """Read the lines of a rotated segment, decompressing it if needed."""
+    if path.suffix != ".zst":
+        with path.open("rb") as f:
+            yield from f
+        return
+    with subprocess.Popen(
+        ["zstd", "-dcq", "--", str(path)], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    ) as process:
+        yield from process.stdout  # type: ignore[misc]
+
+
+@dataclass
+class _Matcher:
+    """Collect the lines of a time window matching a pattern."""
+
+    pattern: re.Pattern[bytes]
+    since: float
+    until: float
+    limit: int
+    lines: list[str] = field(default_factory=list)
+    truncated: bool = False
+
+    def scan(self, lines: Iterable[bytes], current: float | None) -> None:
+        """Scan lines logged from the given time, stopping after the window or limit."""
+        for line in lines:
+            mark = parse_mark(line) if line.startswith(b"[--") else None
+            if mark is not None:
+                current = mark
+                if current > self.until:
+                    return
+            if current is None or current < self.since or not self.pattern.search(line):
+                continue
+            if len(self.lines) >= self.limit:
+                self.truncated = True
+                return
+            self.lines.append(line.rstrip(b"\r\n").decode("utf-8", "replace"))
+
+
+def search_log(
+    log: Path, pattern: str, since: float, until: float, limit: int = 1000
+) -> tuple[list[str], bool]:
+    """Search a console log and its rotated segments for lines logged in a time window.
+
+    Returns:
+        The matching lines, oldest first, and whether they were truncated to the limit.
+    """
+    matcher = _Matcher(re.compile(pattern.encode()), since, until, limit)
+    previous = None
+    for rotated, segment in rotated_segments(log):
+        if previous is not None and previous > until:
+            return matcher.lines, False
+        # A segment holds the lines logged between the previous rotation and its own
+        if rotated >= since:
+            matcher.scan(_stream(segment), previous)
+            if matcher.truncated:
+                return matcher.lines, True
+        previous = rotated
+    if previous is not None and previous > until:
+        return matcher.lines, False
+
+    with log.open("rb") as f:
+        stat = os.fstat(f.fileno())
+        if not stat.st_size:
+            return matcher.lines, False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            index_path = _index_path(log)
+            index = LogIndex.load(index_path)
+            if index.update(data, stat.st_ino):
+                try:
+                    index.save(index_path)
+                except OSError as e:
+                    logger.warning("Failed to save the index of %s: %s", log, e)
+            start, end, start_time = index.span(since, until)
+            # Lines written after the last indexed one are not indexed yet
+            if end == index.size:
+                end = len(data)
+            matcher.scan(data[start:end].splitlines(keepends=True), start_time or previous)
+    return matcher.lines, matcher.truncated
+
+
+def tail_log(log: Path, lines: int) -> list[str]:
+    """Get the last lines of a console log, reading it backwards from its end."""
+    with log.open("rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        data = b""
+        # One more line than requested, as the first one read may be partial
+        while position > 0 and data.count(b"\n") <= lines:
+            step = min(TAIL_BLOCK, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    tail = data.splitlines()[-lines:] if lines else []
+    return [line.decode("utf-8", "replace") for line in tail]
@@ -0,0 +1,78 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Metrics recorded by the charm, and exposed by the conserver exporter."""
+
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = "/var/lib/conserver-charm"
+DURATIONS_FILE = f"{METRICS_DIR}/durations.json"
+TEXTFILE = f"{METRICS_DIR}/charm.prom"
+
+METRICS_RELATION = "metrics-endpoint"
+METRICS_PATH = "/metrics"
+
+
+def _render(durations: dict[str, dict[str, dict[str, float]]]) -> str:
+    """Render the recorded durations in the Prometheus text format."""
+    lines = []
+    for metric, labels in sorted(durations.items()):
+        name = f"conserver_charm_{metric}_duration_seconds"
+        lines.append(f"# HELP {name} Duration of charm {metric.replace('_', ' ')}s.")
+        lines.append(f"# TYPE {name} summary")
+        for label, values in sorted(labels.items()):
+            lines.append(f'{name}_sum{{{metric}="{label}"}} {values["sum"]}')
+            lines.append(f'{name}_count{{{metric}="{label}"}} {int(values["count"])}')
+        lines.append(f"# HELP {name}_last Duration of the last charm {metric.replace('_', ' ')}.")
+        lines.append(f"# TYPE {name}_last gauge")
+        for label, values in sorted(labels.items()):
+            lines.append(f'{name}_last{{{metric}="{label}"}} {values["last"]}')
+    return "\n".join(lines) + "\n"
+
+
+def _write(path: Path, contents: str) -> None:
+    fd, staged = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(contents)
+    os.chmod(staged, 0o644)
+    os.replace(staged, path)
+
+
+def record_duration(metric: str, label: str, seconds: float) -> None:
+    """Record the duration of a charm operation, e.g. a hook or a reload.
+
+    Nothing is recorded until the exporter is installed and has created the
+    metrics directory.
+    """
+    if not Path(METRICS_DIR).is_dir():
+        return
+    try:
+        try:
+            durations = json.loads(Path(DURATIONS_FILE).read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            durations = {}
+        values = durations.setdefault(metric, {}).setdefault(label, {"sum": 0.0, "count": 0})
+        values["sum"] += seconds
+        values["count"] += 1
+        values["last"] = seconds
+        _write(Path(DURATIONS_FILE), json.dumps(durations))
+        _write(Path(TEXTFILE), _render(durations))
+    except OSError as e:
+        logger.warning("Failed to record %s %s duration: %s", label, metric, e)
+
+
+@contextlib.contextmanager
+def timed(metric: str, label: str):
+    """Record the duration of the wrapped block."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record_duration(metric, label, time.monotonic() - start)
@@ -0,0 +1,122 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Generation of conserver.passwd entries from plaintext credentials.
+
+Passwords are hashed with SHA-512 crypt, which conserver checks with crypt(3).
+Hashing is deliberately slow, so hashes are cached by a keyed digest of the
+credentials, and a change to a few users of thousands only hashes those.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import subprocess
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PASSWD_CACHE = "/var/lib/conserver-charm/passwd-cache.json"
+# Key of the users in the content of the users secret
+USERS_KEY = "users"
+
+
+class PasswdError(ValueError):
+    """Raised when the users cannot be turned into conserver.passwd entries."""
+
+
+def parse_users(contents: str) -> dict[str, str]:
+    """Parse `username:password` lines into passwords by user name."""
+    users = {}
+    for number, line in enumerate(contents.splitlines(), start=1):
+        if not line.strip() or line.startswith("#"):
+            continue
+        name, sep, password = line.partition(":")
+        if not sep or not name or not password:
+            raise PasswdError(f"Invalid user on line {number}, expected username:password")
+        users[name] = password
+    return users
+
+
+def crypt_passwords(passwords: list[str]) -> list[str]:
+    """Hash passwords with SHA-512 crypt and a random salt each, in a single process."""
+    if not passwords:
+        return []
+    try:
+        stdout = subprocess.check_output(
+            ["openssl", "passwd", "-6", "-stdin"], input="\n".join(passwords) + "\n", text=True
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise PasswdError(f"Failed to hash passwords: {e}") from e
+    hashes = stdout.splitlines()
+    if len(hashes) != len(passwords):
+        raise PasswdError(f"Got {len(hashes)} password hashes for {len(passwords)} passwords")
+    return hashes
+
+
+@dataclass
+class HashCache:
+    """Password hashes by user, with the keyed digest of the credentials they hash.
+
+    The digests are keyed with a random key of the unit, so that the cache does
+    not hold fast, unsalted hashes of the passwords.
+    """
+
+    key: str = field(default_factory=lambda: secrets.token_hex(32))
+    entries: dict[str, tuple[str, str]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "HashCache":
+        """Load a cache, or get an empty one if it is missing or corrupted."""
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            return cls(
+                key=data["key"],
+                entries={
+                    user: (digest, hash_) for user, (digest, hash_) in data["entries"].items()
+                },
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls()
+
+    def save(self, path: Path) -> None:
+        """Save the cache, only readable by root."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        staged = path.with_name(f".{path.name}.tmp")
+        fd = os.open(staged, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "entries": self.entries}, f)
+        os.replace(staged, path)
+
+    def _digest(self, user: str, password: str) -> str:
+        message = f"{user}:{password}".encode()
+        return hmac.new(bytes.fromhex(self.key), message, hashlib.sha256).hexdigest()
+
+    def hash_users(self, users: Mapping[str, str]) -> dict[str, str]:
+        """Get the password hash of each user, only hashing new or changed credentials."""
+        digests = {user: self._digest(user, password) for user, password in users.items()}
+        stale = [user for user in users if self.entries.get(user, ("", ""))[0] != digests[user]]
+        if stale:
+            logger.info("Hashing the passwords of %d of %d users", len(stale), len(users))
+        hashes = crypt_passwords([users[user] for user in stale])
+        self.entries = {user: self.entries[user] for user in users if user not in stale}
+        self.entries.update((user, (digests[user], hash_)) for user, hash_ in zip(stale, hashes))
+        return {user: self.entries[user][1] for user in sorted(users)}
+
+
+def render_passwd(hashes: Mapping[str, str], contents: str = "") -> str:
+    """Render conserver.passwd entries for the hashes, after the other entries of a file.
+
+    Entries of the file for the same users are replaced.
+    """
+    lines = [
+        line
+        for line in contents.splitlines()
+        if line.startswith("#") or line.partition(":")[0] not in hashes
+    ]
+    lines += [f"{user}:{hash_}" for user, hash_ in hashes.items()]
+    return "\n".join(lines) + "\n" if lines else ""
@@ -0,0 +1,62 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Decompression and verification of configuration file payloads."""
+
+import gzip
+import hashlib
+import subprocess
+from pathlib import Path
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+CHUNK_SIZE = 1024 * 1024
+
+
+class ChecksumError(ValueError):
+    """Raised when a payload does not match its expected checksum."""
+
+
+def decompress(data: bytes) -> bytes:
+    """Decompress gzip or zstd compressed data, or return it as is if uncompressed."""
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    if data.startswith(ZSTD_MAGIC):
+        return subprocess.run(
+            ["zstd", "--decompress", "--stdout"], input=data, capture_output=True, check=True
+        ).stdout
+    return data
+
+
+def decompress_file(src: Path, dest: Path) -> str:
+    """Decompress a file into another one, in chunks.
+
+    Returns:
+        The SHA-256 digest of the decompressed contents.
+    """
+    with src.open("rb") as f:
+        magic = f.read(len(ZSTD_MAGIC))
+    digest = hashlib.sha256()
+    process = None
+    if magic.startswith(ZSTD_MAGIC):
+        process = subprocess.Popen(
+            ["zstd", "--decompress", "--stdout", str(src)], stdout=subprocess.PIPE
+        )
+        stream = process.stdout
+    elif magic.startswith(GZIP_MAGIC):
+        stream = gzip.open(src, "rb")
+    else:
+        stream = src.open("rb")
+    assert stream is not None
+    with stream, dest.open("wb") as out:
+        while chunk := stream.read(CHUNK_SIZE):
+            digest.update(chunk)
+            out.write(chunk)
+    if process is not None and process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+    return digest.hexdigest()
+
+
+def verify_checksum(digest: str, expected: str) -> None:
+    """Check a SHA-256 digest against the expected one, if any."""
+    if expected and digest != expected.strip().lower():
+        raise ChecksumError(f"SHA-256 checksum mismatch: expected {expected}, got {digest}")
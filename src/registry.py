@@ -0,0 +1,117 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Consoles registered by other charms through the consoles relation.
+
+Each unit of a related application publishes the consoles of its machines in
+its unit databag, as a JSON object in the inventory format::
+
+    {"node1": {"bmc": "10.0.0.1", "group": "rack1", "type": "ipmi",
+               "credentials-secret": "secret:..."}}
+
+The `credentials-secret` is a Juju secret granted to this application, whose
+`username` and `password` are rendered as those of an ipmi console.
+
+Only the settings of ipmi consoles are accepted: the consoles are rendered
+into conserver.cf, where settings such as `exec` would let any related
+application run commands on the unit.
+"""
+
+import json
+import logging
+import re
+import time
+from collections.abc import Iterable
+
+from pydantic import TypeAdapter, ValidationError
+
+from inventory import InventoryConsole
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_RELATION = "consoles"
+CONSOLES_KEY = "consoles"
+CREDENTIALS_KEY = "credentials-secret"
+# Render at the latest after this many quiet periods, when registrations never settle
+MAX_WAIT_PERIODS = 10
+# Settings a registered console may have besides its BMC address and group
+ALLOWED_SETTINGS = frozenset(
+    {"host", "type", "ipmiciphersuite", "ipmikg", "ipmiprivlevel", "ipmiworkaround"}
+)
+CONSOLE_TYPE = "ipmi"
+
+# Console names end up in log file paths, and BMC addresses in the commands
+# of exec consoles through execsubst
+_NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*")
+_HOST_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9.:-]*")
+
+_consoles_adapter = TypeAdapter(dict[str, InventoryConsole])
+
+
+class RegistrationError(ValueError):
+    """Raised when the consoles published by a unit are invalid."""
+
+
+def parse_registration(data: str) -> dict[str, InventoryConsole]:
+    """Parse the consoles published by a unit."""
+    try:
+        return _consoles_adapter.validate_python(json.loads(data))
+    except (ValueError, ValidationError) as e:
+        raise RegistrationError(str(e)) from e
+
+
+def check_registered(name: str, console: InventoryConsole) -> None:
+    """Check that a registered console only has the settings of an ipmi console."""
+    if not _NAME_RE.fullmatch(name):
+        raise RegistrationError(f"invalid console name {name!r}")
+    settings = dict(console.model_extra or {})
+    settings.pop(CREDENTIALS_KEY, None)
+    denied = sorted(settings.keys() - ALLOWED_SETTINGS)
+    if denied:
+        raise RegistrationError(f"settings not allowed for console {name}: {', '.join(denied)}")
+    if settings.get("type", CONSOLE_TYPE) != CONSOLE_TYPE:
+        raise RegistrationError(f"console {name} is not an {CONSOLE_TYPE} console")
+    for host in (console.bmc, settings.get("host", "")):
+        if host and not (isinstance(host, str) and _HOST_RE.fullmatch(host)):
+            raise RegistrationError(f"invalid BMC address for console {name}: {host!r}")
+
+
+def merge_registrations(
+    registrations: Iterable[tuple[str, str]],
+) -> dict[str, InventoryConsole]:
+    """Merge the consoles published by units, given as (unit name, data) pairs.
+
+    A console registered by several units is kept from the first one by unit
+    name, so that the result does not depend on the order of the relation events.
+    """
+    consoles: dict[str, InventoryConsole] = {}
+    owners: dict[str, str] = {}
+    for unit, data in sorted(registrations):
+        try:
+            registered = parse_registration(data)
+        except RegistrationError as e:
+            logger.warning("Ignoring invalid consoles registered by %s: %s", unit, e)
+            continue
+        for name, console in registered.items():
+            try:
+                check_registered(name, console)
+            except RegistrationError as e:
+                logger.warning("Ignoring console registered by %s: %s", unit, e)
+                continue
+            if name in consoles:
+                logger.warning("Console %s registered by %s and %s", name, owners[name], unit)
+                continue
+            consoles[name] = console
+            owners[name] = unit
+    return consoles
+
+
+def render_due(pending_since: float, changed_at: float, delay: float) -> bool:
+    """Check whether pending registrations should be rendered.
+
+    Registrations are rendered once they did not change for `delay` seconds,
+    so that a burst of units joining only causes one render and reload.
+    """
+    if not pending_since:
+        return False
+    now = time.time()
+    return now - changed_at >= delay or now - pending_since >= delay * MAX_WAIT_PERIODS
@@ -0,0 +1,72 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Consistent hashing of consoles across conserver units."""
+
+import bisect
+import hashlib
+from collections.abc import Iterable, Mapping
+
+from conserver_cf import Block, ConserverCf
+
+# Number of points each unit gets on the hash ring, to even out the distribution
+REPLICAS = 128
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to nodes.
+
+    Adding or removing a node only moves about 1/N of the keys to other nodes.
+    """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = REPLICAS):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        """Get the node owning the given key."""
+        if not self._nodes:
+            raise ValueError("Hash ring has no nodes")
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def shard_consoles(model: ConserverCf, addresses: Mapping[str, str]) -> ConserverCf:
+    """Assign each console to a unit by rewriting its `master` directive.
+
+    `addresses` maps unit names to the address conserver listens on in that
+    unit. Every unit renders the same file: conserver manages the consoles whose
+    master is one of its own addresses and redirects clients for the others.
+    """
+    ring = HashRing(addresses)
+    blocks = []
+    for block in model.blocks:
+        if block.kind == "console":
+            # `master` goes last so that it overrides any value set by `include`
+            items = tuple(item for item in block.items if item[0] != "master")
+            master = addresses[ring.node_for(block.name)]
+            block = Block(block.kind, block.name, (*items, ("master", master)))
+        blocks.append(block)
+    return ConserverCf(blocks)
+
+
+def partition_consoles(model: ConserverCf, parts: Iterable[str]) -> dict[str, ConserverCf]:
+    """Split the consoles into one conserver.cf model per part.
+
+    Every part keeps all the non-console blocks, so that consoles can still
+    include defaults and access rules.
+    """
+    parts = list(parts)
+    ring = HashRing(parts)
+    models = {part: ConserverCf() for part in parts}
+    for block in model.blocks:
+        if block.kind == "console":
+            models[ring.node_for(block.name)].blocks.append(block)
+        else:
+            for part in models.values():
+                part.blocks.append(block)
+    return models
@@ -0,0 +1,53 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Tracing spans of the charm and its workload.
+
+Spans are created with the OpenTelemetry API, and exported by the tracing
+extra of ops to the destination set up by the charm. ops already traces every
+hook and event handler, the spans here break down their time.
+"""
+
+import functools
+from collections.abc import Callable
+from typing import TypeVar
+
+import opentelemetry.trace
+
+tracer = opentelemetry.trace.get_tracer("conserver-charm")
+
+T = TypeVar("T")
+
+
+def _span(name: str, func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracer.start_as_current_span(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def traced(cls: type[T]) -> type[T]:
+    """Wrap each method and property of a class in a span named after it."""
+    for name, member in list(vars(cls).items()):
+        if name.startswith("__"):
+            continue
+        span_name = f"{cls.__name__}.{name}"
+        if isinstance(member, staticmethod):
+            setattr(cls, name, staticmethod(_span(span_name, member.__func__)))
+        elif isinstance(member, functools.cached_property):
+            wrapped = functools.cached_property(_span(span_name, member.func))
+            wrapped.__set_name__(cls, name)
+            setattr(cls, name, wrapped)
+        elif isinstance(member, property) and member.fget is not None:
+            setattr(cls, name, member.getter(_span(span_name, member.fget)))
+        elif callable(member) and not isinstance(member, type):
+            setattr(cls, name, _span(span_name, member))
+    return cls
+
+
+def set_attributes(**attributes: str | int | float | bool) -> None:
+    """Set attributes of the current span, e.g. the size of a file it handles."""
+    span = opentelemetry.trace.get_current_span()
+    for key, value in attributes.items():
+        span.set_attribute(f"conserver.{key}", value)
@@ -0,0 +1,128 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Resource limits and kernel settings sized for the number of consoles."""
+
+import math
+from dataclasses import dataclass
+
+# conserver forks a child process for every 16 consoles by default (-m), and
+# each child listens on its own port from the base port
+CONSOLES_PER_CHILD = 16
+MAX_PORT = 65535
+# Hash partitioning does not spread consoles evenly across instances
+INSTANCE_SKEW = 1.25
+
+# A console uses a pty or socket, its logfile, and the sockets of its clients
+FDS_PER_CONSOLE = 8
+BASE_FDS = 1024
+# A console runs its exec command, e.g. ipmitool, which may be respawning
+TASKS_PER_CONSOLE = 2
+BASE_TASKS = 256
+DEFAULT_WEIGHT = 100
+MAX_WEIGHT = 1000
+CONSOLES_PER_WEIGHT = 1000
+
+
+class CapacityError(ValueError):
+    """Raised when the consoles do not fit in the available resources."""
+
+
+def _bucket(value: int) -> int:
+    """Round up to a power of two, so that limits only change with large scale changes."""
+    return 1 << max(0, value - 1).bit_length()
+
+
+@dataclass(frozen=True)
+class ResourcePlan:
+    """Resource limits of the conserver processes for a number of consoles."""
+
+    consoles: int
+    instances: int
+    port: int
+    base_port: int
+    port_range: int
+
+    @property
+    def consoles_per_instance(self) -> int:
+        """Get the expected maximum number of consoles of an instance."""
+        if self.instances == 1:
+            return self.consoles
+        return math.ceil(self.consoles / self.instances * INSTANCE_SKEW)
+
+    @property
+    def children(self) -> int:
+        """Get the number of child processes, and ports, of an instance."""
+        return max(1, math.ceil(self.consoles_per_instance / CONSOLES_PER_CHILD))
+
+    @property
+    def nofile(self) -> int:
+        """Get the open file limit of an instance."""
+        return _bucket(BASE_FDS + FDS_PER_CONSOLE * self.consoles_per_instance)
+
+    @property
+    def tasks(self) -> int:
+        """Get the task limit of an instance."""
+        return _bucket(BASE_TASKS + TASKS_PER_CONSOLE * self.consoles_per_instance)
+
+    @property
+    def weight(self) -> int:
+        """Get the CPU and IO weight of an instance, higher than other services at scale."""
+        weight = DEFAULT_WEIGHT * _bucket(math.ceil(self.consoles / CONSOLES_PER_WEIGHT))
+        return min(MAX_WEIGHT, weight)
+
+    @property
+    def child_ports(self) -> list[range]:
+        """Get the ports of the child processes of each instance."""
+        return [
+            range(start, start + self.children)
+            for start in (self.base_port + i * self.port_range for i in range(self.instances))
+        ]
+
+    @property
+    def available_ports(self) -> int:
+        """Get the number of ports available to the child processes of each instance."""
+        last_base_port = self.base_port + (self.instances - 1) * self.port_range
+        available = MAX_PORT - last_base_port + 1
+        if self.instances > 1:
+            available = min(available, self.port_range)
+        return max(0, available)
+
+    @property
+    def port_capacity(self) -> int:
+        """Get the number of consoles the available ports can serve."""
+        consoles = self.available_ports * CONSOLES_PER_CHILD
+        if self.instances == 1:
+            return consoles
+        return int(consoles * self.instances / INSTANCE_SKEW)
+
+    def check(self) -> None:
+        """Check that each instance has enough ports for its child processes."""
+        available = self.available_ports
+        if self.children > available:
+            raise CapacityError(
+                f"{self.consoles} consoles need {self.children} ports per instance "
+                f"from base-port {self.base_port}, only {available} available"
+            )
+        for port in range(self.port, self.port + self.instances):
+            if any(port in ports for ports in self.child_ports):
+                raise CapacityError(
+                    f"port {port} is used by the child processes from base-port {self.base_port}"
+                )
+
+    def render_dropin(self) -> str:
+        """Render the systemd drop-in of the conserver services."""
+        return (
+            "# Managed by the conserver charm\n"
+            "[Service]\n"
+            f"LimitNOFILE={self.nofile}\n"
+            f"TasksMax={self.tasks}\n"
+            f"CPUWeight={self.weight}\n"
+            f"IOWeight={self.weight}\n"
+        )
+
+    def render_sysctl(self) -> str:
+        """Render the kernel settings reserving the ports of the conserver child processes."""
+        # Keep the child ports out of the ephemeral range used by outgoing
+        # connections, which the default base port is in
+        ranges = ",".join(f"{ports.start}-{ports.stop - 1}" for ports in self.child_ports)
+        return f"# Managed by the conserver charm\nnet.ipv4.ip_local_reserved_ports = {ranges}\n"
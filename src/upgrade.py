@@ -0,0 +1,65 @@
+# Copyright 2025 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Rolling upgrades of the conserver packages across units.
+
+Each unit that needs to upgrade requests it in its peer relation data, and
+the leader grants the turn to one unit at a time. The consoles of the unit
+holding the turn move to the other units before it restarts conserver, so
+that clients reconnect to a peer instead of losing their consoles: the unit
+publishes that it is draining, and only upgrades once each unit taking over
+its consoles acknowledged it. In active-standby mode, the active unit goes
+last and first fails over to a standby unit.
+"""
+
+from collections.abc import Mapping
+
+# Key of the version a unit waits to upgrade to, in its peer relation data
+UPGRADE_KEY = "upgrade"
+# Key of the unit whose turn it is to upgrade, in the application data
+TURN_KEY = "upgrading"
+# Key of the version the unit holding the turn drains its consoles for, in its
+# peer relation data
+DRAINING_KEY = "draining"
+# Key of the draining unit whose consoles a unit took over, in its peer relation data
+TAKEOVER_KEY = "took-over"
+# Key of the unit active in place of the leader in active-standby mode, once
+# the active unit failed over to upgrade, in the application data
+ACTIVE_KEY = "active"
+
+
+def _unit_number(unit: str) -> int:
+    return int(unit.rpartition("/")[2])
+
+
+def next_turn(requests: Mapping[str, str], current: str, last: str = "") -> str:
+    """Get the unit whose turn it is to upgrade.
+
+    Args:
+        requests: version each unit waits to upgrade to, empty if none, by unit name.
+        current: unit holding the turn, which keeps it until it upgraded.
+        last: unit to upgrade after all the others, such as the active unit.
+
+    Returns:
+        The unit holding the turn, or an empty string if no unit waits.
+    """
+    waiting = [unit for unit, version in requests.items() if version]
+    if current in waiting:
+        return current
+    waiting.sort(key=lambda unit: (unit == last, _unit_number(unit)))
+    return waiting[0] if waiting else ""
+
+
+def takeover_unit(requests: Mapping[str, str], active: str) -> str:
+    """Get the standby unit the active unit fails over to before it upgrades.
+
+    Args:
+        requests: version each unit waits to upgrade to, empty if none, by unit name.
+        active: active unit, about to upgrade.
+
+    Returns:
+        The lowest unit already upgraded, or else waiting, or an empty string
+        if the active unit is the only one.
+    """
+    standby = [unit for unit in requests if unit != active]
+    standby.sort(key=lambda unit: (bool(requests[unit]), _unit_number(unit)))
+    return standby[0] if standby else ""
@@ -2,7 +2,7 @@ resource "juju_application" "conserver" {
   name        = var.app_name
   constraints = var.constraints
   model       = var.juju_model
-  units       = 1
+  units       = var.units
 
   charm {
     name     = "conserver"
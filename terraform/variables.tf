@@ -32,6 +32,12 @@ variable "passwd_file" {
   sensitive   = true
 }
 
+variable "units" {
+  description = "Number of units to deploy, consoles are sharded across all of them"
+  type        = number
+  default     = 1
+}
+
 variable "revision" {
   description = "Revision number of the charm"
   type        = number
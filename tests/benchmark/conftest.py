@@ -0,0 +1,111 @@
+import base64
+import json
+import logging
+import os
+import subprocess
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from ops import testing
+
+import conserver
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SIZES = [100, 1_000, 10_000, 50_000]
+
+RESULTS: list[dict] = []
+
+
+def generate_config(consoles: int) -> str:
+    """Generate a conserver.cf file with the given number of IPMI consoles."""
+    lines = [
+        "default ipmi {\n",
+        "  type exec;\n",
+        '  exec "ipmitool -I lanplus -H H -U admin -f /etc/conserver/ipmi.pass sol activate";\n',
+        "  execsubst H=hs;\n",
+        "  rw *;\n",
+        "}\n",
+    ]
+    for i in range(consoles):
+        host = f"10.{i >> 16}.{i >> 8 & 255}.{i & 255}"
+        lines.append(f"console node{i} {{\n  include ipmi;\n  host {host};\n}}\n")
+    return "".join(lines)
+
+
+def _check_output(args: list[str], **kwargs) -> str:
+    """Stand-in for the conserver and systemctl commands run by the charm."""
+    if args[0] == "systemctl":
+        services = args[args.index("--") + 1 :]
+        return "\n\n".join("ActiveState=active" for _ in services) + "\n"
+    if args[0] == "conserver":
+        return "conserver: conserver.com version 8.2.6\n"
+    raise subprocess.CalledProcessError(1, args)
+
+
+@pytest.fixture
+def workload(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Run the real Conserver class against fake apt, systemd and a temporary /etc."""
+    for name in ("SERVER_CONF", "CONSERVER_CF", "CONSERVER_PASSWD", "CONSERVER_BIN"):
+        monkeypatch.setattr(conserver, name, str(tmp_path / Path(getattr(conserver, name)).name))
+    for name in (
+        "INSTANCE_SERVER_CONF",
+        "INSTANCE_CONSERVER_CF",
+        "INSTANCE_UNIT_FILE",
+        "EXPORTER_UNIT_FILE",
+        "LOGROTATE_CONF",
+        "LOGROTATE_UNIT_FILE",
+        "LOGROTATE_TIMER_FILE",
+        "PACKAGE_LOGROTATE_CONF",
+    ):
+        monkeypatch.setattr(conserver, name, str(tmp_path / Path(getattr(conserver, name)).name))
+    monkeypatch.setattr(conserver, "LIMITS_DROPIN", str(tmp_path / "{unit}.d" / "limits.conf"))
+    monkeypatch.setattr(conserver, "SYSCTL_CONF", str(tmp_path / "sysctl.conf"))
+    monkeypatch.setattr(conserver, "CONF_D", str(tmp_path / "conf.d"))
+    monkeypatch.setattr(conserver, "METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path / "metrics"))
+    for name in ("DURATIONS_FILE", "TEXTFILE"):
+        monkeypatch.setattr(
+            metrics, name, str(tmp_path / "metrics" / Path(getattr(metrics, name)).name)
+        )
+    with (
+        patch("conserver.apt.DebianPackage.from_system"),
+        patch("conserver.systemd", MagicMock()),
+        patch("conserver.subprocess.check_output", side_effect=_check_output),
+        patch("conserver.subprocess.run", return_value=MagicMock(returncode=0)),
+        patch("conserver.os.fchown"),
+        patch("conserver.os.chown"),
+        patch("conserver.pwd.getpwnam"),
+        # The fake services never fail, watching them after a reload only sleeps
+        patch("conserver.Conserver.settle"),
+    ):
+        yield tmp_path
+
+
+@pytest.fixture(scope="session")
+def results():
+    """Collect benchmark results, written as JSON at the end of the session."""
+    yield RESULTS
+    path = Path(os.environ.get("BENCHMARK_RESULTS", "benchmark-results.json"))
+    path.write_text(json.dumps(RESULTS, indent=2) + "\n", encoding="utf-8")
+    logger.info("Wrote %d benchmark results to %s", len(RESULTS), path)
+
+
+@pytest.fixture(params=SIZES, ids=lambda size: f"{size}-consoles")
+def config(request: pytest.FixtureRequest):
+    """Return the number of consoles, the conserver.cf contents and its config value."""
+    contents = generate_config(request.param)
+    return request.param, contents, base64.b64encode(contents.encode()).decode()
+
+
+@pytest.fixture
+def resources(workload: Path):
+    """Return the config-file and passwd-file resources, empty as published."""
+    paths = {
+        name: workload / f"{name}-resource" for name in ("config-file", "passwd-file", "packages")
+    }
+    for path in paths.values():
+        path.touch()
+    return {testing.Resource(name=name, path=path) for name, path in paths.items()}
@@ -0,0 +1,104 @@
+"""Hook latency and memory benchmarks, against generated conserver.cf files."""
+
+import gc
+import json
+import time
+import tracemalloc
+
+import pytest
+from ops import testing
+
+from charm import ConserverCharm
+from config import PASSWD_FILE
+from conserver import file_digest
+
+
+def measure(ctx: testing.Context, event, state: testing.State):
+    """Run an event, returning the output state, the wall time and the peak memory."""
+    gc.collect()
+    start = time.perf_counter()
+    state_out = ctx.run(event, state)
+    wall_time = time.perf_counter() - start
+    # Memory is traced in a separate run, as tracing slows down the hook
+    gc.collect()
+    tracemalloc.start()
+    ctx.run(event, state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return state_out, wall_time, peak
+
+
+def record(results: list[dict], hook: str, consoles: int, wall_time: float, peak: int):
+    """Record the result of a benchmark."""
+    results.append(
+        {"hook": hook, "consoles": consoles, "wall_time_s": wall_time, "peak_memory_bytes": peak}
+    )
+    print(f"{hook:>26} {consoles:>6} consoles: {wall_time * 1000:9.1f} ms {peak / 2**20:8.1f} MiB")
+
+
+@pytest.mark.parametrize("hook", ["install", "start", "stop"])
+def test_hook(hook: str, config, resources, results):
+    consoles, _, encoded = config
+    ctx = testing.Context(ConserverCharm)
+    state = testing.State(resources=resources, config={"config-file": encoded})
+    _, wall_time, peak = measure(ctx, getattr(ctx.on, hook)(), state)
+    record(results, hook, consoles, wall_time, peak)
+
+
+def test_config_changed(config, resources, results):
+    consoles, _, encoded = config
+    ctx = testing.Context(ConserverCharm)
+    state = testing.State(resources=resources, config={"config-file": encoded})
+    _, wall_time, peak = measure(ctx, ctx.on.config_changed(), state)
+    record(results, "config-changed", consoles, wall_time, peak)
+
+
+def test_config_changed_unchanged(config, resources, results):
+    consoles, contents, encoded = config
+    ctx = testing.Context(ConserverCharm)
+    stored = testing.StoredState(
+        owner_path="ConserverCharm",
+        content={
+            "config_digest": file_digest(contents),
+            "passwd_digest": file_digest(PASSWD_FILE),
+        },
+    )
+    state = testing.State(
+        resources=resources, config={"config-file": encoded}, stored_states={stored}
+    )
+    _, wall_time, peak = measure(ctx, ctx.on.config_changed(), state)
+    record(results, "config-changed-unchanged", consoles, wall_time, peak)
+
+
+def test_config_changed_one_console(config, resources, workload, results):
+    consoles, contents, encoded = config
+    (workload / "conserver.cf").write_text(contents.replace("host 10.0.0.0;", "host 10.9.9.9;"))
+    ctx = testing.Context(ConserverCharm)
+    stored = testing.StoredState(
+        owner_path="ConserverCharm",
+        content={"config_digest": "outdated", "passwd_digest": file_digest(PASSWD_FILE)},
+    )
+    state = testing.State(
+        resources=resources, config={"config-file": encoded}, stored_states={stored}
+    )
+    _, wall_time, peak = measure(ctx, ctx.on.config_changed(), state)
+    record(results, "config-changed-one-console", consoles, wall_time, peak)
+
+
+def test_config_changed_inventory(config, resources, results):
+    consoles, _, _ = config
+    inventory = {
+        "defaults": {
+            "type": "exec",
+            "exec": "ipmitool -I lanplus -H H -U admin -f /etc/conserver/ipmi.pass sol activate",
+            "execsubst": "H=hs",
+            "rw": "*",
+        },
+        "consoles": {
+            f"node{i}": f"10.{i >> 16}.{i >> 8 & 255}.{i & 255}" for i in range(consoles)
+        },
+    }
+    ctx = testing.Context(ConserverCharm)
+    state = testing.State(resources=resources, config={"inventory": json.dumps(inventory)})
+    _, wall_time, peak = measure(ctx, ctx.on.config_changed(), state)
+    record(results, "config-changed-inventory", consoles, wall_time, peak)
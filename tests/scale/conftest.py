@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+from pathlib import Path
+
+import pytest
+from harness import BASE_PORT, FAKE_CONSOLE, SIZES, Server, free_port, render_config
+
+logger = logging.getLogger(__name__)
+
+RESULTS: list[dict] = []
+
+
+@pytest.fixture(scope="session")
+def conserver_bin() -> str:
+    """Return the path of the conserver binary, skipping the harness without it."""
+    path = shutil.which("conserver") or shutil.which("conserver", path="/usr/sbin")
+    if path is None or shutil.which("console") is None:
+        pytest.skip("conserver-server and conserver-client are not installed")
+    return path
+
+
+@pytest.fixture(scope="session")
+def results():
+    """Collect the results, written as JSON at the end of the session."""
+    yield RESULTS
+    path = Path(os.environ.get("SCALE_RESULTS", "scale-results.json"))
+    path.write_text(json.dumps(RESULTS, indent=2) + "\n", encoding="utf-8")
+    logger.info("Wrote %d scale results to %s", len(RESULTS), path)
+
+
+@pytest.fixture(params=SIZES, ids=lambda size: f"{size}-consoles")
+def consoles(request: pytest.FixtureRequest) -> int:
+    """Return the number of fake consoles."""
+    return request.param
+
+
+@pytest.fixture
+def workdir(tmp_path: Path) -> Path:
+    """Return a directory with the fake console script, and an empty passwd file."""
+    script = tmp_path / "fake-console"
+    script.write_text(FAKE_CONSOLE, encoding="utf-8")
+    script.chmod(0o755)
+    (tmp_path / "conserver.passwd").touch()
+    (tmp_path / "logs").mkdir()
+    return tmp_path
+
+
+@pytest.fixture
+def server(conserver_bin: str, consoles: int, workdir: Path):
+    """Run conserver with the charm's rendered conserver.cf for the fake consoles."""
+    config = workdir / "conserver.cf"
+    config.write_text(render_config(consoles, workdir), encoding="utf-8")
+    port = free_port()
+    command = [conserver_bin, "-C", str(config), "-P", str(workdir / "conserver.passwd")]
+    command += ["-M", "127.0.0.1", "-p", str(port), "-b", str(BASE_PORT)]
+    # In its own session, to stop the fake consoles along with conserver
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.DEVNULL,
+        stderr=(workdir / "conserver.log").open("w"),
+        start_new_session=True,
+    )
+    try:
+        yield Server(process, port, config)
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
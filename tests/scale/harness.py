@@ -0,0 +1,148 @@
+"""Helpers of the scale harness, running conserver with fake consoles."""
+
+import base64
+import json
+import os
+import signal
+import socket
+import subprocess
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from unittest.mock import patch
+
+from ops import testing
+
+from charm import ConserverCharm
+from exporter import parse_console_users
+
+SIZES = [int(size) for size in os.environ.get("SCALE_CONSOLES", "1000,5000").split(",")]
+# Output of each fake console, in lines per second and bytes per line
+RATE = float(os.environ.get("SCALE_RATE", "1"))
+LINE_SIZE = int(os.environ.get("SCALE_LINE_SIZE", "80"))
+# First port of the conserver child processes, 16 consoles per child
+BASE_PORT = int(os.environ.get("SCALE_BASE_PORT", "40000"))
+
+FAKE_CONSOLE = """\
+#!/bin/sh
+# Fake console printing lines of $3 bytes at $2 lines per second
+line=$(printf "%-$(($3 - 1))s" "$1 console output")
+interval=$(awk "BEGIN {print 1 / $2}")
+while :; do
+    printf '%s\\n' "$line"
+    sleep "$interval"
+done
+"""
+
+
+def render_config(consoles: int, workdir: Path) -> str:
+    """Render the conserver.cf of fake consoles with the charm, from an inventory.
+
+    The fake console script and the logs are in the work directory.
+    """
+    inventory = {
+        "defaults": {
+            "type": "exec",
+            "exec": f"{workdir / 'fake-console'} @ {RATE} {LINE_SIZE}",
+            "execsubst": "@=hs",
+            "logfile": f"{workdir / 'logs'}/&.log",
+            "rw": "*",
+        },
+        # The fake consoles get their name as BMC address, passed to the script
+        "consoles": {f"fake{i}": f"fake{i}" for i in range(consoles)},
+    }
+    config_file = "access * {\n  trusted 127.0.0.1;\n}\n"
+    # Empty resources, as published
+    resources = set()
+    for name in ("config-file", "passwd-file", "packages"):
+        path = workdir / f"{name}-resource"
+        path.touch()
+        resources.add(testing.Resource(name=name, path=path))
+    with patch("charm.Conserver") as conserver_mock:
+        conserver_mock.return_value.read_conserver_config.return_value = ""
+        conserver_mock.return_value.write_resource_limits.return_value = False
+        ctx = testing.Context(ConserverCharm)
+        state = testing.State(
+            config={
+                "config-file": base64.b64encode(config_file.encode()).decode(),
+                "inventory": json.dumps(inventory),
+            },
+            resources=resources,
+            leader=True,
+        )
+        ctx.run(ctx.on.config_changed(), state)
+        return conserver_mock.return_value.write_conserver_config.call_args.args[0]
+
+
+def free_port() -> int:
+    """Get a free local port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid: int) -> list[int]:
+    """Get the child processes of a process."""
+    children = []
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        children += [int(child) for child in (task / "children").read_text().split()]
+    return children
+
+
+@dataclass
+class Server:
+    """A conserver process, run in the foreground with its own port."""
+
+    process: subprocess.Popen
+    port: int
+    config: Path
+
+    def console_states(self) -> dict[str, bool]:
+        """Get whether each console is up."""
+        output = subprocess.check_output(
+            ["console", "-M", "127.0.0.1", "-p", str(self.port), "-u"], text=True, timeout=30
+        )
+        return {name: up for name, (up, _) in parse_console_users(output).items()}
+
+    def wait_up(self, names: set[str], timeout: float) -> float:
+        """Wait until the given consoles are up, returning the time it took."""
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"conserver exited with {self.process.returncode}")
+            try:
+                states = self.console_states()
+            except (subprocess.SubprocessError, OSError):
+                states = {}
+            if all(states.get(name) for name in names):
+                return time.perf_counter() - start
+            time.sleep(0.5)
+        raise TimeoutError(f"Consoles not up after {timeout}s")
+
+    @property
+    def pids(self) -> list[int]:
+        """Get the conserver processes, without the fake consoles they run."""
+        pids = [self.process.pid]
+        pids += [
+            pid
+            for pid in _children(self.process.pid)
+            if Path(f"/proc/{pid}/comm").read_text().strip() == "conserver"
+        ]
+        return pids
+
+    def memory(self) -> int:
+        """Get the proportional set size of the conserver processes, in bytes."""
+        total = 0
+        for pid in self.pids:
+            for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+                if line.startswith("Pss:"):
+                    total += int(line.split()[1]) * 1024
+        return total
+
+    def fds(self) -> int:
+        """Get the number of file descriptors open by the conserver processes."""
+        return sum(len(os.listdir(f"/proc/{pid}/fd")) for pid in self.pids)
+
+    def reload(self) -> None:
+        """Make conserver reread its configuration."""
+        self.process.send_signal(signal.SIGHUP)
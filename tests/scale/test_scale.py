@@ -0,0 +1,124 @@
+"""Capacity of a real conserver running the charm's rendered config, with fake consoles."""
+
+import json
+import logging
+import os
+import select
+import statistics
+import subprocess
+import time
+from pathlib import Path
+
+from harness import LINE_SIZE, RATE, Server, render_config
+
+logger = logging.getLogger(__name__)
+
+ATTACH_SAMPLES = 10
+# Seconds the console log growth is measured over
+LOG_WINDOW = 10.0
+# Results to compare with, the tracked baseline by default
+BASELINE = Path(os.environ.get("SCALE_BASELINE", Path(__file__).parent / "baseline.json"))
+# Allowed regression against the baseline, as a factor
+TOLERANCE = float(os.environ.get("SCALE_TOLERANCE", "1.5"))
+# Metrics where lower is better, the others must not decrease
+LOWER_IS_BETTER = (
+    "startup_s",
+    "reload_s",
+    "memory_per_console_bytes",
+    "fds_per_console",
+    "attach_latency_s",
+)
+
+
+def attach_latency(server: Server, console: str) -> float:
+    """Get the time for a client to attach to a console, until conserver answers it."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        ["console", "-M", "127.0.0.1", "-p", str(server.port), "-s", console],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        assert process.stdout is not None
+        ready, _, _ = select.select([process.stdout], [], [], 30)
+        if not ready:
+            raise TimeoutError(f"No answer attaching to {console}")
+        output = os.read(process.stdout.fileno(), 4096)
+        latency = time.perf_counter() - start
+        time.sleep(0.1)
+        if process.poll() is not None:
+            raise RuntimeError(f"Failed to attach to {console}: {output.decode()}")
+        return latency
+    finally:
+        process.kill()
+        process.wait()
+
+
+def log_throughput(log_dir: Path) -> float:
+    """Get the rate the console logs grow at, in bytes per second."""
+
+    def size() -> int:
+        return sum(path.stat().st_size for path in log_dir.iterdir())
+
+    before = size()
+    time.sleep(LOG_WINDOW)
+    return (size() - before) / LOG_WINDOW
+
+
+def check_baseline(result: dict) -> None:
+    """Check the result against the baseline of the same size."""
+    baseline = json.loads(BASELINE.read_text(encoding="utf-8"))
+    previous = next((r for r in baseline if r["consoles"] == result["consoles"]), None)
+    if previous is None:
+        logger.warning("No baseline for %d consoles in %s", result["consoles"], BASELINE)
+        return
+    regressions = [
+        f"{metric}: {result[metric]:.4g} vs {previous[metric]:.4g}"
+        for metric in (*LOWER_IS_BETTER, "log_throughput_ratio")
+        if (
+            result[metric] > previous[metric] * TOLERANCE
+            if metric in LOWER_IS_BETTER
+            else result[metric] < previous[metric] / TOLERANCE
+        )
+    ]
+    assert not regressions, "Regressions against the baseline: " + ", ".join(regressions)
+
+
+def test_capacity(consoles: int, server: Server, workdir: Path, results: list[dict]):
+    names = {f"fake{i}" for i in range(consoles)}
+    timeout = 60 + consoles / 10
+    startup = server.wait_up(names, timeout)
+    memory, fds = server.memory(), server.fds()
+    latencies = [
+        attach_latency(server, f"fake{i * consoles // ATTACH_SAMPLES}")
+        for i in range(ATTACH_SAMPLES)
+    ]
+    throughput = log_throughput(workdir / "logs")
+
+    # Reload with one more console, as when a machine is registered
+    server.config.write_text(render_config(consoles + 1, workdir), encoding="utf-8")
+    server.reload()
+    reload_time = server.wait_up({f"fake{consoles}"}, timeout)
+
+    result = {
+        "consoles": consoles,
+        "startup_s": startup,
+        "reload_s": reload_time,
+        "memory_bytes": memory,
+        "memory_per_console_bytes": memory / consoles,
+        "fds": fds,
+        "fds_per_console": fds / consoles,
+        "attach_latency_s": statistics.median(latencies),
+        "attach_latency_max_s": max(latencies),
+        "log_throughput_bytes_per_s": throughput,
+        "log_throughput_ratio": throughput / (consoles * RATE * LINE_SIZE),
+    }
+    results.append(result)
+    print(
+        f"{consoles:>6} consoles: startup {startup:.1f} s, reload {reload_time:.2f} s, "
+        f"{memory / consoles / 1024:.1f} KiB and {fds / consoles:.2f} fds per console, "
+        f"attach {result['attach_latency_s'] * 1000:.1f} ms, "
+        f"logs {throughput / 1024:.0f} KiB/s ({result['log_throughput_ratio']:.0%})"
+    )
+    check_baseline(result)
@@ -0,0 +1,113 @@
+"""Unit tests for bmcprobe.py."""
+
+import asyncio
+import socket
+
+import pytest
+
+from bmcprobe import PRESENCE_PING, bmc_hosts, park_consoles, ping, unreachable_hosts
+from conserver_cf import parse_config
+
+CONSERVER_CF = """\
+default * {
+  master 10.0.0.1;
+}
+default ipmi {
+  type exec;
+  exec "ipmitool -I lanplus -H h sol activate";
+  execsubst h=hs;
+}
+console server1 {
+  include ipmi;
+  host 10.1.0.1;
+}
+console server2 {
+  type ipmi;
+  host 10.1.0.2;
+  master 10.0.0.2;
+}
+console switch1 {
+  type host;
+  host 10.2.0.1;
+}
+console server3 {
+  include ipmi;
+}
+"""
+
+
+@pytest.fixture
+def bmc():
+    """Run a fake BMC answering RMCP presence pings, and return its port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+    class Protocol(asyncio.DatagramProtocol):
+        def connection_made(self, transport):
+            self.transport = transport
+
+        def datagram_received(self, data, addr):
+            if data == PRESENCE_PING:
+                self.transport.sendto(data[:8] + bytes([0x40]) + data[9:], addr)
+
+    return sock, Protocol, port
+
+
+def _run_with_bmc(bmc, coro_factory):
+    sock, protocol, port = bmc
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(protocol, sock=sock)
+        try:
+            return await coro_factory(port)
+        finally:
+            transport.close()
+
+    return asyncio.run(main())
+
+
+def test_bmc_hosts():
+    """Test that only IPMI consoles with a host are probed, with inherited settings."""
+    model = parse_config(CONSERVER_CF)
+    assert bmc_hosts(model) == {"server1": "10.1.0.1", "server2": "10.1.0.2"}
+    assert bmc_hosts(model, "10.0.0.2") == {"server2": "10.1.0.2"}
+
+
+def test_park_consoles():
+    """Test that parked consoles are only connected on demand."""
+    model = park_consoles(parse_config(CONSERVER_CF), ["server1"])
+    assert model.consoles["server1"].items[-1] == ("options", "ondemand")
+    assert ("options", "ondemand") not in model.consoles["server2"].items
+
+
+def test_ping(bmc):
+    """Test that a BMC answering presence pings is reachable."""
+    assert _run_with_bmc(bmc, lambda port: ping("127.0.0.1", port, timeout=1))
+
+
+def test_ping_timeout():
+    """Test that a BMC not answering is unreachable."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    try:
+        assert not asyncio.run(ping("127.0.0.1", sock.getsockname()[1], timeout=0.05))
+    finally:
+        sock.close()
+
+
+def test_ping_invalid_host():
+    """Test that a BMC whose address cannot be resolved is unreachable."""
+    assert not asyncio.run(ping("bmc.invalid", timeout=0.05))
+
+
+def test_unreachable_hosts(bmc):
+    """Test that BMCs are probed concurrently."""
+    unreachable = _run_with_bmc(
+        bmc,
+        lambda port: unreachable_hosts(
+            ["127.0.0.1", "127.0.0.1", "bmc.invalid"], concurrency=2, port=port, timeout=1
+        ),
+    )
+    assert unreachable == {"bmc.invalid"}
@@ -0,0 +1,86 @@
+"""Unit tests for bulk.py."""
+
+import asyncio
+from unittest.mock import patch
+
+from bulk import DETACH, Result, client_command, run_operation, select_consoles
+from conserver_cf import parse_config
+
+CONFIG = """\
+default rack1 { type exec; }
+console a1 { include rack1; master 10.0.0.1; }
+console a2 { include rack1; master 10.0.0.2; }
+console b1 { master 10.0.0.1; }
+"""
+
+
+def test_select_consoles():
+    """Test that consoles are selected by name pattern, group and master."""
+    model = parse_config(CONFIG)
+    assert select_consoles(model, pattern="a*") == ["a1", "a2"]
+    assert select_consoles(model, group="rack1") == ["a1", "a2"]
+    assert select_consoles(model, pattern="*1", group="rack1") == ["a1"]
+    assert select_consoles(model, pattern="*", master="10.0.0.1") == ["a1", "b1"]
+
+
+def test_client_command():
+    """Test that reopening attaches to the console while disconnecting does not."""
+    command, stdin = client_command("reopen", "a1", 3109)
+    assert command == ["console", "-M", "127.0.0.1", "-p", "3109", "a1"]
+    assert stdin == b"\x05co" + DETACH
+    command, _ = client_command("down", "a1", 3109, force=True)
+    assert command == ["console", "-M", "127.0.0.1", "-p", "3109", "-f", "a1"]
+    command, stdin = client_command("disconnect", "a1", 3110)
+    assert command[-2:] == ["-d", "@a1"]
+    assert stdin == b""
+
+
+def _shell(script: str):
+    return lambda operation, console, port, force: (["sh", "-c", script, console], b"")
+
+
+def test_run_operation():
+    """Test that operations report the outcome and duration of each console."""
+    consoles = {"a": (3109, True, 0), "b": (3109, False, 0)}
+    script = 'echo "attached to $0"; [ "$0" = a ]'
+    with patch("bulk.client_command", _shell(script)):
+        results = asyncio.run(run_operation("reopen", consoles, 2, 5))
+    assert [(r.console, r.ok, r.message) for r in results] == [
+        ("a", True, "attached to a"),
+        ("b", False, "attached to b"),
+    ]
+    assert all(r.seconds > 0 for r in results)
+
+
+def test_run_operation_timeout():
+    """Test that consoles whose client hangs are reported as timed out."""
+    with patch("bulk.client_command", _shell("sleep 5")):
+        results = asyncio.run(run_operation("down", {"a": (3109, True, 0)}, 1, 0.1))
+    assert not results[0].ok
+    assert results[0].message == "Timed out after 0.1s"
+
+
+def test_run_operation_status():
+    """Test that status and up on up consoles run no client."""
+    consoles = {"a": (3109, True, 2), "b": (3109, False, 0)}
+    with patch("bulk.client_command", _shell("exit 1")):
+        assert asyncio.run(run_operation("status", consoles, 1, 5)) == [
+            Result("a", True, "up, 2 clients"),
+            Result("b", True, "down, 0 clients"),
+        ]
+        results = asyncio.run(run_operation("up", consoles, 1, 5))
+    assert results[0] == Result("a", True, "Already up")
+    assert not results[1].ok
+
+
+def test_run_operation_busy():
+    """Test that consoles with clients attached are only attached to when forced."""
+    consoles = {"a": (3109, True, 1), "b": (3109, True, 0)}
+    with patch("bulk.client_command", _shell("true")):
+        results = asyncio.run(run_operation("reopen", consoles, 2, 5))
+        assert results[0] == Result("a", False, "Busy, 1 clients attached")
+        assert results[1].ok
+        results = asyncio.run(run_operation("reopen", consoles, 2, 5, force=True))
+        assert all(r.ok for r in results)
+        # Disconnecting does not attach
+        assert asyncio.run(run_operation("disconnect", consoles, 2, 5))[0].ok
@@ -0,0 +1,78 @@
+"""Unit tests for capacity.py."""
+
+from pathlib import Path
+from unittest.mock import patch
+
+from capacity import Resources, Usage, measure_resources, measure_usage, project_capacity
+from tuning import ResourcePlan
+
+PLAN = ResourcePlan(consoles=100, instances=1, port=3109, base_port=33000, port_range=1000)
+
+
+def _process(
+    proc: Path, pid: int, comm: str, pss: int, fds: int, ticks: int, start: int, service: str
+):
+    """Write the /proc entries of a fake process, run by a systemd service."""
+    path = proc / str(pid)
+    (path / "fd").mkdir(parents=True)
+    (path / "cgroup").write_text(f"0::/system.slice/{service}\n")
+    for fd in range(fds):
+        (path / "fd" / str(fd)).touch()
+    (path / "comm").write_text(f"{comm}\n")
+    (path / "smaps_rollup").write_text(f"Rss: {2 * pss} kB\nPss: {pss} kB\n")
+    # utime and stime are fields 14 and 15, starttime field 22
+    fields = ["S"] + ["0"] * 10 + [str(ticks), str(ticks)] + ["0"] * 6 + [str(start)]
+    (path / "stat").write_text(f"{pid} ({comm} x) {' '.join(fields)}\n")
+
+
+@patch("capacity.os.sysconf", return_value=100)
+def test_measure_usage(_, tmp_path: Path):
+    """Test that the processes of the conserver services, with their children, are measured."""
+    (tmp_path / "uptime").write_text("1100.00 2000.00\n")
+    (tmp_path / "self").mkdir()
+    instance = "system-conserver.slice/conserver@0.service"
+    processes = [
+        (10, "conserver", 1024, 4, 5000, instance),
+        (11, "conserver", 512, 6, 0, instance),
+        # Console command run by conserver
+        (12, "ipmitool", 2048, 5, 0, instance),
+        (13, "conserver", 256, 1, 0, "conserver-server.service"),
+        (14, "sshd", 4096, 10, 5000, "ssh.service"),
+        # conserver run outside of the services, e.g. by hand
+        (15, "conserver", 4096, 10, 0, "user.slice/session-1.scope"),
+    ]
+    for pid, comm, pss, fds, ticks, service in processes:
+        _process(tmp_path, pid, comm, pss, fds, ticks, start=10_000, service=service)
+    usage = measure_usage(tmp_path)
+    assert usage == Usage(processes=4, memory=3840 * 1024, fds=16, cpu=0.1)
+
+
+@patch("capacity.os.cpu_count", return_value=4)
+def test_measure_resources(_, tmp_path: Path):
+    """Test that the free memory and file descriptors of the unit are measured."""
+    (tmp_path / "sys/fs").mkdir(parents=True)
+    (tmp_path / "sys/fs/file-nr").write_text("1000\t0\t9000\n")
+    (tmp_path / "meminfo").write_text("MemTotal: 8000 kB\nMemAvailable: 4000 kB\n")
+    assert measure_resources(tmp_path) == Resources(memory=4000 * 1024, fds=8000, cpus=4)
+
+
+def test_project_capacity():
+    """Test that the resource sustaining the fewest consoles limits the capacity."""
+    usage = Usage(processes=8, memory=100 * 2**20, fds=800, cpu=0.2)
+    resources = Resources(memory=2**30, fds=100_000, cpus=2)
+    capacity = project_capacity(100, usage, resources, PLAN)
+    assert capacity.limits == {"ports": 520_576, "memory": 919, "fds": 12_600, "cpu": 800}
+    assert capacity.max_consoles == 800
+    assert capacity.bottleneck == "cpu"
+    assert capacity.headroom == 700
+    assert capacity.headroom_percent == 87.5
+    assert capacity.per_console("fds") == 8
+
+
+def test_project_capacity_unmeasured():
+    """Test that only the ports bound the capacity without conserver processes."""
+    resources = Resources(memory=2**30, fds=100_000, cpus=2)
+    capacity = project_capacity(100, Usage(), resources, PLAN)
+    assert capacity.limits == {"ports": 520_576}
+    assert capacity.per_console("memory") == 0
+    assert project_capacity(0, Usage(), resources, PLAN).headroom == 520_576
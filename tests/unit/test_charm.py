@@ -1,20 +1,42 @@
+import base64
+import dataclasses
+import gzip
+import hashlib
+import json
 import logging
-from unittest.mock import MagicMock, patch
+from pathlib import Path
+from unittest.mock import ANY, AsyncMock, MagicMock, PropertyMock, patch
 
 import pytest
+from charmlibs import apt
 from ops import testing
 from ops.testing import errors
 
+from bulk import Result
+from capacity import Resources, Usage
 from charm import ConserverCharm
+from config import PASSWD_FILE
+from conserver import ConfigValidationError, Conserver, file_digest
+from failover import FloatingAddressError
 
 logger = logging.getLogger(__name__)
 
 
+@pytest.fixture
+def resources(tmp_path: Path) -> set[testing.Resource]:
+    """Return the config-file and passwd-file resources, empty as published."""
+    paths = {name: tmp_path / name for name in ("config-file", "passwd-file", "packages")}
+    for path in paths.values():
+        path.touch()
+    return {testing.Resource(name=name, path=path) for name, path in paths.items()}
+
+
 @patch("charm.Conserver")
-def test_invalid_base64_config_file(conserver_mock: MagicMock):
+def test_invalid_base64_config_file(conserver_mock: MagicMock, resources: set[testing.Resource]):
     """Test that the charm is blocked when config-file has invalid base64 content."""
     ctx = testing.Context(ConserverCharm)
     state_in = testing.State(
+        resources=resources,
         config={"config-file": "invalid-base64"},
         leader=True,
     )
@@ -24,10 +46,13 @@ def test_invalid_base64_config_file(conserver_mock: MagicMock):
 
 
 @patch("charm.Conserver")
-def test_invalid_base64_passwd_file(conserver_mock: MagicMock, config_file: str):
+def test_invalid_base64_passwd_file(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
     """Test that the charm is blocked when passwd-file has invalid base64 content."""
     ctx = testing.Context(ConserverCharm)
     state_in = testing.State(
+        resources=resources,
         config={
             "config-file": config_file,
             "passwd-file": "invalid-base64",
@@ -40,19 +65,72 @@ def test_invalid_base64_passwd_file(conserver_mock: MagicMock, config_file: str)
 
 
 @patch("charm.Conserver")
-def test_install(conserver_mock: MagicMock, config_file: str):
+def test_install(conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]):
     """Test that the charm installs conserver on install event."""
     ctx = testing.Context(ConserverCharm)
-    state_in = testing.State(config={"config-file": config_file}, leader=True)
+    state_in = testing.State(resources=resources, config={"config-file": config_file}, leader=True)
     ctx.run(ctx.on.install(), state_in)
     conserver_mock.return_value.install.assert_called_once()
 
 
+@pytest.fixture
+def packages(tmp_path: Path, resources: set[testing.Resource]) -> set[testing.Resource]:
+    """Return the resources, with packages attached."""
+    path = tmp_path / "packages.tar"
+    path.write_bytes(b"packages")
+    return {r for r in resources if r.name != "packages"} | {
+        testing.Resource(name="packages", path=path)
+    }
+
+
+@patch("charm.read_debs")
+@patch("charm.extract_debs")
+@patch("charm.Conserver")
+def test_install_packages(
+    conserver_mock: MagicMock,
+    extract_debs_mock: MagicMock,
+    read_debs_mock: MagicMock,
+    packages: set[testing.Resource],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Test that the attached packages are installed, and only extracted once."""
+    monkeypatch.setattr("charm.DEBS_DIR", str(tmp_path))
+    conserver_mock.return_value.package_version = "8.2.6-1"
+    read_debs_mock.return_value = local = {"ipmitool": MagicMock()}
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=packages, config={"packages-sha256": "abc"})
+    state_out = ctx.run(ctx.on.install(), state_in)
+    extract_debs_mock.assert_called_once_with(ANY, tmp_path, "abc")
+    conserver_mock.return_value.install.assert_called_once_with("", local)
+
+    ctx.run(ctx.on.upgrade_charm(), state_out)
+    extract_debs_mock.assert_called_once()
+    conserver_mock.return_value.install_dependencies.assert_called_once_with(local)
+
+
 @patch("charm.Conserver")
-def test_config_missing_config_file(conserver_mock: MagicMock):
+def test_install_packages_checksum_mismatch(
+    conserver_mock: MagicMock,
+    packages: set[testing.Resource],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Test that attached packages not matching their checksum fail the install."""
+    monkeypatch.setattr("charm.DEBS_DIR", str(tmp_path / "debs"))
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=packages, config={"packages-sha256": "0" * 64})
+    with pytest.raises(errors.UncaughtCharmError, match="Invalid packages"):
+        ctx.run(ctx.on.install(), state_in)
+    conserver_mock.return_value.install.assert_not_called()
+
+
+@patch("charm.Conserver")
+def test_config_missing_config_file(conserver_mock: MagicMock, resources: set[testing.Resource]):
     """Test that the charm is blocked when config-file is missing."""
     ctx = testing.Context(ConserverCharm)
     state_in = testing.State(
+        resources=resources,
         config={"config-file": ""},
         leader=True,
     )
@@ -61,10 +139,13 @@ def test_config_missing_config_file(conserver_mock: MagicMock):
 
 
 @patch("charm.Conserver")
-def test_config_missing_passwd_file(conserver_mock: MagicMock, config_file: str):
+def test_config_missing_passwd_file(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
     """Test that the charm is blocked when passwd-file is missing."""
     ctx = testing.Context(ConserverCharm)
     state_in = testing.State(
+        resources=resources,
         config={"config-file": config_file, "passwd-file": ""},
         leader=True,
     )
@@ -73,12 +154,848 @@ def test_config_missing_passwd_file(conserver_mock: MagicMock, config_file: str)
 
 
 @patch("charm.Conserver")
-def test_start(conserver_mock: MagicMock, config_file: str):
+def test_config_changed(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm writes both files and reloads on first config-changed."""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, config={"config-file": config_file}, leader=True)
+    ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.write_conserver_config.assert_called_once()
+    conserver_mock.return_value.write_passwd_file.assert_called_once()
+    conserver_mock.return_value.reload.assert_called_once()
+
+
+@patch("charm.Conserver")
+def test_config_changed_unchanged(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm skips writes and reload when the files have not changed."""
+    ctx = testing.Context(ConserverCharm)
+    stored = testing.StoredState(
+        owner_path="ConserverCharm",
+        content={
+            "config_digest": file_digest(base64.b64decode(config_file).decode()),
+            "passwd_digest": file_digest(PASSWD_FILE),
+        },
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file},
+        stored_states={stored},
+        leader=True,
+    )
+    ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.write_conserver_config.assert_not_called()
+    conserver_mock.return_value.write_passwd_file.assert_not_called()
+    conserver_mock.return_value.reload.assert_not_called()
+
+
+@patch("charm.Conserver")
+def test_config_changed_passwd_only(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm only rewrites the file whose contents changed."""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    ctx = testing.Context(ConserverCharm)
+    stored = testing.StoredState(
+        owner_path="ConserverCharm",
+        content={
+            "config_digest": file_digest(base64.b64decode(config_file).decode()),
+            "passwd_digest": "outdated",
+        },
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file},
+        stored_states={stored},
+        leader=True,
+    )
+    ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.write_conserver_config.assert_not_called()
+    conserver_mock.return_value.write_passwd_file.assert_called_once_with(PASSWD_FILE)
+    conserver_mock.return_value.reload.assert_called_once()
+
+
+@patch("passwd.crypt_passwords", side_effect=lambda passwords: ["$6$hash"] * len(passwords))
+@patch("charm.Conserver")
+def test_config_changed_users_secret(
+    conserver_mock: MagicMock,
+    crypt_mock: MagicMock,
+    config_file: str,
+    resources: set[testing.Resource],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Test that the users of users-secret are hashed into conserver.passwd."""
+    monkeypatch.setattr("charm.PASSWD_CACHE", str(tmp_path / "passwd-cache.json"))
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    secret = testing.Secret(tracked_content={"users": "alice:s3cret\nbob:hunter2\n"})
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "users-secret": secret.id},
+        secrets={secret},
+    )
+    ctx.run(ctx.on.config_changed(), state_in)
+    passwd = conserver_mock.return_value.write_passwd_file.call_args.args[0]
+    assert passwd == PASSWD_FILE + "alice:$6$hash\nbob:$6$hash\n"
+    crypt_mock.assert_called_once_with(["s3cret", "hunter2"])
+
+    # Hashes are reused on the next hooks
+    crypt_mock.reset_mock()
+    ctx.run(ctx.on.config_changed(), state_in)
+    crypt_mock.assert_called_once_with([])
+
+
+@patch("charm.Conserver")
+def test_config_changed_users_secret_missing(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm is blocked when users-secret cannot be read."""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "users-secret": "secret:d2k7fqvmp25c7bdmmsa0"},
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    assert isinstance(state_out.unit_status, testing.BlockedStatus)
+    assert state_out.unit_status.message.startswith("Invalid users-secret: cannot read secret")
+    conserver_mock.return_value.write_passwd_file.assert_not_called()
+
+
+@patch("charm.Conserver")
+def test_config_changed_restart(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm restarts conserver when a config block changes."""
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.read_conserver_config.return_value = "config * { }"
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, config={"config-file": config_file}, leader=True)
+    ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.restart.assert_called_once()
+    conserver_mock.return_value.reload.assert_not_called()
+
+
+@patch("charm.Conserver")
+def test_config_changed_formatting_only(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm rewrites conserver.cf without reloading on cosmetic changes."""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    contents = base64.b64decode(config_file).decode()
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.read_conserver_config.return_value = f"# old\n{contents}"
+    ctx = testing.Context(ConserverCharm)
+    stored = testing.StoredState(
+        owner_path="ConserverCharm",
+        content={"config_digest": "outdated", "passwd_digest": file_digest(PASSWD_FILE)},
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file},
+        stored_states={stored},
+        leader=True,
+    )
+    ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.write_conserver_config.assert_called_once_with(contents, ANY)
+    conserver_mock.return_value.reload.assert_not_called()
+    conserver_mock.return_value.restart.assert_not_called()
+
+
+@patch("charm.Conserver")
+def test_config_changed_unparsable(conserver_mock: MagicMock, resources: set[testing.Resource]):
+    """Test that the charm falls back to a reload when conserver.cf cannot be parsed."""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    ctx = testing.Context(ConserverCharm)
+    config_file = base64.b64encode(b"console broken {").decode()
+    state_in = testing.State(resources=resources, config={"config-file": config_file}, leader=True)
+    ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.reload.assert_called_once()
+
+
+@patch("charm.Conserver")
+def test_config_changed_sharded(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that consoles are assigned to units when there are peers."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.PeerRelation(
+        "conserver-peers",
+        peers_data={1: {"address": "10.0.0.2"}},
+    )
+    state_in = testing.State(
+        resources=resources, config={"config-file": config_file}, relations={relation}
+    )
+    state_out = ctx.run(ctx.on.relation_changed(relation, remote_unit=1), state_in)
+    local_address = state_out.get_relation(relation.id).local_unit_data["address"]
+    contents = conserver_mock.return_value.write_conserver_config.call_args.args[0]
+    assert f"master {local_address};" in contents or "master 10.0.0.2;" in contents
+    assert "master localhost;" not in contents
+
+
+@patch("charm.Conserver")
+def test_upgrade_charm(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that charm upgrades leave conserver and its packages as they are."""
+    conserver_mock.return_value.running = True
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, config={"config-file": config_file})
+    state_out = ctx.run(ctx.on.upgrade_charm(), state_in)
+    conserver_mock.return_value.install_dependencies.assert_called_once()
+    conserver_mock.return_value.hold_packages.assert_called_once_with(True)
+    conserver_mock.return_value.install.assert_not_called()
+    conserver_mock.return_value.restart.assert_not_called()
+    assert isinstance(state_out.unit_status, testing.ActiveStatus)
+
+
+@patch("charm.Conserver")
+def test_upgrade_waits_for_turn(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that units stage the pinned version, and wait for their turn to upgrade."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.package_version = "8.2.6-1"
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.PeerRelation(
+        "conserver-peers",
+        local_app_data={"upgrading": "conserver/1"},
+        peers_data={1: {"address": "10.0.0.2", "upgrade": "8.2.7-1"}},
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "conserver-version": "8.2.7-1"},
+        relations={relation},
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.stage_upgrade.assert_called_once_with("8.2.7-1", {})
+    conserver_mock.return_value.upgrade.assert_not_called()
+    assert state_out.get_relation(relation.id).local_unit_data["upgrade"] == "8.2.7-1"
+    assert state_out.unit_status == testing.MaintenanceStatus(
+        "Waiting to upgrade conserver to 8.2.7-1"
+    )
+
+
+@patch("charm.Conserver")
+def test_upgrade_on_turn(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the unit upgrading hands its consoles over to the other units first."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.package_version = "8.2.6-1"
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    conserver_mock.return_value.version = "8.2.7"
+    conserver_mock.return_value.binary_id = "1:2:3"
+    manager = MagicMock()
+    manager.attach_mock(conserver_mock.return_value.write_conserver_config, "write")
+    manager.attach_mock(conserver_mock.return_value.upgrade, "upgrade")
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.PeerRelation(
+        "conserver-peers",
+        local_app_data={"upgrading": "conserver/0"},
+        peers_data={1: {"address": "10.0.0.2", "took-over": "conserver/0"}},
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "conserver-version": "8.2.7-1"},
+        relations={relation},
+    )
+    state_out = ctx.run(ctx.on.relation_changed(relation, remote_unit=1), state_in)
+    assert [call[0] for call in manager.mock_calls] == ["write", "upgrade"]
+    contents = manager.write.call_args.args[0]
+    assert "master 10.0.0.2;" in contents
+    local_address = state_out.get_relation(relation.id).local_unit_data["address"]
+    assert f"master {local_address};" not in contents
+    conserver_mock.return_value.upgrade.assert_called_once_with("8.2.7-1", {})
+    conserver_mock.return_value.restart.assert_called_once()
+    assert "upgrade" not in state_out.get_relation(relation.id).local_unit_data
+    assert "draining" not in state_out.get_relation(relation.id).local_unit_data
+
+
+@patch("charm.Conserver")
+def test_upgrade_drains_first(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the unit upgrading waits for the other units to take over its consoles."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.package_version = "8.2.6-1"
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.PeerRelation(
+        "conserver-peers",
+        local_app_data={"upgrading": "conserver/0"},
+        # Still serving the consoles it took over from the unit upgraded before
+        peers_data={1: {"address": "10.0.0.2", "took-over": "conserver/2"}},
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "conserver-version": "8.2.7-1"},
+        relations={relation},
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.write_conserver_config.assert_called_once()
+    conserver_mock.return_value.broadcast.assert_called_once()
+    conserver_mock.return_value.upgrade.assert_not_called()
+    conserver_mock.return_value.restart.assert_not_called()
+    assert state_out.get_relation(relation.id).local_unit_data["draining"] == "8.2.7-1"
+    assert state_out.unit_status == testing.MaintenanceStatus(
+        "Waiting for the other units to take over the consoles to upgrade to 8.2.7-1"
+    )
+
+    # Clients are only told once to reconnect
+    ctx.run(ctx.on.config_changed(), state_out)
+    conserver_mock.return_value.broadcast.assert_called_once()
+
+
+@patch("charm.Conserver")
+def test_upgrade_takeover_acknowledged(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that units acknowledge serving the consoles of the unit draining to upgrade."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.package_version = "8.2.7-1"
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.running = True
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.PeerRelation(
+        "conserver-peers",
+        local_app_data={"upgrading": "conserver/1"},
+        peers_data={1: {"address": "10.0.0.2", "upgrade": "8.2.7-1"}},
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "conserver-version": "8.2.7-1"},
+        relations={relation},
+    )
+    state_out = ctx.run(ctx.on.relation_changed(relation, remote_unit=1), state_in)
+    # Not draining yet
+    assert "took-over" not in state_out.get_relation(relation.id).local_unit_data
+    contents = conserver_mock.return_value.write_conserver_config.call_args.args[0]
+    assert "10.0.0.2" not in contents
+
+    relation = dataclasses.replace(
+        relation,
+        peers_data={1: {"address": "10.0.0.2", "upgrade": "8.2.7-1", "draining": "8.2.7-1"}},
+    )
+    state_out = ctx.run(
+        ctx.on.relation_changed(relation, remote_unit=1),
+        dataclasses.replace(state_out, relations={relation}),
+    )
+    assert state_out.get_relation(relation.id).local_unit_data["took-over"] == "conserver/1"
+
+
+@patch("charm.Conserver")
+def test_upgrade_active_fails_over(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the active unit fails over to a standby unit before upgrading."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.package_version = "8.2.6-1"
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.running = True
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    conserver_mock.return_value.version = "8.2.7"
+    conserver_mock.return_value.binary_id = "1:2:3"
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.PeerRelation(
+        "conserver-peers",
+        local_unit_data={"address": "10.0.0.1", "upgrade": "8.2.7-1"},
+        peers_data={1: {"address": "10.0.0.2"}},
+    )
+    config = {
+        "config-file": config_file,
+        "conserver-version": "8.2.7-1",
+        "ha-mode": "active-standby",
+    }
+    state_in = testing.State(resources=resources, config=config, relations={relation}, leader=True)
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    app_data = state_out.get_relation(relation.id).local_app_data
+    assert app_data["upgrading"] == "conserver/0"
+    assert app_data["active"] == "conserver/1"
+    # Serves the consoles until the standby unit took over
+    conserver_mock.return_value.stop.assert_not_called()
+    conserver_mock.return_value.upgrade.assert_not_called()
+
+    relation = dataclasses.replace(
+        state_out.get_relation(relation.id),
+        peers_data={1: {"address": "10.0.0.2", "took-over": "conserver/0"}},
+    )
+    state_out = ctx.run(
+        ctx.on.relation_changed(relation, remote_unit=1),
+        dataclasses.replace(state_out, relations={relation}),
+    )
+    conserver_mock.return_value.upgrade.assert_called_once_with("8.2.7-1", {})
+    conserver_mock.return_value.restart.assert_not_called()
+    # Stopped before upgrading, and again after the package restarted it
+    calls = [call[0] for call in conserver_mock.return_value.mock_calls]
+    assert calls.index("stop") < calls.index("upgrade") < len(calls) - calls[::-1].index("stop")
+
+
+@patch("charm.Conserver")
+def test_upgrade_standby_takes_over(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the standby unit the active unit fails over to starts and acknowledges it."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.package_version = "8.2.7-1"
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.running = False
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.PeerRelation(
+        "conserver-peers",
+        local_app_data={"upgrading": "conserver/1", "active": "conserver/0"},
+        peers_data={1: {"address": "10.0.0.2", "upgrade": "8.2.7-1", "draining": "8.2.7-1"}},
+    )
+    config = {
+        "config-file": config_file,
+        "conserver-version": "8.2.7-1",
+        "ha-mode": "active-standby",
+    }
+    state_in = testing.State(resources=resources, config=config, relations={relation})
+
+    def start(**_):
+        conserver_mock.return_value.running = True
+
+    conserver_mock.return_value.start.side_effect = start
+    state_out = ctx.run(ctx.on.relation_changed(relation, remote_unit=1), state_in)
+    conserver_mock.return_value.start.assert_called_once()
+    assert state_out.get_relation(relation.id).local_unit_data["took-over"] == "conserver/1"
+
+
+@patch("charm.Conserver")
+def test_upgrade_leader_last(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the leader grants the turn to upgrade to the other units first."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.package_version = "8.2.6-1"
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.PeerRelation(
+        "conserver-peers",
+        peers_data={1: {"address": "10.0.0.2", "upgrade": "8.2.7-1"}},
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "conserver-version": "8.2.7-1"},
+        relations={relation},
+        leader=True,
+    )
+    state_out = ctx.run(ctx.on.relation_changed(relation, remote_unit=1), state_in)
+    assert state_out.get_relation(relation.id).local_app_data["upgrading"] == "conserver/1"
+    conserver_mock.return_value.upgrade.assert_not_called()
+
+
+@patch("charm.Conserver")
+def test_upgrade_at_version(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that a unit whose packages are at the pinned version neither waits nor upgrades."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.package_version = "8.2.7-1"
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.PeerRelation("conserver-peers", peers_data={1: {"address": "10.0.0.2"}})
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "conserver-version": "8.2.7-1"},
+        relations={relation},
+        leader=True,
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.stage_upgrade.assert_not_called()
+    conserver_mock.return_value.upgrade.assert_not_called()
+    assert "upgrade" not in state_out.get_relation(relation.id).local_unit_data
+    assert isinstance(state_out.unit_status, testing.ActiveStatus)
+
+
+@patch("charm.Conserver")
+def test_upgrade_failed(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that a failed upgrade blocks the unit, keeping its turn."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.package_version = "8.2.6-1"
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    conserver_mock.return_value.upgrade.side_effect = apt.PackageError("not found")
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "conserver-version": "8.2.7-1"},
+        leader=True,
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.restart.assert_not_called()
+    assert state_out.unit_status == testing.BlockedStatus("Failed to upgrade conserver to 8.2.7-1")
+
+
+@patch("charm.Conserver")
+def test_metrics_endpoint(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the exporter is configured and its scrape job published."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    ctx = testing.Context(ConserverCharm)
+    relation = testing.Relation("metrics-endpoint")
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "metrics-port": 9100},
+        relations={relation},
+        leader=True,
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.configure_exporter.assert_called_once()
+    assert conserver_mock.return_value.configure_exporter.call_args.args[0] == 9100
+    relation_out = state_out.get_relation(relation.id)
+    jobs = json.loads(relation_out.local_app_data["scrape_jobs"])
+    assert jobs == [{"metrics_path": "/metrics", "static_configs": [{"targets": ["*:9100"]}]}]
+    assert json.loads(relation_out.local_app_data["scrape_metadata"])["charm_name"] == "conserver"
+    assert relation_out.local_unit_data["prometheus_scrape_unit_name"] == "conserver/0"
+    assert "prometheus_scrape_unit_address" in relation_out.local_unit_data
+
+
+@patch("charm.Conserver")
+def test_config_changed_log_rotation(conserver_mock: MagicMock, resources: set[testing.Resource]):
+    """Test that the console logs of conserver.cf are rotated with the configured limits."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.services = ["conserver-server"]
+    contents = "default full {\n  logfile /srv/consoles/&.log;\n}\n"
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={
+            "config-file": base64.b64encode(contents.encode()).decode(),
+            "log-rotate-size": "10M",
+            "log-console-quota": "100M",
+        },
+        leader=True,
+    )
+    ctx.run(ctx.on.config_changed(), state_in)
+    rotation = conserver_mock.return_value.configure_log_rotation.call_args.args[0]
+    assert '"/srv/consoles/*.log" {' in rotation
+    assert "    rotate 9\n" in rotation
+    assert "--signal=USR2 conserver-server" in rotation
+
+
+@patch("charm.Conserver")
+def test_config_changed_resource_limits(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that resource limits are sized for the consoles, restarting when they change."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.resource_plan.side_effect = lambda consoles: Conserver(
+        instances=1
+    ).resource_plan(consoles)
+    conserver_mock.return_value.write_resource_limits.return_value = True
+    conserver_mock.return_value.failed = False
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, config={"config-file": config_file})
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.resource_plan.assert_called_once_with(1)
+    conserver_mock.return_value.restart.assert_called_once()
+    assert (
+        state_out.get_stored_state("_stored", owner_path="ConserverCharm").content["console_count"]
+        == 1
+    )
+
+
+@patch("charm.Conserver")
+def test_config_changed_too_many_consoles(
+    conserver_mock: MagicMock, resources: set[testing.Resource]
+):
+    """Test that the charm is blocked before deploying more consoles than it has ports for."""
+    contents = "".join(f"console c{i} {{\n  master localhost;\n}}\n" for i in range(600))
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.resource_plan.side_effect = lambda consoles: Conserver(
+        base_port=65500
+    ).resource_plan(consoles)
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={
+            "config-file": base64.b64encode(contents.encode()).decode(),
+            "base-port": 65500,
+        },
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.write_conserver_config.assert_not_called()
+    assert state_out.unit_status == testing.BlockedStatus(
+        "Cannot scale: 600 consoles need 38 ports per instance from base-port 65500, "
+        "only 36 available"
+    )
+    state_out = ctx.run(ctx.on.update_status(), state_out)
+    assert isinstance(state_out.unit_status, testing.BlockedStatus)
+
+
+@patch("charm.Conserver")
+def test_config_changed_instances(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm switches to a new group of conserver instances."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources, config={"config-file": config_file, "instances": 4}, leader=True
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.assert_any_call(instances=1)
+    conserver_mock.assert_any_call(instances=4, port=3109, base_port=33000)
+    conserver_mock.return_value.stop.assert_called_once()
+    conserver_mock.return_value.write_server_config.assert_called_once()
+    conserver_mock.return_value.start.assert_called_once()
+    assert (
+        state_out.get_stored_state("_stored", owner_path="ConserverCharm").content["instances"]
+        == 4
+    )
+
+
+@patch("charm.Conserver")
+def test_config_changed_instances_blocked(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the previous conserver processes keep running until the new files deploy."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    conserver_mock.return_value.failed = False
+    ctx = testing.Context(ConserverCharm)
+    config = {"config-file": config_file, "instances": 2, "config-file-sha256": "0" * 64}
+    state_in = testing.State(resources=resources, config=config, leader=True)
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    assert isinstance(state_out.unit_status, testing.BlockedStatus)
+    conserver_mock.return_value.stop.assert_not_called()
+    conserver_mock.return_value.write_server_config.assert_not_called()
+    stored = state_out.get_stored_state("_stored", owner_path="ConserverCharm")
+    assert stored.content["instances"] == 1
+
+    # The switch is still pending once the checksum is fixed
+    del config["config-file-sha256"]
+    state_out = ctx.run(ctx.on.config_changed(), dataclasses.replace(state_out, config=config))
+    conserver_mock.return_value.stop.assert_called_once()
+    conserver_mock.return_value.start.assert_called_once()
+    conserver_mock.return_value.write_conserver_config.assert_called_once()
+    stored = state_out.get_stored_state("_stored", owner_path="ConserverCharm")
+    assert stored.content["instances"] == 2
+
+
+@patch("charm.Conserver")
+def test_config_changed_resource(conserver_mock: MagicMock, tmp_path: Path):
+    """Test that a compressed config-file resource takes precedence over the option."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    contents = "console from-resource { type exec; }\n"
+    resource_path = tmp_path / "conserver.cf"
+    resource_path.write_bytes(gzip.compress(contents.encode()))
+    (tmp_path / "conserver.passwd").touch()
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        config={"config-file-sha256": hashlib.sha256(contents.encode()).hexdigest()},
+        resources={
+            testing.Resource(name="config-file", path=resource_path),
+            testing.Resource(name="passwd-file", path=tmp_path / "conserver.passwd"),
+        },
+        leader=True,
+    )
+    ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.write_conserver_config.assert_called_once_with(contents, ANY)
+
+
+@patch("charm.Conserver")
+def test_config_changed_checksum_mismatch(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm is blocked when the config-file checksum does not match."""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "config-file-sha256": "0" * 64},
+        leader=True,
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    assert isinstance(state_out.unit_status, testing.BlockedStatus)
+    conserver_mock.return_value.write_conserver_config.assert_not_called()
+
+
+@patch("charm.Conserver")
+def test_config_changed_inventory(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the consoles in the inventory are appended to config-file."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "inventory": "consoles: {node1: 10.0.0.1}"},
+        leader=True,
+    )
+    ctx.run(ctx.on.config_changed(), state_in)
+    contents = conserver_mock.return_value.write_conserver_config.call_args.args[0]
+    assert contents.startswith(base64.b64decode(config_file).decode())
+    assert contents.endswith("console node1 {\n  host 10.0.0.1;\n}\n")
+
+
+def _consoles_relation(consoles: dict) -> testing.Relation:
+    return testing.Relation(
+        "consoles",
+        remote_app_name="nodes",
+        remote_units_data={0: {"consoles": json.dumps(consoles)}},
+    )
+
+
+@patch("charm.Conserver")
+def test_consoles_registered_debounced(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that registrations are only rendered once they settled."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    relation = _consoles_relation({"node1": "10.0.0.1"})
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources, config={"config-file": config_file}, relations={relation}
+    )
+    with patch("time.time", return_value=1000.0):
+        state_out = ctx.run(ctx.on.relation_changed(relation, remote_unit=0), state_in)
+    conserver_mock.return_value.write_conserver_config.assert_not_called()
+    stored = state_out.get_stored_state("_stored", owner_path="ConserverCharm")
+    assert stored.content["registrations_pending_since"] == 1000.0
+
+    with patch("time.time", return_value=1060.0):
+        state_out = ctx.run(ctx.on.update_status(), state_out)
+    contents = conserver_mock.return_value.write_conserver_config.call_args.args[0]
+    assert contents.endswith("console node1 {\n  host 10.0.0.1;\n}\n")
+    stored = state_out.get_stored_state("_stored", owner_path="ConserverCharm")
+    assert stored.content["registrations_pending_since"] == 0.0
+
+
+@patch("charm.Conserver")
+def test_consoles_registered_credentials(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the credentials of registered consoles are read from their secret."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    secret = testing.Secret(tracked_content={"username": "admin", "password": "s3cret"})
+    relation = _consoles_relation(
+        {
+            "node1": {"bmc": "10.0.0.1", "credentials-secret": secret.id},
+            "node2": {"bmc": "10.0.0.2", "credentials-secret": "secret:missing"},
+            "node3": {"bmc": "10.0.0.3", "group": "unknown"},
+        }
+    )
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "registration-delay": 0},
+        relations={relation},
+        secrets={secret},
+    )
+    ctx.run(ctx.on.relation_changed(relation, remote_unit=0), state_in)
+    contents = conserver_mock.return_value.write_conserver_config.call_args.args[0]
+    assert contents.endswith(
+        "console node1 {\n  host 10.0.0.1;\n  username admin;\n  password s3cret;\n}\n"
+    )
+    assert "node2" not in contents
+    assert "node3" not in contents
+
+
+@patch("charm.Conserver")
+def test_config_changed_invalid_inventory(
+    conserver_mock: MagicMock, resources: set[testing.Resource]
+):
+    """Test that the charm is blocked when the inventory is invalid."""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, config={"inventory": "consoles: ["})
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    assert state_out.unit_status == testing.BlockedStatus("Invalid inventory in config")
+
+
+@patch("charm.Conserver")
+def test_update_status_load_error(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the unit stays blocked while its files cannot be loaded, until they load."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    conserver_mock.return_value.failed = False
+    conserver_mock.return_value.running = True
+    ctx = testing.Context(ConserverCharm)
+    config = {"config-file": config_file, "config-file-sha256": "0" * 64}
+    state = ctx.run(ctx.on.config_changed(), testing.State(resources=resources, config=config))
+    state = ctx.run(ctx.on.update_status(), state)
+    assert isinstance(state.unit_status, testing.BlockedStatus)
+    assert "checksum mismatch" in state.unit_status.message
+
+    config = {"config-file": config_file, "inventory": "consoles: ["}
+    state = ctx.run(ctx.on.config_changed(), dataclasses.replace(state, config=config))
+    state = ctx.run(ctx.on.update_status(), state)
+    assert state.unit_status == testing.BlockedStatus("Invalid inventory in config")
+
+    config = {"config-file": config_file}
+    state = ctx.run(ctx.on.config_changed(), dataclasses.replace(state, config=config))
+    state = ctx.run(ctx.on.update_status(), state)
+    assert state.unit_status == testing.ActiveStatus()
+
+
+@patch("charm.Conserver")
+def test_config_changed_rejected(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm is blocked without reloading when conserver rejects the config."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.write_conserver_config.side_effect = ConfigValidationError
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, config={"config-file": config_file})
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    assert state_out.unit_status == testing.BlockedStatus(
+        "Invalid config-file, rejected by conserver"
+    )
+    conserver_mock.return_value.reload.assert_not_called()
+    conserver_mock.return_value.write_resource_limits.assert_not_called()
+
+
+@patch("charm.Conserver")
+def test_config_changed_rollback(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm rolls back the config when conserver fails with it."""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.failed = True
+    conserver_mock.return_value.running = False
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, config={"config-file": config_file})
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    conserver_mock.return_value.settle.assert_called_once()
+    conserver_mock.return_value.rollback_conserver_config.assert_called_once()
+    conserver_mock.return_value.restart.assert_called_once()
+    assert state_out.unit_status == testing.BlockedStatus(
+        "Conserver failed with the new config-file, rolled back"
+    )
+
+
+@patch("charm.Conserver")
+def test_start(conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]):
     """Test that the charm has the correct state after handling the start event."""
     conserver_mock.return_value.version = "8.2.6"
+    conserver_mock.return_value.binary_id = "1:2:3"
     conserver_mock.return_value.running = True
     ctx = testing.Context(ConserverCharm)
     state_in = testing.State(
+        resources=resources,
         config={"config-file": config_file},
         leader=True,
     )
@@ -88,13 +1005,36 @@ def test_start(conserver_mock: MagicMock, config_file: str):
 
 
 @patch("charm.Conserver")
-def test_start_failed_service(conserver_mock: MagicMock, config_file: str):
+def test_start_cached_version(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the workload version is reused while the conserver binary is unchanged."""
+    type(conserver_mock.return_value).version = version_mock = PropertyMock()
+    conserver_mock.return_value.binary_id = "1:2:3"
+    ctx = testing.Context(ConserverCharm)
+    stored = testing.StoredState(
+        owner_path="ConserverCharm", content={"binary_id": "1:2:3", "version": "8.2.6"}
+    )
+    state_in = testing.State(
+        resources=resources, config={"config-file": config_file}, stored_states={stored}
+    )
+    state_out = ctx.run(ctx.on.start(), state_in)
+    assert state_out.workload_version == "8.2.6"
+    version_mock.assert_not_called()
+
+
+@patch("charm.Conserver")
+def test_start_failed_service(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
     """Test that the charm is blocked when the service has failed."""
     conserver_mock.return_value.version = "8.2.6"
+    conserver_mock.return_value.binary_id = "1:2:3"
     conserver_mock.return_value.running = False
     conserver_mock.return_value.failed = True
     ctx = testing.Context(ConserverCharm)
     state_in = testing.State(
+        resources=resources,
         config={"config-file": config_file},
         leader=True,
     )
@@ -103,13 +1043,17 @@ def test_start_failed_service(conserver_mock: MagicMock, config_file: str):
 
 
 @patch("charm.Conserver")
-def test_start_maintenance(conserver_mock: MagicMock, config_file: str):
+def test_start_maintenance(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
     """Test that the charm is in maintenance when the service is not running nor failed."""
     conserver_mock.return_value.version = "8.2.6"
+    conserver_mock.return_value.binary_id = "1:2:3"
     conserver_mock.return_value.running = False
     conserver_mock.return_value.failed = False
     ctx = testing.Context(ConserverCharm)
     state_in = testing.State(
+        resources=resources,
         config={"config-file": config_file},
         leader=True,
     )
@@ -118,10 +1062,466 @@ def test_start_maintenance(conserver_mock: MagicMock, config_file: str):
 
 
 @patch("charm.Conserver")
-def test_stop(conserver_mock: MagicMock):
+def test_start_staggered(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the charm reports the consoles still starting up."""
+    conserver_mock.return_value.version = "8.2.6"
+    conserver_mock.return_value.binary_id = "1:2:3"
+    conserver_mock.return_value.running = True
+    conserver_mock.return_value.console_states.return_value = {"a": True, "b": False, "c": False}
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources, config={"config-file": config_file, "startup-delay": 2}
+    )
+    state_out = ctx.run(ctx.on.start(), state_in)
+    assert state_out.unit_status == testing.MaintenanceStatus("Starting consoles: 1/3 up")
+
+
+@patch("charm.Conserver")
+def test_update_status_staggered_done(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that consoles still down after the startup ramp are not reported as starting."""
+    conserver_mock.return_value.running = True
+    conserver_mock.return_value.console_states.return_value = {"a": True, "b": False}
+    ctx = testing.Context(ConserverCharm)
+    stored = testing.StoredState(owner_path="ConserverCharm", content={"startup_time": 1.0})
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "startup-delay": 2},
+        stored_states={stored},
+    )
+    state_out = ctx.run(ctx.on.update_status(), state_in)
+    assert isinstance(state_out.unit_status, testing.ActiveStatus)
+
+
+@patch("charm.Conserver")
+def test_config_changed_startup_delay(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that the startup delay is rendered in conserver.cf."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources, config={"config-file": config_file, "startup-delay": 3}
+    )
+    ctx.run(ctx.on.config_changed(), state_in)
+    contents = conserver_mock.return_value.write_conserver_config.call_args.args[0]
+    assert contents.startswith("config * {\n  initdelay 3;\n}\n")
+
+
+@patch("charm.unreachable_hosts", new_callable=AsyncMock, return_value={"10.1.0.2"})
+@patch("charm.Conserver")
+def test_update_status_bmc_probe(
+    conserver_mock: MagicMock, unreachable_mock: MagicMock, resources: set[testing.Resource]
+):
+    """Test that consoles of unreachable BMCs are parked and reported."""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    contents = (
+        "console server1 {\n  type ipmi;\n  host 10.1.0.1;\n}\n"
+        "console server2 {\n  type ipmi;\n  host 10.1.0.2;\n}\n"
+    )
+    conserver_mock.return_value.read_conserver_config.return_value = contents
+    conserver_mock.return_value.running = True
+    conserver_mock.return_value.failed = False
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={
+            "config-file": base64.b64encode(contents.encode()).decode(),
+            "bmc-probe": True,
+        },
+    )
+    state_out = ctx.run(ctx.on.update_status(), state_in)
+    written = conserver_mock.return_value.write_conserver_config.call_args.args[0]
+    assert "console server2 {\n  type ipmi;\n  host 10.1.0.2;\n  options ondemand;\n}" in written
+    assert "console server1 {\n  type ipmi;\n  host 10.1.0.1;\n}" in written
+    conserver_mock.return_value.reload.assert_called_once()
+    assert state_out.unit_status == testing.ActiveStatus("1 consoles parked, BMC unreachable")
+
+
+@patch("charm.Conserver")
+def test_config_changed_standby(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that standby units write the configuration but keep conserver stopped."""
+    conserver_mock.return_value.read_conserver_config.return_value = ""
+    conserver_mock.return_value.write_resource_limits.return_value = False
+    conserver_mock.return_value.running = True
+    conserver_mock.return_value.failed = False
+    ctx = testing.Context(ConserverCharm)
+    peers = testing.PeerRelation(
+        "conserver-peers",
+        local_unit_data={"address": "10.0.0.1"},
+        peers_data={1: {"address": "10.0.0.2"}},
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "ha-mode": "active-standby"},
+        relations={peers},
+        leader=False,
+    )
+    state_out = ctx.run(ctx.on.config_changed(), state_in)
+    contents = conserver_mock.return_value.write_conserver_config.call_args.args[0]
+    # Consoles are not sharded across the units
+    assert contents == base64.b64decode(config_file).decode()
+    conserver_mock.return_value.stop.assert_called_once()
+    conserver_mock.return_value.reload.assert_not_called()
+    conserver_mock.return_value.start.assert_not_called()
+    assert state_out.unit_status == testing.ActiveStatus("Standby")
+
+
+@patch("charm.Conserver")
+def test_leader_elected_promotes(conserver_mock: MagicMock, resources: set[testing.Resource]):
+    """Test that a new leader starts its consoles and publishes the endpoint."""
+    conserver_mock.return_value.running = False
+    ctx = testing.Context(ConserverCharm)
+    peers = testing.PeerRelation("conserver-peers", local_unit_data={"address": "10.0.0.2"})
+    consoles = testing.Relation("consoles")
+    state_in = testing.State(
+        resources=resources,
+        config={"ha-mode": "active-standby"},
+        relations={peers, consoles},
+        leader=True,
+    )
+    state_out = ctx.run(ctx.on.leader_elected(), state_in)
+    conserver_mock.return_value.start.assert_called_once()
+    conserver_mock.return_value.install.assert_not_called()
+    conserver_mock.return_value.write_conserver_config.assert_not_called()
+    endpoint = {"endpoint": "10.0.0.2", "port": "3109"}
+    assert state_out.get_relation(peers.id).local_app_data == endpoint
+    assert state_out.get_relation(consoles.id).local_app_data == endpoint
+
+
+@patch("charm.FloatingAddress.announce")
+@patch("charm.FloatingAddress.assign")
+@patch("charm.FloatingAddress.assigned", new_callable=PropertyMock, return_value=False)
+@patch("charm.Conserver")
+def test_leader_elected_floating_address(
+    conserver_mock: MagicMock,
+    assigned_mock: MagicMock,
+    assign_mock: MagicMock,
+    announce_mock: MagicMock,
+    resources: set[testing.Resource],
+):
+    """Test that the floating address moves to the new leader."""
+    conserver_mock.return_value.running = True
+    ctx = testing.Context(ConserverCharm)
+    peers = testing.PeerRelation("conserver-peers")
+    network = testing.Network(
+        "conserver-peers",
+        bind_addresses=[
+            testing.BindAddress(
+                [testing.Address("10.0.0.2", cidr="10.0.0.0/24")], interface_name="eth0"
+            )
+        ],
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"ha-mode": "active-standby", "virtual-ip": "10.0.0.10"},
+        relations={peers},
+        networks={network},
+        leader=True,
+    )
+    state_out = ctx.run(ctx.on.leader_elected(), state_in)
+    conserver_mock.return_value.start.assert_not_called()
+    assign_mock.assert_called_once()
+    announce_mock.assert_called_once()
+    assert state_out.get_relation(peers.id).local_app_data["endpoint"] == "10.0.0.10"
+
+
+@patch("charm.FloatingAddress.assign", side_effect=FloatingAddressError("cannot assign"))
+@patch("charm.FloatingAddress.assigned", new_callable=PropertyMock, return_value=False)
+@patch("charm.Conserver")
+def test_leader_elected_floating_address_failed(
+    conserver_mock: MagicMock,
+    assigned_mock: MagicMock,
+    assign_mock: MagicMock,
+    config_file: str,
+    resources: set[testing.Resource],
+):
+    """Test that the unit is blocked when the floating address cannot be assigned."""
+    conserver_mock.return_value.running = True
+    conserver_mock.return_value.arping_installed = False
+    ctx = testing.Context(ConserverCharm)
+    network = testing.Network(
+        "conserver-peers",
+        bind_addresses=[
+            testing.BindAddress(
+                [testing.Address("10.0.0.2", cidr="10.0.0.0/24")], interface_name="eth0"
+            )
+        ],
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={
+            "config-file": config_file,
+            "ha-mode": "active-standby",
+            "virtual-ip": "10.0.0.10",
+        },
+        relations={testing.PeerRelation("conserver-peers")},
+        networks={network},
+        leader=True,
+    )
+    state_out = ctx.run(ctx.on.leader_elected(), state_in)
+    conserver_mock.return_value.install_arping.assert_called_once()
+    assert state_out.unit_status == testing.BlockedStatus("Failed to assign virtual-ip")
+    state_out = ctx.run(ctx.on.update_status(), state_out)
+    assert state_out.unit_status == testing.BlockedStatus("Failed to assign virtual-ip")
+
+
+@patch("charm.Conserver")
+def test_arping_install_failed(
+    conserver_mock: MagicMock, config_file: str, resources: set[testing.Resource]
+):
+    """Test that a failed arping installation blocks, and is only retried on config-changed."""
+    conserver_mock.return_value.running = True
+    conserver_mock.return_value.arping_installed = False
+    conserver_mock.return_value.install_arping.side_effect = apt.PackageError("not found")
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "ha-mode": "active-standby"},
+        relations={testing.PeerRelation("conserver-peers")},
+        leader=True,
+    )
+    state_out = ctx.run(ctx.on.leader_elected(), state_in)
+    assert state_out.unit_status == testing.BlockedStatus("Failed to install arping")
+    state_out = ctx.run(ctx.on.update_status(), state_out)
+    conserver_mock.return_value.install_arping.assert_called_once()
+    assert state_out.unit_status == testing.BlockedStatus("Failed to install arping")
+
+    conserver_mock.return_value.install_arping.side_effect = None
+    state_out = ctx.run(ctx.on.config_changed(), state_out)
+    assert conserver_mock.return_value.install_arping.call_count == 2
+    assert state_out.unit_status != testing.BlockedStatus("Failed to install arping")
+
+
+@patch("charm.Conserver")
+def test_stop(conserver_mock: MagicMock, resources: set[testing.Resource]):
     """Test that the charm stops and uninstalls conserver on stop event."""
     ctx = testing.Context(ConserverCharm)
-    state_in = testing.State(leader=True)
+    state_in = testing.State(resources=resources, leader=True)
     ctx.run(ctx.on.stop(), state_in)
     conserver_mock.return_value.stop.assert_called_once()
+    conserver_mock.return_value.remove_exporter.assert_called_once()
+    conserver_mock.return_value.remove_log_rotation.assert_called_once()
     conserver_mock.return_value.uninstall.assert_called_once()
+
+
+@pytest.fixture
+def console_logs(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> testing.StoredState:
+    """Return the stored state of a charm whose consoles log to a temporary directory."""
+    monkeypatch.setattr("logsearch.INDEX_DIR", str(tmp_path / "index"))
+    (tmp_path / "logs").mkdir()
+    (tmp_path / "logs" / "server1.log").write_text(
+        "[-- MARK -- Fri Oct 17 09:00:00 2025]\nboot ok\nkernel panic\n"
+    )
+    return testing.StoredState(
+        owner_path="ConserverCharm", content={"log_paths": [str(tmp_path / "logs" / "*.log")]}
+    )
+
+
+@patch("charm.Conserver")
+def test_search_console_log(
+    conserver_mock: MagicMock,
+    resources: set[testing.Resource],
+    console_logs: testing.StoredState,
+):
+    """Test that the search-console-log action returns the matching lines."""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, stored_states={console_logs})
+    params = {"console": "server1", "pattern": "panic", "since": "2025-10-17T08:00"}
+    ctx.run(ctx.on.action("search-console-log", params=params), state_in)
+    assert ctx.action_results == {"matches": 1, "truncated": False, "output": "kernel panic"}
+
+
+@patch("charm.Conserver")
+def test_search_console_log_invalid(
+    conserver_mock: MagicMock,
+    resources: set[testing.Resource],
+    console_logs: testing.StoredState,
+):
+    """Test that the search-console-log action fails on invalid parameters or consoles."""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, stored_states={console_logs})
+    for params in (
+        {"console": "server1", "since": "yesterday"},
+        {"console": "server1", "pattern": "("},
+        {"console": "../server1"},
+        {"console": "missing"},
+    ):
+        with pytest.raises(testing.ActionFailed):
+            ctx.run(ctx.on.action("search-console-log", params=params), state_in)
+
+
+@patch("charm.Conserver")
+def test_tail_console_log(
+    conserver_mock: MagicMock,
+    resources: set[testing.Resource],
+    console_logs: testing.StoredState,
+):
+    """Test that the tail-console-log action returns the last lines."""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources, stored_states={console_logs})
+    ctx.run(ctx.on.action("tail-console-log", params={"console": "server1", "lines": 2}), state_in)
+    assert ctx.action_results == {"output": "boot ok\nkernel panic"}
+
+
+@patch("charm.Conserver")
+def test_console_operation(conserver_mock: MagicMock, resources: set[testing.Resource]):
+    """Test that the console-operation action reports each console it operated on."""
+    conserver_mock.return_value.read_conserver_config.return_value = (
+        "default rack1 { }\n"
+        "console a { include rack1; }\n"
+        "console b { include rack1; }\n"
+        "console c { }\n"
+    )
+    conserver_mock.return_value.console_users.return_value = {
+        "a": (3109, True, 1),
+        "c": (3109, False, 0),
+    }
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources)
+    params = {"operation": "status", "group": "rack1"}
+    ctx.run(ctx.on.action("console-operation", params=params), state_in)
+    assert ctx.action_results is not None
+    assert ctx.action_results["consoles"] == 1
+    assert ctx.action_results["missing"] == 1
+    assert json.loads(ctx.action_results["results"]) == [
+        {"console": "a", "ok": True, "message": "up, 1 clients", "seconds": 0.0}
+    ]
+
+
+@patch("charm.run_operation", new_callable=AsyncMock)
+@patch("charm.Conserver")
+def test_console_operation_failed(
+    conserver_mock: MagicMock, run_operation_mock: AsyncMock, resources: set[testing.Resource]
+):
+    """Test that the console-operation action fails when a console failed."""
+    conserver_mock.return_value.read_conserver_config.return_value = "console a { }\n"
+    conserver_mock.return_value.console_users.return_value = {"a": (3109, True, 0)}
+    run_operation_mock.return_value = [Result("a", False, "refused")]
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources)
+    with pytest.raises(testing.ActionFailed, match="reopen failed on 1 of 1 consoles"):
+        ctx.run(
+            ctx.on.action("console-operation", params={"operation": "reopen", "pattern": "*"}),
+            state_in,
+        )
+    run_operation_mock.assert_called_once_with("reopen", {"a": (3109, True, 0)}, 32, 30.0, False)
+
+
+@patch("charm.Conserver")
+def test_console_operation_no_selection(
+    conserver_mock: MagicMock, resources: set[testing.Resource]
+):
+    """Test that the console-operation action requires selecting consoles."""
+    ctx = testing.Context(ConserverCharm)
+    state_in = testing.State(resources=resources)
+    with pytest.raises(testing.ActionFailed):
+        ctx.run(ctx.on.action("console-operation", params={"operation": "down"}), state_in)
+    conserver_mock.return_value.console_users.assert_not_called()
+
+
+@patch("charm.measure_resources")
+@patch("charm.measure_usage")
+@patch("charm.Conserver")
+def test_capacity_report(
+    conserver_mock: MagicMock,
+    measure_usage_mock: MagicMock,
+    measure_resources_mock: MagicMock,
+    resources: set[testing.Resource],
+):
+    """Test that the capacity-report action projects the consoles the unit can take."""
+    conserver_mock.return_value.read_conserver_config.return_value = "".join(
+        f"console c{i} {{ }}\n" for i in range(100)
+    )
+    conserver_mock.return_value.resource_plan.side_effect = lambda consoles: Conserver(
+        instances=1
+    ).resource_plan(consoles)
+    measure_usage_mock.return_value = Usage(processes=8, memory=100 * 2**20, fds=800, cpu=0.2)
+    measure_resources_mock.return_value = Resources(memory=2**30, fds=100_000, cpus=2)
+    ctx = testing.Context(ConserverCharm)
+    ctx.run(ctx.on.action("capacity-report"), testing.State(resources=resources))
+    assert ctx.action_results is not None
+    assert ctx.action_results["served"] == 100
+    assert ctx.action_results["per-console"] == {"memory-bytes": 2**20, "fds": 8, "cpu": 0.002}
+    assert ctx.action_results["ports"]["used"] == 7
+    assert ctx.action_results["capacity"] == 800
+    assert ctx.action_results["headroom"] == 700
+    assert ctx.action_results["bottleneck"] == "cpu"
+
+
+@patch("charm.measure_usage", side_effect=FileNotFoundError("/proc/uptime"))
+@patch("charm.Conserver")
+def test_capacity_report_failed(
+    conserver_mock: MagicMock, measure_usage_mock: MagicMock, resources: set[testing.Resource]
+):
+    """Test that the capacity-report action fails when the unit cannot be measured."""
+    conserver_mock.return_value.read_conserver_config.return_value = "console a { }\n"
+    ctx = testing.Context(ConserverCharm)
+    with pytest.raises(testing.ActionFailed, match="Failed to measure the resources"):
+        ctx.run(ctx.on.action("capacity-report"), testing.State(resources=resources))
+
+
+@patch("charm.measure_resources")
+@patch("charm.measure_usage")
+@patch("charm.Conserver")
+def test_update_status_low_headroom(
+    conserver_mock: MagicMock,
+    measure_usage_mock: MagicMock,
+    measure_resources_mock: MagicMock,
+    config_file: str,
+    resources: set[testing.Resource],
+):
+    """Test that the unit status reports low headroom for more consoles."""
+    conserver_mock.return_value.running = True
+    conserver_mock.return_value.console_states.return_value = {"a": True}
+    conserver_mock.return_value.resource_plan.side_effect = lambda consoles: Conserver(
+        instances=1
+    ).resource_plan(consoles)
+    measure_usage_mock.return_value = Usage(processes=8, memory=100 * 2**20, fds=800, cpu=0.2)
+    measure_resources_mock.return_value = Resources(memory=2**30, fds=100_000, cpus=0)
+    ctx = testing.Context(ConserverCharm)
+    stored = testing.StoredState(owner_path="ConserverCharm", content={"served_count": 100})
+    state_in = testing.State(
+        resources=resources, config={"config-file": config_file}, stored_states={stored}
+    )
+    state_out = ctx.run(ctx.on.update_status(), state_in)
+    assert state_out.unit_status == testing.ActiveStatus(
+        "Low headroom: 0 more consoles, limited by cpu"
+    )
+    state_in = testing.State(
+        resources=resources,
+        config={"config-file": config_file, "capacity-headroom": 0},
+        stored_states={stored},
+    )
+    assert ctx.run(ctx.on.update_status(), state_in).unit_status == testing.ActiveStatus()
+
+
+@patch("charm.ops.tracing")
+@patch("charm.Conserver")
+def test_tracing_relation(
+    conserver_mock: MagicMock, tracing_mock: MagicMock, resources: set[testing.Resource]
+):
+    """Test that traces are sent through the charm-tracing relation by default."""
+    ctx = testing.Context(ConserverCharm)
+    ctx.run(ctx.on.update_status(), testing.State(resources=resources))
+    tracing_mock.Tracing.assert_called_once_with(ANY, "charm-tracing")
+    tracing_mock.set_destination.assert_not_called()
+
+
+@patch("charm.ops.tracing")
+@patch("charm.Conserver")
+def test_tracing_endpoint(
+    conserver_mock: MagicMock, tracing_mock: MagicMock, resources: set[testing.Resource]
+):
+    """Test that traces are sent to the tracing-endpoint collector when set."""
+    ctx = testing.Context(ConserverCharm)
+    endpoint = "http://localhost:4318/v1/traces"
+    state_in = testing.State(resources=resources, config={"tracing-endpoint": endpoint})
+    ctx.run(ctx.on.update_status(), state_in)
+    tracing_mock.set_destination.assert_called_once_with(url=endpoint, ca=None)
+    tracing_mock.Tracing.assert_not_called()
@@ -1,6 +1,10 @@
 """Unit tests for config.py."""
 
 import base64
+import gzip
+
+import pytest
+from pydantic import ValidationError
 
 from config import ConserverConfig
 
@@ -10,3 +14,35 @@ def test_config(config_file: str, passwd_file: str):
     config = ConserverConfig(config_file=config_file, passwd_file=passwd_file)
     assert config.config_file == base64.b64decode(config_file).decode()
     assert config.passwd_file == base64.b64decode(passwd_file).decode()
+
+
+def test_config_gzip(config_file: str):
+    """Test that gzip compressed files are decompressed."""
+    contents = base64.b64decode(config_file)
+    config = ConserverConfig(config_file=base64.b64encode(gzip.compress(contents)).decode())
+    assert config.config_file == contents.decode()
+
+
+def test_config_invalid_gzip():
+    """Test that corrupted compressed files are rejected."""
+    with pytest.raises(ValidationError):
+        ConserverConfig(config_file=base64.b64encode(b"\x1f\x8bcorrupted").decode())
+
+
+def test_config_log_rotation():
+    """Test that log rotation sizes are parsed."""
+    config = ConserverConfig.model_validate({"log_rotate_size": "10M", "log_console_quota": "1G"})
+    assert config.log_rotation.max_size == 10 * 1024**2
+    assert config.log_rotation.segments == 101
+
+
+def test_config_invalid_log_rotate_size():
+    """Test that invalid log rotation sizes are rejected."""
+    with pytest.raises(ValidationError):
+        ConserverConfig.model_validate({"log_rotate_size": "ten megabytes"})
+
+
+def test_config_invalid_virtual_ip():
+    """Test that invalid floating addresses are rejected."""
+    with pytest.raises(ValidationError):
+        ConserverConfig(virtual_ip="10.0.0.300")
@@ -1,11 +1,22 @@
 """Unit tests for conserver workload."""
 
-from unittest.mock import MagicMock, patch
+import os
+import subprocess
+from pathlib import Path
+from unittest.mock import MagicMock, PropertyMock, patch
 
 import pytest
 from charmlibs import apt, systemd
 
-from conserver import CONSERVER_SERVICE, Conserver
+import conserver as conserver_module
+from conserver import (
+    CONSERVER_BIN,
+    CONSERVER_SERVICE,
+    ConfigValidationError,
+    Conserver,
+    file_digest,
+)
+from debs import LocalDeb
 
 
 @patch("conserver.subprocess.check_output")
@@ -37,40 +48,281 @@ def test_uid(getpwnam_mock: MagicMock):
     assert conserver.uid == 1001
 
 
-@patch("conserver.systemd.service_running", return_value=True)
-def test_running(running_mock: MagicMock):
+@patch("conserver.apt.DebianPackage.from_system")
+def test_packages_lazy(from_system_mock: MagicMock):
+    """Test that packages are only looked up when needed, and only once."""
+    conserver = Conserver()
+    from_system_mock.assert_not_called()
+    assert conserver.conserver_deb is conserver.conserver_deb
+    from_system_mock.assert_called_once_with("conserver-server")
+
+
+@patch("conserver.subprocess.check_output", return_value="ActiveState=active\n")
+def test_running(check_output_mock: MagicMock):
     """Test that running property returns correct value."""
     conserver = Conserver()
     assert conserver.running is True
-    running_mock.assert_called_once_with(CONSERVER_SERVICE)
+    assert conserver.failed is False
+    check_output_mock.assert_called_once_with(
+        ["systemctl", "show", "--property=ActiveState", "--", CONSERVER_SERVICE], text=True
+    )
 
 
-@patch("conserver.systemd.service_failed", return_value=True)
-def test_failed(failed_mock: MagicMock):
+@patch("conserver.subprocess.check_output", return_value="ActiveState=failed\n")
+def test_failed(check_output_mock: MagicMock):
     """Test that failed property returns correct value."""
     conserver = Conserver()
     assert conserver.failed is True
-    failed_mock.assert_called_once_with(CONSERVER_SERVICE)
+    assert conserver.running is False
+
+
+@patch("conserver.subprocess.check_output", side_effect=subprocess.CalledProcessError(1, ""))
+def test_running_unknown(check_output_mock: MagicMock):
+    """Test that the services are neither running nor failed when systemctl fails."""
+    conserver = Conserver()
+    assert conserver.running is False
+    assert conserver.failed is False
+
+
+@patch("conserver.systemd.service_enable")
+@patch("conserver.subprocess.check_output", return_value="ActiveState=inactive\n")
+def test_running_after_start(check_output_mock: MagicMock, service_enable_mock: MagicMock):
+    """Test that the service state is fetched again after starting the service."""
+    conserver = Conserver()
+    assert conserver.running is False
+    check_output_mock.return_value = "ActiveState=active\n"
+    conserver.start()
+    assert conserver.running is True
+
+
+@patch("conserver.subprocess.check_output")
+def test_running_instances(check_output_mock: MagicMock):
+    """Test that running is only true when all the instances are running."""
+    check_output_mock.return_value = "ActiveState=active\n\nActiveState=activating\n"
+    conserver = Conserver(instances=2)
+    assert conserver.running is False
+    assert conserver.failed is False
+
+
+@patch("conserver.time.sleep")
+@patch("conserver.subprocess.run", side_effect=subprocess.CalledProcessError(1, "console"))
+@patch("conserver.subprocess.check_output")
+def test_settle(check_output_mock: MagicMock, run_mock: MagicMock, sleep_mock: MagicMock):
+    """Test that the services are watched until conserver fails after a reload."""
+    check_output_mock.side_effect = ["ActiveState=active\n"] * 2 + ["ActiveState=failed\n"]
+    conserver = Conserver()
+    conserver.settle()
+    assert conserver.failed is True
+    assert sleep_mock.call_count == 2
 
 
+@patch("conserver.time.sleep")
+@patch("conserver.subprocess.run")
+@patch("conserver.subprocess.check_output")
+def test_settle_answering(
+    check_output_mock: MagicMock, run_mock: MagicMock, sleep_mock: MagicMock
+):
+    """Test that the services are no longer watched once every conserver answers."""
+    check_output_mock.side_effect = [
+        "ActiveState=activating\n\nActiveState=active\n",
+        "ActiveState=active\n\nActiveState=active\n",
+    ]
+    conserver = Conserver(instances=2)
+    conserver.settle()
+    assert conserver.failed is False
+    assert sleep_mock.call_count == 1
+    assert [call.args[0][4] for call in run_mock.call_args_list] == ["3109", "3110"]
+
+
+@patch("conserver.time.sleep")
+@patch("conserver.subprocess.run", side_effect=OSError)
+@patch("conserver.subprocess.check_output", return_value="ActiveState=active\n")
+def test_settle_window(check_output_mock: MagicMock, run_mock: MagicMock, sleep_mock: MagicMock):
+    """Test that the services are no longer watched once the window ends."""
+    conserver = Conserver()
+    conserver.settle(window=0)
+    assert conserver.failed is False
+    sleep_mock.assert_not_called()
+
+
+@patch("conserver.os.stat")
+def test_binary_id(stat_mock: MagicMock):
+    """Test that the binary identifier changes with the conserver binary."""
+    stat_mock.return_value = MagicMock(st_ino=1, st_size=2, st_mtime_ns=3)
+    assert Conserver().binary_id == "1:2:3"
+    stat_mock.side_effect = FileNotFoundError
+    assert Conserver().binary_id == ""
+
+
+@patch("conserver.subprocess.run")
 @patch("conserver.Conserver.write_server_config")
 @patch("conserver.apt.DebianPackage.from_system")
-def test_install(from_system_mock: MagicMock, write_config_mock: MagicMock):
-    """Test that conserver is installed and server config is written."""
+def test_install(from_system_mock: MagicMock, write_config_mock: MagicMock, run_mock: MagicMock):
+    """Test that conserver is installed, held at its version, and server config is written."""
     conserver = Conserver()
     conserver.install()
-    conserver.conserver_deb.ensure.assert_called_with(apt.PackageState.Latest)  # type: ignore
+    conserver.conserver_deb.ensure.assert_called_with(apt.PackageState.Present)  # type: ignore
+    run_mock.assert_called_once()
+    assert run_mock.call_args.args[0] == [
+        "apt-mark",
+        "hold",
+        "conserver-server",
+        "conserver-client",
+    ]
     write_config_mock.assert_called_once()
+    assert "iputils-arping" not in [call.args[0] for call in from_system_mock.call_args_list]
 
 
+@patch("conserver.install_debs")
 @patch("conserver.apt.DebianPackage.from_system")
-def test_uninstall(from_system_mock: MagicMock):
-    """Test that conserver is uninstalled."""
+def test_install_arping(from_system_mock: MagicMock, install_debs_mock: MagicMock):
+    """Test that arping is installed from the attached packages, or else from apt."""
+    conserver = Conserver()
+    conserver.install_arping()
+    from_system_mock.assert_called_once_with("iputils-arping")
+    deb = LocalDeb("iputils-arping", "3:20240117-1", Path("/debs/iputils-arping.deb"))
+    Conserver().install_arping({"iputils-arping": deb})
+    install_debs_mock.assert_called_once_with([deb])
+
+
+@patch("conserver.Conserver.package_version", new_callable=PropertyMock, return_value="")
+@patch("conserver.subprocess.run")
+@patch("conserver.Conserver.write_server_config")
+@patch("conserver.apt.DebianPackage.from_system")
+def test_install_version(
+    from_system_mock: MagicMock,
+    write_config_mock: MagicMock,
+    run_mock: MagicMock,
+    package_version_mock: PropertyMock,
+):
+    """Test that conserver is installed at the pinned version."""
+    Conserver().install("8.2.7-1")
+    command = run_mock.call_args_list[0].args[0]
+    assert command[:2] == ["apt-get", "install"]
+    assert command[-2:] == ["conserver-server=8.2.7-1", "conserver-client=8.2.7-1"]
+
+
+@patch("conserver.subprocess.run")
+@patch("conserver.Conserver.write_server_config")
+@patch("conserver.apt.DebianPackage.from_system")
+@patch("conserver.apt.DebianPackage.from_installed_package")
+def test_install_version_installed(
+    from_installed_package_mock: MagicMock,
+    from_system_mock: MagicMock,
+    write_config_mock: MagicMock,
+    run_mock: MagicMock,
+):
+    """Test that apt is not run again when conserver is already at the pinned version."""
+    from_installed_package_mock.return_value = apt.DebianPackage(
+        "conserver-server", "8.2.7-1", "", "amd64", apt.PackageState.Present
+    )
+    Conserver().install("8.2.7-1")
+    assert all(call.args[0][0] == "apt-mark" for call in run_mock.call_args_list)
+
+
+LOCAL_DEBS = {
+    name: LocalDeb(name, "8.2.7-1", Path(f"/debs/{name}.deb"))
+    for name in ("conserver-server", "conserver-client", "ipmitool")
+}
+
+
+@patch("conserver.install_debs")
+@patch("conserver.subprocess.run")
+@patch("conserver.Conserver.write_server_config")
+@patch("conserver.apt.DebianPackage.from_system")
+def test_install_local(
+    from_system_mock: MagicMock,
+    write_config_mock: MagicMock,
+    run_mock: MagicMock,
+    install_debs_mock: MagicMock,
+):
+    """Test that attached packages are installed before apt looks up the others."""
+    conserver = Conserver()
+    conserver.install("8.2.7-1", LOCAL_DEBS)
+    assert [list(call.args[0]) for call in install_debs_mock.call_args_list] == [
+        [LOCAL_DEBS["ipmitool"]],
+        [LOCAL_DEBS["conserver-server"], LOCAL_DEBS["conserver-client"]],
+    ]
+    assert all(call.args[0][0] == "apt-mark" for call in run_mock.call_args_list)
+
+
+@patch("conserver.install_debs")
+@patch("conserver.subprocess.run")
+def test_upgrade_local(run_mock: MagicMock, install_debs_mock: MagicMock):
+    """Test that upgrades use the attached packages at the version, or else apt."""
+    conserver = Conserver()
+    conserver.stage_upgrade("8.2.7-1", LOCAL_DEBS)
+    conserver.upgrade("8.2.7-1", LOCAL_DEBS)
+    run_mock.assert_not_called()
+    install_debs_mock.assert_called_once()
+    conserver.upgrade("8.2.8-1", LOCAL_DEBS)
+    assert run_mock.call_args.args[0][-1] == "conserver-client=8.2.8-1"
+
+
+@patch("conserver.subprocess.run")
+def test_stage_upgrade(run_mock: MagicMock):
+    """Test that the packages of a version are only downloaded when staged."""
+    Conserver().stage_upgrade("8.2.7-1")
+    command = run_mock.call_args.args[0]
+    assert "--download-only" in command
+    assert "--allow-change-held-packages" in command
+
+
+@patch("conserver.subprocess.run")
+def test_upgrade_failure(run_mock: MagicMock):
+    """Test that a failed upgrade raises a package error."""
+    run_mock.side_effect = subprocess.CalledProcessError(100, "apt-get", stderr="E: not found")
+    with pytest.raises(apt.PackageError, match="not found"):
+        Conserver().upgrade("8.2.7-1")
+
+
+@patch("conserver.apt.DebianPackage.from_installed_package")
+def test_package_version(from_installed_package_mock: MagicMock):
+    """Test that the installed package version has no architecture, and is empty when missing."""
+    from_installed_package_mock.return_value = apt.DebianPackage(
+        "conserver-server", "8.2.6-1", "", "amd64", apt.PackageState.Present
+    )
+    assert Conserver().package_version == "8.2.6-1"
+    from_installed_package_mock.return_value = apt.DebianPackage(
+        "conserver-server", "8.2.6-1", "1", "amd64", apt.PackageState.Present
+    )
+    assert Conserver().package_version == "1:8.2.6-1"
+    from_installed_package_mock.side_effect = apt.PackageNotFoundError
+    assert Conserver().package_version == ""
+
+
+@patch("conserver.subprocess.run")
+def test_broadcast(run_mock: MagicMock):
+    """Test that messages are sent to the clients of every instance, ignoring failures."""
+    run_mock.side_effect = [subprocess.TimeoutExpired("console", 5), None]
+    Conserver(instances=2).broadcast("upgrading")
+    assert [call.args[0][4] for call in run_mock.call_args_list] == ["3109", "3110"]
+
+
+@patch("conserver.subprocess.run")
+@patch("conserver.apt.DebianPackage.from_system")
+def test_uninstall(from_system_mock: MagicMock, run_mock: MagicMock):
+    """Test that conserver is released and uninstalled."""
     conserver = Conserver()
     conserver.uninstall()
+    assert run_mock.call_args.args[0][:2] == ["apt-mark", "unhold"]
     conserver.conserver_deb.ensure.assert_called_with(apt.PackageState.Absent)  # type: ignore
 
 
+def test_services():
+    """Test that instances are run as systemd template services."""
+    assert Conserver().services == [CONSERVER_SERVICE]
+    assert Conserver(instances=3).services == ["conserver@0", "conserver@1", "conserver@2"]
+
+
+@patch("conserver.systemd.service_reload")
+def test_reload_instances(service_reload_mock: MagicMock):
+    """Test that reload method reloads every instance."""
+    conserver = Conserver(instances=2)
+    conserver.reload()
+    assert service_reload_mock.call_count == 2
+
+
 @patch("conserver.systemd.service_enable")
 def test_start(service_enable_mock: MagicMock):
     """Test that start method enables and starts the service."""
@@ -115,6 +367,21 @@ def test_reload_raise_errors(service_reload_mock: MagicMock):
     pytest.raises(systemd.SystemdError, conserver.reload, ignore_errors=False)
 
 
+@patch("conserver.systemd.service_restart")
+def test_restart(service_restart_mock: MagicMock):
+    """Test that restart method restarts the service."""
+    conserver = Conserver()
+    conserver.restart()
+    service_restart_mock.assert_called_once_with(CONSERVER_SERVICE)
+
+
+@patch("conserver.systemd.service_restart", side_effect=systemd.SystemdError)
+def test_restart_raise_errors(service_restart_mock: MagicMock):
+    """Test that restart method raises errors when not ignoring."""
+    conserver = Conserver()
+    pytest.raises(systemd.SystemdError, conserver.restart, ignore_errors=False)
+
+
 @patch("conserver.systemd.service_disable")
 def test_stop(service_disable_mock: MagicMock):
     """Test that stop method disables the service."""
@@ -137,6 +404,101 @@ def test_stop_raise_errors(service_disable_mock: MagicMock):
     pytest.raises(systemd.SystemdError, conserver.stop, ignore_errors=False)
 
 
+@patch("conserver.subprocess.check_output")
+def test_console_states(check_output_mock: MagicMock):
+    """Test that the console states of all the conserver processes are collected."""
+    check_output_mock.side_effect = [
+        "a   up   <none>\nb   down <none>\n",
+        subprocess.TimeoutExpired("console", 10),
+    ]
+    conserver = Conserver(instances=2)
+    assert conserver.console_states() == {"a": True, "b": False}
+    assert check_output_mock.call_args.args[0] == [
+        "console", "-M", "127.0.0.1", "-p", "3110", "-u"
+    ]  # fmt: skip
+
+
+@pytest.fixture
+def exporter_unit(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Redirect the exporter unit and metrics directory to a temporary directory."""
+    path = tmp_path / "conserver-exporter.service"
+    monkeypatch.setattr(conserver_module, "EXPORTER_UNIT_FILE", str(path))
+    monkeypatch.setattr(conserver_module, "METRICS_DIR", str(tmp_path / "metrics"))
+    return path
+
+
+@patch("conserver.systemd.service_restart")
+@patch("conserver.systemd.service_enable")
+@patch("conserver.systemd.daemon_reload")
+def test_configure_exporter(
+    daemon_reload_mock: MagicMock,
+    service_enable_mock: MagicMock,
+    service_restart_mock: MagicMock,
+    exporter_unit: Path,
+):
+    """Test that the exporter is installed once and scrapes every instance."""
+    conserver = Conserver(instances=2)
+    conserver.configure_exporter(9469, Path("/charm/src/exporter.py"))
+    conserver.configure_exporter(9469, Path("/charm/src/exporter.py"))
+    unit = exporter_unit.read_text()
+    assert "/charm/src/exporter.py --listen-port 9469" in unit
+    assert "--conserver-port 3109 --conserver-port 3110" in unit
+    assert (exporter_unit.parent / "metrics").is_dir()
+    daemon_reload_mock.assert_called_once()
+    service_enable_mock.assert_called_once_with("conserver-exporter")
+    service_restart_mock.assert_called_once_with("conserver-exporter")
+
+
+@patch("conserver.systemd.service_disable", side_effect=systemd.SystemdError)
+def test_remove_exporter(service_disable_mock: MagicMock, exporter_unit: Path):
+    """Test that the exporter unit is removed even if it cannot be stopped."""
+    exporter_unit.write_text("")
+    Conserver().remove_exporter()
+    assert not exporter_unit.exists()
+
+
+@pytest.fixture
+def logrotate_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Redirect the log rotation files to a temporary directory."""
+    for name in (
+        "LOGROTATE_CONF",
+        "LOGROTATE_UNIT_FILE",
+        "LOGROTATE_TIMER_FILE",
+        "PACKAGE_LOGROTATE_CONF",
+    ):
+        monkeypatch.setattr(
+            conserver_module, name, str(tmp_path / Path(getattr(conserver_module, name)).name)
+        )
+    return tmp_path
+
+
+@patch("conserver.systemd.service_enable")
+@patch("conserver.systemd.daemon_reload")
+def test_configure_log_rotation(
+    daemon_reload_mock: MagicMock, service_enable_mock: MagicMock, logrotate_files: Path
+):
+    """Test that log rotation is installed once, superseding the package configuration."""
+    (logrotate_files / "conserver-server").write_text("/var/log/conserver/*.log {\n}\n")
+    conserver = Conserver()
+    conserver.configure_log_rotation("rotation")
+    conserver.configure_log_rotation("rotation")
+    assert (logrotate_files / "logrotate.conf").read_text() == "rotation"
+    assert "{" not in (logrotate_files / "conserver-server").read_text()
+    assert "Nice=19" in (logrotate_files / "conserver-logrotate.service").read_text()
+    assert "OnCalendar=hourly" in (logrotate_files / "conserver-logrotate.timer").read_text()
+    daemon_reload_mock.assert_called_once()
+    service_enable_mock.assert_called_once_with("--now", "conserver-logrotate.timer")
+
+
+@patch("conserver.systemd.service_disable")
+def test_remove_log_rotation(service_disable_mock: MagicMock, logrotate_files: Path):
+    """Test that log rotation is stopped and its files removed."""
+    (logrotate_files / "logrotate.conf").write_text("rotation")
+    Conserver().remove_log_rotation()
+    assert not (logrotate_files / "logrotate.conf").exists()
+    service_disable_mock.assert_called_once_with("--now", "conserver-logrotate.timer")
+
+
 @patch("conserver.Path.write_text")
 def test_write_server_config(write_text_mock: MagicMock):
     """Test that server config is written to the correct file."""
@@ -145,6 +507,65 @@ def test_write_server_config(write_text_mock: MagicMock):
     write_text_mock.assert_called_once()
 
 
+@patch("conserver.Path.write_text", autospec=True)
+def test_write_server_config_ports(write_text_mock: MagicMock):
+    """Test that the configured listen and base ports are used."""
+    conserver = Conserver(port=4109, base_port=40000)
+    conserver.write_server_config()
+    assert "-p 4109 -b 40000" in write_text_mock.call_args.args[1]
+    assert conserver.ports == [4109]
+
+
+@pytest.fixture
+def limits_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Redirect the resource limits files to a temporary directory."""
+    monkeypatch.setattr(conserver_module, "LIMITS_DROPIN", str(tmp_path / "{unit}.d/limits.conf"))
+    monkeypatch.setattr(conserver_module, "SYSCTL_CONF", str(tmp_path / "sysctl.conf"))
+    return tmp_path
+
+
+@patch("conserver.subprocess.run")
+@patch("conserver.systemd.daemon_reload")
+def test_write_resource_limits(
+    daemon_reload_mock: MagicMock, run_mock: MagicMock, limits_files: Path
+):
+    """Test that limits are only rewritten, and the kernel settings applied, on change."""
+    run_mock.return_value = MagicMock(returncode=255, stderr="permission denied")
+    conserver = Conserver(instances=2)
+    assert conserver.write_resource_limits(conserver.resource_plan(900))
+    assert not conserver.write_resource_limits(conserver.resource_plan(1000))
+    assert conserver.write_resource_limits(conserver.resource_plan(100_000))
+    dropin = limits_files / "conserver@.service.d" / "limits.conf"
+    assert "LimitNOFILE=524288" in dropin.read_text()
+    assert "33000-" in (limits_files / "sysctl.conf").read_text()
+    assert daemon_reload_mock.call_count == 2
+    run_mock.assert_called_with(
+        ["sysctl", "-p", str(limits_files / "sysctl.conf")],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+
+@patch("conserver.systemd.daemon_reload")
+@patch("conserver.Path.write_text", autospec=True)
+def test_write_server_config_instances(write_text_mock: MagicMock, daemon_reload_mock: MagicMock):
+    """Test that each instance gets its own ports and conserver.cf."""
+    conserver = Conserver(instances=2)
+    conserver.write_server_config()
+    written = {str(call.args[0]): call.args[1] for call in write_text_mock.call_args_list}
+    assert (
+        "-p 3109 -b 33000 -C /etc/conserver/conserver-0.cf"
+        in written["/etc/conserver/server-0.conf"]
+    )
+    assert (
+        "-p 3110 -b 34000 -C /etc/conserver/conserver-1.cf"
+        in written["/etc/conserver/server-1.conf"]
+    )
+    assert "/etc/systemd/system/conserver@.service" in written
+    daemon_reload_mock.assert_called_once()
+
+
 @patch("conserver.Path.write_text", side_effect=OSError)
 def test_write_server_config_failure(write_text_mock: MagicMock):
     """Test that write_server_config raises an error on failure."""
@@ -152,40 +573,188 @@ def test_write_server_config_failure(write_text_mock: MagicMock):
     pytest.raises(OSError, conserver.write_server_config)
 
 
-@patch("conserver.Path")
-@patch("conserver.os.chown")
-def test_write_conserver_config(chown_mock: MagicMock, path_mock: MagicMock):
+@patch("conserver.Path.read_text", return_value="console a { }")
+def test_read_conserver_config(read_text_mock: MagicMock):
+    """Test that the deployed conserver config is read."""
+    conserver = Conserver()
+    assert conserver.read_conserver_config() == "console a { }"
+
+
+@patch("conserver.Path.read_text", side_effect=FileNotFoundError)
+def test_read_conserver_config_missing(read_text_mock: MagicMock):
+    """Test that a missing conserver config reads as empty."""
+    conserver = Conserver()
+    assert conserver.read_conserver_config() == ""
+
+
+@pytest.fixture
+def etc(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Redirect the conserver files to a temporary directory."""
+    monkeypatch.setattr(conserver_module, "CONSERVER_CF", str(tmp_path / "conserver.cf"))
+    monkeypatch.setattr(conserver_module, "CONSERVER_PASSWD", str(tmp_path / "conserver.passwd"))
+    monkeypatch.setattr(
+        conserver_module, "INSTANCE_CONSERVER_CF", str(tmp_path / "conserver-{instance}.cf")
+    )
+    monkeypatch.setattr(conserver_module, "CONF_D", str(tmp_path / "conf.d"))
+    with (
+        patch("conserver.os.fchown"),
+        patch("conserver.Conserver.gid", new_callable=PropertyMock(return_value=os.getgid())),
+        patch("conserver.subprocess.run", return_value=MagicMock(returncode=0)),
+    ):
+        yield tmp_path
+
+
+def test_write_conserver_config(etc: Path):
     """Test that conserver config is written correctly."""
     conserver = Conserver()
     test_content = "test conserver config"
     conserver.write_conserver_config(test_content)
-    path_mock.return_value.write_text.assert_called_once_with(test_content, encoding="utf-8")
-    path_mock.return_value.chmod.assert_called_once()
-    chown_mock.assert_called_once()
+    path = etc / "conserver.cf"
+    assert path.read_text() == test_content
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert sorted(p.name for p in etc.iterdir()) == ["conserver.cf"]
 
 
-@patch("conserver.Path.write_text", side_effect=OSError)
-def test_write_conserver_config_failure(write_text_mock: MagicMock):
+def test_write_conserver_config_keeps_previous(etc: Path):
+    """Test that the previous conserver config is kept when replaced."""
+    conserver = Conserver()
+    conserver.write_conserver_config("console a { }\n")
+    conserver.write_conserver_config("console b { }\n")
+    assert conserver.read_conserver_config() == "console b {\n}\n"
+    assert (etc / "conserver.cf.last-good").read_text() == (
+        f"#include {etc}/conf.d/conserver/ungrouped.cf\n"
+    )
+    assert (etc / "conf.d" / "conserver.last-good" / "ungrouped.cf").read_text() == (
+        "console a {\n}\n"
+    )
+
+
+def test_write_conserver_config_invalid(etc: Path):
+    """Test that a config rejected by conserver is not deployed."""
+    conserver = Conserver()
+    conserver.write_conserver_config("console a { }\n")
+    with patch("conserver.subprocess.run") as run_mock:
+        run_mock.return_value = MagicMock(returncode=1, stderr="syntax error")
+        pytest.raises(ConfigValidationError, conserver.write_conserver_config, "console {")
+        assert run_mock.call_args.args[0][:2] == [CONSERVER_BIN, "-S"]
+    assert conserver.read_conserver_config() == "console a {\n}\n"
+    assert sorted(p.name for p in etc.iterdir()) == ["conf.d", "conserver.cf"]
+
+
+def test_rollback_conserver_config(etc: Path):
+    """Test that the previous conserver config is restored on rollback."""
+    conserver = Conserver()
+    assert conserver.rollback_conserver_config() is False
+    conserver.write_conserver_config("console a { }\n")
+    conserver.write_conserver_config("console b { }\n")
+    assert conserver.rollback_conserver_config() is True
+    assert conserver.read_conserver_config() == "console a {\n}\n"
+
+
+def test_write_conserver_config_instances(etc: Path):
+    """Test that the consoles are split across the instances' conserver.cf files."""
+    conserver = Conserver(instances=2)
+    conserver.write_conserver_config("console a { }\nconsole b { }\nconsole c { }\n")
+    consoles = "".join(path.read_text() for path in etc.glob("conf.d/conserver-*/*.cf"))
+    assert sorted(line for line in consoles.splitlines() if line.startswith("console")) == [
+        "console a {",
+        "console b {",
+        "console c {",
+    ]
+
+
+GROUPED_CF = """\
+default rack1 { type exec; }
+default rack2 { type exec; }
+console a { include rack1; exec a; }
+console b { include rack2; exec b; }
+console c { exec c; }
+"""
+
+
+def test_write_conserver_config_fragments(etc: Path):
+    """Test that only the fragments of the groups that changed are rewritten."""
+    conserver = Conserver()
+    conserver.write_conserver_config(GROUPED_CF)
+    fragments = etc / "conf.d" / "conserver"
+    assert (etc / "conserver.cf").read_text() == (
+        "default rack1 {\n  type exec;\n}\n"
+        "default rack2 {\n  type exec;\n}\n"
+        f"#include {fragments}/group-rack1.cf\n"
+        f"#include {fragments}/group-rack2.cf\n"
+        f"#include {fragments}/ungrouped.cf\n"
+    )
+    assert (fragments / "group-rack1.cf").read_text() == (
+        "console a {\n  include rack1;\n  exec a;\n}\n"
+    )
+    inodes = {path.name: path.stat().st_ino for path in fragments.iterdir()}
+
+    conserver.write_conserver_config(GROUPED_CF.replace("exec a;", "exec a2;"))
+    changed = [
+        path.name for path in fragments.iterdir() if path.stat().st_ino != inodes[path.name]
+    ]
+    assert changed == ["group-rack1.cf"]
+
+    # The fragments of removed groups are removed
+    conserver.write_conserver_config(
+        GROUPED_CF.replace("console b { include rack2; exec b; }", "")
+    )
+    assert sorted(path.name for path in fragments.iterdir()) == ["group-rack1.cf", "ungrouped.cf"]
+    assert "console b" not in conserver.read_conserver_config()
+
+
+def test_write_conserver_config_restricts(etc: Path):
+    """Test that unchanged files deployed world-readable are restricted."""
+    conserver = Conserver()
+    conserver.write_conserver_config(GROUPED_CF)
+    fragment = etc / "conf.d" / "conserver" / "group-rack1.cf"
+    assert fragment.stat().st_mode & 0o777 == 0o640
+    for path in (fragment, etc / "conserver.cf"):
+        path.chmod(0o644)
+    with patch("conserver.os.chown"):
+        conserver.write_conserver_config(GROUPED_CF)
+    assert fragment.stat().st_mode & 0o777 == 0o640
+    assert (etc / "conserver.cf").stat().st_mode & 0o777 == 0o640
+
+
+def test_write_conserver_config_own_includes(etc: Path):
+    """Test that files including other files are deployed as they are."""
+    conserver = Conserver()
+    conserver.write_conserver_config(GROUPED_CF)
+    contents = "#include /etc/conserver/consoles.cf\nconsole a { }\n"
+    conserver.write_conserver_config(contents)
+    assert (etc / "conserver.cf").read_text() == contents
+    assert list((etc / "conf.d" / "conserver").iterdir()) == []
+
+
+@patch("conserver.os.fdopen", side_effect=OSError)
+def test_write_conserver_config_failure(fdopen_mock: MagicMock, etc: Path):
     """Test that write_conserver_config raises an error on failure."""
     conserver = Conserver()
     pytest.raises(OSError, conserver.write_conserver_config, "test content")
+    assert list(etc.iterdir()) == []
 
 
-@patch("conserver.Conserver.uid", new_callable=MagicMock(return_value=1))
-@patch("conserver.Path")
-@patch("conserver.os.chown")
-def test_write_passwd_file(chown_mock: MagicMock, path_mock: MagicMock, uid_mock: MagicMock):
+@patch("conserver.Conserver.uid", new_callable=PropertyMock(return_value=1))
+def test_write_passwd_file(uid_mock: MagicMock, etc: Path):
     """Test that passwd file is written correctly."""
     conserver = Conserver()
     test_content = "test passwd content"
     conserver.write_passwd_file(test_content)
-    path_mock.return_value.write_text.assert_called_once_with(test_content, encoding="utf-8")
-    path_mock.return_value.chmod.assert_called_once()
-    chown_mock.assert_called_once()
+    path = etc / "conserver.passwd"
+    assert path.read_text() == test_content
+    assert path.stat().st_mode & 0o777 == 0o600
 
 
-@patch("conserver.Path.write_text", side_effect=OSError)
-def test_write_passwd_file_failure(write_text_mock: MagicMock):
+@patch("conserver.Conserver.uid", new_callable=PropertyMock(return_value=1))
+@patch("conserver.os.replace", side_effect=OSError)
+def test_write_passwd_file_failure(replace_mock: MagicMock, uid_mock: MagicMock, etc: Path):
     """Test that write_passwd_file raises an error on failure."""
     conserver = Conserver()
     pytest.raises(OSError, conserver.write_passwd_file, "test content")
+
+
+def test_file_digest():
+    """Test that file_digest is stable and sensitive to content changes."""
+    assert file_digest("console a {}") == file_digest("console a {}")
+    assert file_digest("console a {}") != file_digest("console b {}")
@@ -0,0 +1,108 @@
+"""Unit tests for conserver_cf.py."""
+
+import pytest
+
+from conserver_cf import Action, Block, ConfigParseError, diff_configs, parse_config
+
+CONSERVER_CF = """\
+# Global settings
+config * {
+  primaryport 3109;
+}
+default ipmi {
+  type exec;
+  exec "ipmitool -I lanplus -H &.bmc sol activate";
+  rw *;
+}
+console node1 { include ipmi; }
+console node2 {
+  include ipmi;
+  master localhost;   # trailing comment
+}
+"""
+
+
+def test_parse_config():
+    """Test that blocks and items are parsed into the model."""
+    model = parse_config(CONSERVER_CF)
+    assert [(block.kind, block.name) for block in model.blocks] == [
+        ("config", "*"),
+        ("default", "ipmi"),
+        ("console", "node1"),
+        ("console", "node2"),
+    ]
+    assert model.consoles["node2"].items == (("include", "ipmi"), ("master", "localhost"))
+    assert model.blocks_of("default")["ipmi"].items[1] == (
+        "exec",
+        '"ipmitool -I lanplus -H &.bmc sol activate"',
+    )
+
+
+def test_parse_config_roundtrip():
+    """Test that a rendered model parses back to the same model."""
+    model = parse_config(CONSERVER_CF)
+    assert parse_config(model.render()) == model
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        "console a { type exec; ",
+        "consoles a { type exec; }",
+        "console { type exec; }",
+        "console a type exec; }",
+        "console a { type exec }",
+        'console a { exec "unterminated; }',
+    ],
+)
+def test_parse_config_invalid(contents: str):
+    """Test that malformed files raise ConfigParseError."""
+    with pytest.raises(ConfigParseError):
+        parse_config(contents)
+
+
+def test_block_render():
+    """Test that a block is rendered in conserver.cf syntax."""
+    block = Block("console", "a", (("type", "exec"), ("rw", "*")))
+    assert block.render() == "console a {\n  type exec;\n  rw *;\n}\n"
+
+
+def test_diff_configs_unchanged():
+    """Test that formatting-only changes need no action."""
+    old = parse_config(CONSERVER_CF)
+    new = parse_config("# reformatted\n" + old.render())
+    changes = diff_configs(old, new)
+    assert not changes.consoles_changed
+    assert changes.action == Action.NONE
+
+
+def test_diff_configs_consoles():
+    """Test that console additions, removals and changes are reported."""
+    old = parse_config(CONSERVER_CF)
+    new = parse_config(
+        CONSERVER_CF.replace(
+            "console node1 { include ipmi; }", "console node3 { include ipmi; }"
+        ).replace("master localhost;", "master conserver-1;")
+    )
+    changes = diff_configs(old, new)
+    assert changes.added == ("node3",)
+    assert changes.removed == ("node1",)
+    assert changes.changed == ("node2",)
+    assert changes.action == Action.RELOAD
+    assert changes.summary() == "1 added, 1 removed, 1 changed consoles"
+
+
+def test_diff_configs_default_changed():
+    """Test that changes to non-console blocks need a reload."""
+    old = parse_config(CONSERVER_CF)
+    new = parse_config(CONSERVER_CF.replace("rw *;", "rw admin;"))
+    changes = diff_configs(old, new)
+    assert not changes.consoles_changed
+    assert changes.action == Action.RELOAD
+
+
+def test_diff_configs_config_changed():
+    """Test that changes to config blocks need a restart."""
+    old = parse_config(CONSERVER_CF)
+    new = parse_config(CONSERVER_CF.replace("primaryport 3109;", "primaryport 3110;"))
+    assert diff_configs(old, new).action == Action.RESTART
@@ -0,0 +1,85 @@
+"""Unit tests for debs.py."""
+
+import gzip
+import hashlib
+import io
+import subprocess
+import tarfile
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from debs import LocalDeb, extract_debs, install_debs, installed_versions, read_debs
+from payload import ChecksumError
+
+
+def _archive(path: Path, members: dict[str, bytes]) -> bytes:
+    """Write a gzip compressed tar archive, returning its uncompressed contents."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    path.write_bytes(gzip.compress(buffer.getvalue()))
+    return buffer.getvalue()
+
+
+def test_extract_debs(tmp_path: Path):
+    """Test that only the .deb files are extracted, flattened, replacing the previous ones."""
+    archive = tmp_path / "packages.tar.gz"
+    tar = _archive(
+        archive,
+        {"pool/a_1_amd64.deb": b"a", "../b_1_amd64.deb": b"b", "README": b"readme"},
+    )
+    dest = tmp_path / "debs"
+    dest.mkdir()
+    (dest / "old_1_amd64.deb").touch()
+    extract_debs(archive, dest, hashlib.sha256(tar).hexdigest())
+    assert sorted(path.name for path in dest.iterdir()) == ["a_1_amd64.deb", "b_1_amd64.deb"]
+    assert (dest / "b_1_amd64.deb").read_bytes() == b"b"
+    assert not (tmp_path / "b_1_amd64.deb").exists()
+
+
+def test_extract_debs_checksum_mismatch(tmp_path: Path):
+    """Test that archives not matching their checksum are not extracted."""
+    archive = tmp_path / "packages.tar.gz"
+    _archive(archive, {"a_1_amd64.deb": b"a"})
+    with pytest.raises(ChecksumError):
+        extract_debs(archive, tmp_path / "debs", "0" * 64)
+    assert not (tmp_path / "debs").exists()
+
+
+@patch("debs.subprocess.check_output")
+def test_read_debs(check_output_mock: MagicMock, tmp_path: Path):
+    """Test that package files are listed by package name."""
+    (tmp_path / "ipmitool_1.8.19-7_amd64.deb").touch()
+    check_output_mock.return_value = "ipmitool\t1.8.19-7"
+    assert read_debs(tmp_path) == {
+        "ipmitool": LocalDeb("ipmitool", "1.8.19-7", tmp_path / "ipmitool_1.8.19-7_amd64.deb")
+    }
+
+
+@patch("debs.subprocess.run")
+def test_installed_versions(run_mock: MagicMock):
+    """Test that packages known to dpkg but not installed are left out."""
+    run_mock.return_value = subprocess.CompletedProcess(
+        [], 1, stdout="ipmitool\t1.8.19-7\tinstalled\nzstd\t1.5.5\tconfig-files\n"
+    )
+    assert installed_versions(["ipmitool", "zstd", "unknown"]) == {"ipmitool": "1.8.19-7"}
+
+
+@patch("debs.installed_versions")
+@patch("debs.subprocess.run")
+def test_install_debs(run_mock: MagicMock, installed_versions_mock: MagicMock):
+    """Test that only the packages not installed at their version are installed, offline."""
+    installed_versions_mock.return_value = {"a": "1", "b": "1"}
+    debs = [LocalDeb("a", "1", Path("/debs/a.deb")), LocalDeb("b", "2", Path("/debs/b.deb"))]
+    assert install_debs(debs) == ["b"]
+    command = run_mock.call_args.args[0]
+    assert "--no-download" in command
+    assert command[-1] == "/debs/b.deb"
+    installed_versions_mock.return_value = {"a": "1", "b": "2"}
+    assert install_debs(debs) == []
+    run_mock.assert_called_once()
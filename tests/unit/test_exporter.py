@@ -0,0 +1,88 @@
+"""Unit tests for exporter.py."""
+
+import subprocess
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from exporter import (
+    collect,
+    collect_consoles,
+    collect_logs,
+    collect_processes,
+    parse_console_users,
+)
+
+CONSOLE_USERS = """\
+server1                 up   <none>
+server2                 up   admin@10.0.0.1, ops@10.0.0.2
+server3                 down <none>
+"""
+
+
+def test_parse_console_users():
+    """Test that the state and number of clients of each console are parsed."""
+    assert parse_console_users(CONSOLE_USERS) == {
+        "server1": (True, 0),
+        "server2": (True, 2),
+        "server3": (False, 0),
+    }
+
+
+@patch("exporter.subprocess.check_output", return_value=CONSOLE_USERS)
+def test_collect_consoles(check_output_mock: MagicMock):
+    """Test that console metrics are collected from each conserver."""
+    lines = collect_consoles([3109])
+    assert 'conserver_up{port="3109"} 1' in lines
+    assert 'conserver_console_up{console="server3"} 0' in lines
+    assert 'conserver_console_clients{console="server2"} 2' in lines
+    assert check_output_mock.call_args.args[0] == [
+        "console", "-M", "127.0.0.1", "-p", "3109", "-u"
+    ]  # fmt: skip
+
+
+@patch("exporter.subprocess.check_output", side_effect=subprocess.CalledProcessError(1, ""))
+def test_collect_consoles_down(check_output_mock: MagicMock):
+    """Test that a conserver that does not answer is reported down."""
+    assert 'conserver_up{port="3110"} 0' in collect_consoles([3110])
+
+
+def test_collect_processes(tmp_path: Path):
+    """Test that conserver processes and their file descriptors are counted."""
+    for pid, comm, fds in (("1", "conserver", 3), ("2", "conserver", 2), ("3", "sshd", 5)):
+        (tmp_path / pid / "fd").mkdir(parents=True)
+        (tmp_path / pid / "comm").write_text(f"{comm}\n")
+        for fd in range(fds):
+            (tmp_path / pid / "fd" / str(fd)).touch()
+    (tmp_path / "self").mkdir()
+    lines = collect_processes(tmp_path)
+    assert "conserver_processes 2" in lines
+    assert "conserver_open_fds 5" in lines
+
+
+def test_collect_logs(tmp_path: Path):
+    """Test that the size of each console log is collected."""
+    (tmp_path / "server1.log").write_text("boot\n")
+    assert 'conserver_log_bytes{file="server1.log"} 5' in collect_logs(tmp_path)
+    assert len(collect_logs(tmp_path / "missing")) == 2
+
+
+def test_collect_logs_rotated(tmp_path: Path):
+    """Test that rotated segments are not collected, only the live logs."""
+    (tmp_path / "rack1").mkdir()
+    (tmp_path / "rack1" / "server1.log").write_text("boot\n")
+    (tmp_path / "rack1" / "server2.log-20250101-1735689600.zst").write_text("old\n")
+    (tmp_path / "rack1" / ".rotated").mkdir()
+    (tmp_path / "rack1" / ".rotated" / "server1.log-20250101-1735689600").write_text("old\n")
+    lines = collect_logs(tmp_path)
+    assert lines[2:] == ['conserver_log_bytes{file="rack1/server1.log"} 5']
+
+
+@patch("exporter.collect_processes", return_value=[])
+@patch("exporter.collect_consoles", return_value=[])
+def test_collect_textfile(consoles_mock: MagicMock, processes_mock: MagicMock, tmp_path: Path):
+    """Test that the metrics recorded by the charm are included."""
+    textfile = tmp_path / "charm.prom"
+    textfile.write_text('conserver_charm_hook_duration_seconds_last{hook="install"} 1.5\n')
+    output = collect([3109], tmp_path / "logs", textfile)
+    assert output.endswith('conserver_charm_hook_duration_seconds_last{hook="install"} 1.5\n')
+    assert collect([3109], tmp_path / "logs", tmp_path / "missing").endswith("gauge\n")
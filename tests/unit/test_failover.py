@@ -0,0 +1,76 @@
+"""Unit tests for failover.py."""
+
+import ipaddress
+import json
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from failover import FloatingAddress, FloatingAddressError
+
+INTERFACES = [
+    ("lo", ipaddress.ip_network("127.0.0.0/8")),
+    ("eth0", ipaddress.ip_network("10.0.0.0/24")),
+    ("eth1", None),
+]
+IP_ADDRESS_SHOW = json.dumps(
+    [{"ifname": "eth0", "addr_info": [{"local": "10.0.0.5"}, {"local": "10.0.0.10"}]}]
+)
+
+
+def test_on_interfaces():
+    """Test that the floating address gets the interface and prefix of its subnet."""
+    floating = FloatingAddress.on_interfaces("10.0.0.10", INTERFACES)
+    assert floating == FloatingAddress(ipaddress.ip_interface("10.0.0.10/24"), "eth0")
+
+
+@pytest.mark.parametrize("address", ["10.1.0.10", "not an address"])
+def test_on_interfaces_invalid(address: str):
+    """Test that addresses outside the subnets of the unit are rejected."""
+    with pytest.raises(FloatingAddressError):
+        FloatingAddress.on_interfaces(address, INTERFACES)
+
+
+@patch("failover.subprocess.check_output", return_value=IP_ADDRESS_SHOW)
+def test_assigned(check_output_mock: MagicMock):
+    """Test that assigned addresses are found in the addresses of the interface."""
+    assert FloatingAddress.on_interfaces("10.0.0.10", INTERFACES).assigned
+    assert not FloatingAddress.on_interfaces("10.0.0.11", INTERFACES).assigned
+
+
+@patch("failover.subprocess.run")
+def test_assign(run_mock: MagicMock):
+    """Test that the address is assigned and announced with gratuitous ARP."""
+    floating = FloatingAddress.on_interfaces("10.0.0.10", INTERFACES)
+    floating.assign()
+    floating.announce()
+    run_mock.assert_any_call(
+        ["ip", "address", "replace", "10.0.0.10/24", "dev", "eth0"], check=True
+    )
+    run_mock.assert_any_call(
+        ["arping", "-q", "-U", "-c", "3", "-I", "eth0", "10.0.0.10"], check=True
+    )
+
+
+@patch("failover.subprocess.run")
+@patch("failover.subprocess.check_output", return_value=IP_ADDRESS_SHOW)
+def test_release(check_output_mock: MagicMock, run_mock: MagicMock):
+    """Test that the address is only removed when it is assigned."""
+    FloatingAddress.on_interfaces("10.0.0.11", INTERFACES).release()
+    run_mock.assert_not_called()
+    FloatingAddress.on_interfaces("10.0.0.10", INTERFACES).release()
+    run_mock.assert_called_once_with(
+        ["ip", "address", "delete", "10.0.0.10/24", "dev", "eth0"], check=True
+    )
+
+
+@patch("failover.subprocess.run", side_effect=subprocess.CalledProcessError(2, "ip"))
+@patch("failover.subprocess.check_output", return_value=IP_ADDRESS_SHOW)
+def test_assign_release_failure(check_output_mock: MagicMock, run_mock: MagicMock):
+    """Test that failures to move the address are raised as FloatingAddressError."""
+    floating = FloatingAddress.on_interfaces("10.0.0.10", INTERFACES)
+    with pytest.raises(FloatingAddressError, match="cannot assign"):
+        floating.assign()
+    with pytest.raises(FloatingAddressError, match="cannot release"):
+        floating.release()
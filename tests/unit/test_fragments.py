@@ -0,0 +1,42 @@
+"""Unit tests for fragments.py."""
+
+from conserver_cf import parse_config
+from fragments import expand_includes, fragment_name, render_includes, split_config
+
+
+def test_fragment_name():
+    """Test that fragments are named after their group, with unsafe characters replaced."""
+    assert fragment_name(None) == "ungrouped.cf"
+    assert fragment_name("rack1") == "group-rack1.cf"
+    assert fragment_name('"rack 1"').startswith("group-rack_1-")
+    assert fragment_name('"rack 1"') != fragment_name('"rack/1"')
+
+
+def test_split_config():
+    """Test that consoles are split by the group they include first."""
+    model = parse_config(
+        "default rack1 { }\n"
+        "console a { include rack1; include extra; }\n"
+        "access * { trusted 127.0.0.1; }\n"
+        "console b { }\n"
+    )
+    assert split_config(model) == (
+        "default rack1 {\n}\naccess * {\n  trusted 127.0.0.1;\n}\n",
+        {
+            "group-rack1.cf": "console a {\n  include rack1;\n  include extra;\n}\n",
+            "ungrouped.cf": "console b {\n}\n",
+        },
+    )
+
+
+def test_split_config_default_after_console():
+    """Test that consoles followed by default blocks are not split."""
+    model = parse_config("console a { }\ndefault * { type exec; }\nconsole b { }\n")
+    assert split_config(model) is None
+
+
+def test_expand_includes():
+    """Test that only the includes of fragments are expanded."""
+    contents = render_includes("default * { }\n", ["/conf.d/a.cf"]) + "#include /other.cf\n"
+    expanded = expand_includes(contents, "/conf.d", lambda path: f"console {path} {{ }}\n")
+    assert expanded == "default * { }\nconsole /conf.d/a.cf { }\n#include /other.cf\n"
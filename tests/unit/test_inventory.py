@@ -0,0 +1,79 @@
+"""Unit tests for inventory.py."""
+
+import json
+
+import pytest
+
+from conserver_cf import parse_config
+from inventory import InventoryError, load_inventory, render_inventory
+
+INVENTORY = """\
+defaults:
+  type: exec
+  exec: ipmitool -I lanplus -H H -U admin -f /etc/conserver/ipmi.pass sol activate
+  execsubst: H=hs
+  rw: [alice, bob]
+groups:
+  rack1:
+    logfile: /var/log/conserver/rack1/&
+consoles:
+  node2:
+    bmc: 10.0.0.2
+    group: rack1
+    master: localhost
+  node1: 10.0.0.1
+"""
+
+
+def test_render_inventory():
+    """Test that the inventory is rendered to conserver.cf blocks."""
+    model = parse_config("".join(render_inventory(load_inventory(INVENTORY))))
+    assert [(block.kind, block.name) for block in model.blocks] == [
+        ("default", "inventory"),
+        ("default", "rack1"),
+        ("console", "node1"),
+        ("console", "node2"),
+    ]
+    defaults = model.blocks_of("default")["inventory"]
+    assert (
+        "exec",
+        '"ipmitool -I lanplus -H H -U admin -f /etc/conserver/ipmi.pass sol activate"',
+    ) in defaults.items
+    assert ("rw", "alice,bob") in defaults.items
+    assert model.blocks_of("default")["rack1"].items[0] == ("include", "inventory")
+    assert model.consoles["node1"].items == (("include", "inventory"), ("host", "10.0.0.1"))
+    assert model.consoles["node2"].items == (
+        ("include", "rack1"),
+        ("host", "10.0.0.2"),
+        ("master", "localhost"),
+    )
+
+
+def test_render_inventory_json():
+    """Test that JSON inventories are accepted."""
+    inventory = load_inventory(json.dumps({"consoles": {"node1": "10.0.0.1"}}))
+    assert "".join(render_inventory(inventory)) == "console node1 {\n  host 10.0.0.1;\n}\n"
+
+
+def test_render_inventory_deterministic():
+    """Test that the rendering does not depend on the order of the inventory."""
+    reordered = INVENTORY.replace("  node1: 10.0.0.1\n", "").replace(
+        "consoles:\n", "consoles:\n  node1: 10.0.0.1\n"
+    )
+    assert "".join(render_inventory(load_inventory(INVENTORY))) == "".join(
+        render_inventory(load_inventory(reordered))
+    )
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        "consoles: [",
+        "consoles: [node1]",
+        "consoles:\n  node1: {bmc: 10.0.0.1, group: missing}",
+    ],
+)
+def test_load_inventory_invalid(contents: str):
+    """Test that invalid inventories raise InventoryError."""
+    with pytest.raises(InventoryError):
+        load_inventory(contents)
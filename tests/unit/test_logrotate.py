@@ -0,0 +1,75 @@
+"""Unit tests for logrotate.py."""
+
+import pytest
+
+from conserver_cf import parse_config
+from logrotate import LogRotation, log_paths, parse_size
+
+CONSERVER_CF = """\
+default full {
+  logfile /var/log/conserver/&.log;
+}
+console rack1-a {
+  logfile "rack1/&";
+}
+console rack1-b {
+  logfile "";
+}
+"""
+
+
+@pytest.mark.parametrize(
+    "value,size",
+    [("512", 512), ("500K", 500 * 1024), ("100m", 100 * 1024**2), ("1 GB", 1024**3)],
+)
+def test_parse_size(value: str, size: int):
+    """Test that sizes are parsed into bytes."""
+    assert parse_size(value) == size
+
+
+@pytest.mark.parametrize("value", ["", "1T", "-1M", "big"])
+def test_parse_size_invalid(value: str):
+    """Test that invalid sizes are rejected."""
+    with pytest.raises(ValueError):
+        parse_size(value)
+
+
+def test_log_paths():
+    """Test that logfile settings are turned into globs."""
+    assert log_paths(parse_config(CONSERVER_CF), "/var/log/conserver") == [
+        "/var/log/conserver/*.log",
+        "/var/log/conserver/rack1/*",
+    ]
+
+
+def test_log_paths_default():
+    """Test that the conserver log directory is used when no logfile is set."""
+    model = parse_config("console a {\n  master localhost;\n}\n")
+    assert log_paths(model, "/var/log/conserver") == ["/var/log/conserver/*.log"]
+
+
+def test_render():
+    """Test that the logrotate configuration enforces the quota and reopens logs."""
+    rotation = LogRotation(
+        max_size=100 * 1024**2, console_quota=1024**3, interval="weekly", retention_days=30
+    )
+    contents = rotation.render(["/var/log/conserver/*.log"], ["conserver@0", "conserver@1"])
+    assert contents.splitlines()[1] == '"/var/log/conserver/*.log" {'
+    assert "    rotate 9\n" in contents
+    assert "    maxsize 104857600\n" in contents
+    assert "    maxage 30\n" in contents
+    assert "    compresscmd /usr/bin/zstd\n" in contents
+    lines = contents.splitlines()
+    postrotate = lines.index("    postrotate")
+    assert lines[postrotate + 1 : postrotate + 3] == [
+        "        systemctl kill --kill-whom=main --signal=USR2 conserver@0 conserver@1 || true",
+        "    endscript",
+    ]
+
+
+def test_render_small_quota():
+    """Test that at least one segment is kept, and rotated logs can be kept forever."""
+    rotation = LogRotation(max_size=1024, console_quota=1024, interval="daily", retention_days=0)
+    contents = rotation.render(["/var/log/conserver/*.log"], ["conserver-server"])
+    assert "    rotate 1\n" in contents
+    assert "maxage" not in contents
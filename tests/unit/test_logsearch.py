@@ -0,0 +1,151 @@
+"""Unit tests for logsearch.py."""
+
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+import logsearch
+from logsearch import LogIndex, parse_mark, parse_time, rotated_segments, search_log, tail_log
+
+START = time.mktime((2025, 10, 17, 9, 0, 0, 0, 0, -1))
+
+
+def _mark(t: float) -> str:
+    return f"[-- MARK -- {time.ctime(t)}]\n"
+
+
+def _log(start: float, minutes: int, prefix: str = "line") -> str:
+    """Generate a log with a MARK line and a few lines every minute."""
+    return "".join(
+        _mark(start + minute * 60) + f"{prefix} {minute} ok\n{prefix} {minute} panic\n"
+        for minute in range(minutes)
+    )
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keep the indexes in a temporary directory, with an entry every few lines."""
+    monkeypatch.setattr(logsearch, "INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(logsearch, "INDEX_STRIDE", 100)
+    return tmp_path / "index"
+
+
+def test_parse_mark():
+    """Test that conserver timestamp lines are parsed."""
+    assert parse_mark(_mark(START).encode()) == START
+    assert parse_mark(f"[-- Console up -- {time.ctime(START)}]".encode()) == START
+    assert parse_mark(b"kernel: [-- not a mark --]") is None
+
+
+def test_parse_time():
+    """Test that absolute and relative times are parsed."""
+    assert parse_time("10m", START) == START - 600
+    assert parse_time("2025-10-17T09:00", 0) == START
+    with pytest.raises(ValueError):
+        parse_time("yesterday", START)
+
+
+def test_index_incremental(tmp_path: Path):
+    """Test that the index only covers complete lines and is extended as the log grows."""
+    data = _log(START, 10).encode()
+    index = LogIndex()
+    assert index.update(data + b"partial", inode=1)
+    assert index.size == len(data)
+    assert index.last_time == START + 540
+    entries = list(index.entries)
+    assert not index.update(data, inode=1)
+    more = data + _log(START + 600, 10).encode()
+    assert index.update(more, inode=1)
+    assert index.entries[: len(entries)] == entries
+    assert index.last_time == START + 1140
+    index.update(b"", inode=2)
+    assert index.entries == [] and index.size == 0
+
+
+def test_index_save_load(tmp_path: Path):
+    """Test that indexes are saved, and corrupted ones are rebuilt."""
+    index = LogIndex()
+    index.update(_log(START, 10).encode(), inode=1)
+    index.save(tmp_path / "index.json")
+    assert LogIndex.load(tmp_path / "index.json") == index
+    (tmp_path / "index.json").write_text("{")
+    assert LogIndex.load(tmp_path / "index.json") == LogIndex()
+
+
+def test_index_span():
+    """Test that a time window only covers part of the log."""
+    data = _log(START, 60).encode()
+    index = LogIndex()
+    index.update(data, inode=1)
+    start, end, start_time = index.span(START + 600, START + 1200)
+    assert 0 < start < end < len(data)
+    assert start_time is not None and start_time <= START + 600
+
+
+def test_search_log(tmp_path: Path, index_dir: Path):
+    """Test that only the lines of the time window matching the pattern are returned."""
+    log = tmp_path / "server1.log"
+    log.write_text(_log(START, 60))
+    lines, truncated = search_log(log, "panic", START + 600, START + 720)
+    assert lines == ["line 10 panic", "line 11 panic", "line 12 panic"]
+    assert not truncated
+    assert list(index_dir.iterdir())
+
+
+def test_search_log_unindexed_tail(tmp_path: Path):
+    """Test that lines written after the index was updated are searched."""
+    log = tmp_path / "server1.log"
+    log.write_text(_log(START, 5))
+    search_log(log, "", START, START + 3600)
+    with log.open("a") as f:
+        f.write(_log(START + 300, 5, prefix="new"))
+    lines, _ = search_log(log, "new . panic", START + 360, START + 3600)
+    assert lines == ["new 1 panic", "new 2 panic", "new 3 panic", "new 4 panic"]
+
+
+def test_search_log_limit(tmp_path: Path):
+    """Test that results are truncated to the limit."""
+    log = tmp_path / "server1.log"
+    log.write_text(_log(START, 60))
+    lines, truncated = search_log(log, "panic", START, START + 3600, limit=2)
+    assert lines == ["line 0 panic", "line 1 panic"]
+    assert truncated
+
+
+def test_search_log_rotated(tmp_path: Path):
+    """Test that rotated segments of the time window are searched, oldest first."""
+    log = tmp_path / "server1.log"
+    rotated = tmp_path / ".rotated"
+    rotated.mkdir()
+    (rotated / f"server1.log-20251017-{int(START)}").write_text(_log(START - 600, 10, "old"))
+    (rotated / f"server1.log-20251017-{int(START + 600)}").write_text(_log(START, 10, "mid"))
+    log.write_text(_log(START + 600, 10))
+    assert [t for t, _ in rotated_segments(log)] == [START, START + 600]
+    lines, _ = search_log(log, "panic", START + 540, START + 660)
+    assert lines == ["mid 9 panic", "line 0 panic", "line 1 panic"]
+
+
+@pytest.mark.skipif(shutil.which("zstd") is None, reason="zstd is not installed")
+def test_search_log_compressed(tmp_path: Path):
+    """Test that compressed rotated segments are decompressed."""
+    log = tmp_path / "server1.log"
+    rotated = tmp_path / ".rotated"
+    rotated.mkdir()
+    segment = rotated / f"server1.log-20251017-{int(START + 600)}"
+    segment.write_text(_log(START, 10, "old"))
+    subprocess.run(["zstd", "-q", "--rm", str(segment)], check=True)
+    log.write_text(_log(START + 600, 10))
+    lines, _ = search_log(log, "panic", START + 480, START + 600)
+    assert lines == ["old 8 panic", "old 9 panic", "line 0 panic"]
+
+
+def test_tail_log(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that the last lines are read backwards in blocks."""
+    monkeypatch.setattr(logsearch, "TAIL_BLOCK", 16)
+    log = tmp_path / "server1.log"
+    log.write_text("".join(f"line {i}\n" for i in range(100)))
+    assert tail_log(log, 3) == ["line 97", "line 98", "line 99"]
+    assert len(tail_log(log, 1000)) == 100
@@ -0,0 +1,53 @@
+"""Unit tests for metrics.py."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+import metrics
+from metrics import record_duration, timed
+
+
+@pytest.fixture
+def metrics_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Redirect the metrics files to a temporary directory."""
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "DURATIONS_FILE", str(tmp_path / "durations.json"))
+    monkeypatch.setattr(metrics, "TEXTFILE", str(tmp_path / "charm.prom"))
+    return tmp_path
+
+
+def test_record_duration(metrics_dir: Path):
+    """Test that durations are accumulated and rendered for the exporter."""
+    record_duration("hook", "config-changed", 1.0)
+    record_duration("hook", "config-changed", 0.5)
+    durations = json.loads((metrics_dir / "durations.json").read_text())
+    assert durations == {"hook": {"config-changed": {"sum": 1.5, "count": 2, "last": 0.5}}}
+    textfile = (metrics_dir / "charm.prom").read_text()
+    assert "# TYPE conserver_charm_hook_duration_seconds summary" in textfile
+    assert 'conserver_charm_hook_duration_seconds_count{hook="config-changed"} 2' in textfile
+    assert 'conserver_charm_hook_duration_seconds_last{hook="config-changed"} 0.5' in textfile
+
+
+def test_record_duration_corrupted(metrics_dir: Path):
+    """Test that a corrupted store is started over."""
+    (metrics_dir / "durations.json").write_text("{")
+    record_duration("operation", "reload", 2.0)
+    durations = json.loads((metrics_dir / "durations.json").read_text())
+    assert durations["operation"]["reload"]["count"] == 1
+
+
+def test_record_duration_no_exporter(metrics_dir: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that nothing is recorded until the metrics directory exists."""
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(metrics_dir / "missing"))
+    record_duration("hook", "install", 1.0)
+    assert not (metrics_dir / "durations.json").exists()
+
+
+def test_timed(metrics_dir: Path):
+    """Test that the duration of a block is recorded, even when it raises."""
+    with pytest.raises(RuntimeError), timed("operation", "restart"):
+        raise RuntimeError
+    durations = json.loads((metrics_dir / "durations.json").read_text())
+    assert durations["operation"]["restart"]["count"] == 1
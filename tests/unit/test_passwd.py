@@ -0,0 +1,76 @@
+"""Unit tests for passwd.py."""
+
+import shutil
+import stat
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from passwd import HashCache, PasswdError, crypt_passwords, parse_users, render_passwd
+
+
+def test_parse_users():
+    """Test that users are parsed from username:password lines."""
+    assert parse_users("# users\nalice:s3cret\n\nbob:pass:word\n") == {
+        "alice": "s3cret",
+        "bob": "pass:word",
+    }
+
+
+@pytest.mark.parametrize("contents", ["alice", "alice:", ":s3cret"])
+def test_parse_users_invalid(contents: str):
+    """Test that lines without a user name or password are rejected."""
+    with pytest.raises(PasswdError):
+        parse_users(contents)
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="openssl is not installed")
+def test_crypt_passwords():
+    """Test that passwords are hashed with SHA-512 crypt and their own salt."""
+    hashes = crypt_passwords(["s3cret", "s3cret"])
+    assert all(hash_.startswith("$6$") for hash_ in hashes)
+    assert hashes[0] != hashes[1]
+
+
+def _fake_crypt(passwords: list[str]) -> list[str]:
+    return [f"$6$salt${password}" for password in passwords]
+
+
+@patch("passwd.crypt_passwords", side_effect=_fake_crypt)
+def test_hash_users_cached(crypt_mock: MagicMock, tmp_path: Path):
+    """Test that only new or changed credentials are hashed."""
+    path = tmp_path / "cache.json"
+    cache = HashCache()
+    assert cache.hash_users({"alice": "a", "bob": "b"}) == {
+        "alice": "$6$salt$a",
+        "bob": "$6$salt$b",
+    }
+    cache.save(path)
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+
+    cache = HashCache.load(path)
+    hashes = cache.hash_users({"bob": "b2", "carol": "c"})
+    crypt_mock.assert_called_with(["b2", "c"])
+    assert hashes == {"bob": "$6$salt$b2", "carol": "$6$salt$c"}
+    # Removed users are dropped from the cache
+    assert set(cache.entries) == {"bob", "carol"}
+
+    crypt_mock.reset_mock()
+    cache.hash_users({"bob": "b2", "carol": "c"})
+    crypt_mock.assert_called_once_with([])
+
+
+def test_hash_cache_corrupted(tmp_path: Path):
+    """Test that a corrupted cache is replaced by an empty one."""
+    path = tmp_path / "cache.json"
+    path.write_text("{")
+    assert HashCache.load(path).entries == {}
+
+
+def test_render_passwd():
+    """Test that generated entries replace those of the same users in passwd-file."""
+    contents = "# passwd\nalice:$1$old\ndave:$6$dave\n"
+    assert render_passwd({"alice": "$6$new"}, contents) == (
+        "# passwd\ndave:$6$dave\nalice:$6$new\n"
+    )
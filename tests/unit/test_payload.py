@@ -0,0 +1,48 @@
+"""Unit tests for payload.py."""
+
+import gzip
+import hashlib
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from payload import ChecksumError, decompress, decompress_file, verify_checksum
+
+CONTENTS = b"console simple {\n  master localhost;\n  type exec;\n  rw *;\n}\n" * 100
+
+
+def test_decompress_plain():
+    """Test that uncompressed data is returned as is."""
+    assert decompress(CONTENTS) == CONTENTS
+
+
+def test_decompress_gzip():
+    """Test that gzip compressed data is decompressed."""
+    assert decompress(gzip.compress(CONTENTS)) == CONTENTS
+
+
+@pytest.mark.skipif(shutil.which("zstd") is None, reason="zstd is not installed")
+def test_decompress_zstd():
+    """Test that zstd compressed data is decompressed."""
+    compressed = subprocess.run(["zstd", "--stdout"], input=CONTENTS, capture_output=True).stdout
+    assert decompress(compressed) == CONTENTS
+
+
+@pytest.mark.parametrize("compress", [lambda data: data, gzip.compress])
+def test_decompress_file(tmp_path: Path, compress):
+    """Test that files are decompressed and their digest returned."""
+    src = tmp_path / "conserver.cf.gz"
+    src.write_bytes(compress(CONTENTS))
+    dest = tmp_path / "conserver.cf"
+    assert decompress_file(src, dest) == hashlib.sha256(CONTENTS).hexdigest()
+    assert dest.read_bytes() == CONTENTS
+
+
+def test_verify_checksum():
+    """Test that checksums are compared, and skipped when not set."""
+    digest = hashlib.sha256(CONTENTS).hexdigest()
+    verify_checksum(digest, "")
+    verify_checksum(digest, digest.upper())
+    pytest.raises(ChecksumError, verify_checksum, digest, "0" * 64)
@@ -0,0 +1,82 @@
+"""Unit tests for registry.py."""
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from registry import RegistrationError, merge_registrations, parse_registration, render_due
+
+
+def test_parse_registration():
+    """Test that registered consoles are parsed in the inventory format."""
+    consoles = parse_registration(json.dumps({"node1": "10.0.0.1", "node2": {"bmc": "10.0.0.2"}}))
+    assert consoles["node1"].bmc == "10.0.0.1"
+    assert consoles["node2"].bmc == "10.0.0.2"
+
+
+@pytest.mark.parametrize("data", ["", "[", "[1]", '{"node1": 1}'])
+def test_parse_registration_invalid(data: str):
+    """Test that invalid registrations are rejected."""
+    with pytest.raises(RegistrationError):
+        parse_registration(data)
+
+
+def test_merge_registrations():
+    """Test that registrations are merged, the first unit by name winning conflicts."""
+    consoles = merge_registrations(
+        [
+            ("nodes/1", json.dumps({"node1": "10.0.0.11", "node2": "10.0.0.2"})),
+            ("nodes/0", json.dumps({"node1": "10.0.0.1"})),
+            ("broken/0", "not json"),
+        ]
+    )
+    assert {name: console.bmc for name, console in consoles.items()} == {
+        "node1": "10.0.0.1",
+        "node2": "10.0.0.2",
+    }
+
+
+@pytest.mark.parametrize(
+    "console",
+    [
+        {"bmc": "10.0.0.1", "type": "exec", "exec": "touch /tmp/pwned"},
+        {"bmc": "10.0.0.1", "logfile": "/etc/cron.d/pwned"},
+        {"bmc": "10.0.0.1", "username": "admin"},
+        {"bmc": "10.0.0.1; touch /tmp/pwned"},
+        {"host": "$(touch /tmp/pwned)"},
+    ],
+)
+def test_merge_registrations_denied(console: dict):
+    """Test that consoles with settings other than those of ipmi consoles are ignored."""
+    registrations = [("nodes/0", json.dumps({"node1": console, "node2": "10.0.0.2"}))]
+    assert list(merge_registrations(registrations)) == ["node2"]
+
+
+def test_merge_registrations_allowed():
+    """Test that ipmi settings, credentials and groups are accepted."""
+    console = {
+        "bmc": "bmc1.example.com",
+        "group": "rack1",
+        "type": "ipmi",
+        "ipmiprivlevel": "operator",
+        "credentials-secret": "secret:1",
+    }
+    registrations = [("nodes/0", json.dumps({"node1": console, "../node2": "10.0.0.2"}))]
+    assert list(merge_registrations(registrations)) == ["node1"]
+
+
+@pytest.mark.parametrize(
+    "pending_since,changed_at,due",
+    [
+        (0.0, 0.0, False),
+        (900.0, 990.0, False),
+        (900.0, 930.0, True),
+        # Registrations that keep changing are rendered after the maximum wait
+        (300.0, 999.0, True),
+    ],
+)
+def test_render_due(pending_since: float, changed_at: float, due: bool):
+    """Test that registrations are rendered once settled for the delay."""
+    with patch("registry.time.time", return_value=1000.0):
+        assert render_due(pending_since, changed_at, 60) is due
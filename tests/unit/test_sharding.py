@@ -0,0 +1,69 @@
+"""Unit tests for sharding.py."""
+
+import pytest
+
+from conserver_cf import parse_config
+from sharding import HashRing, partition_consoles, shard_consoles
+
+CONSOLES = [f"node{i}" for i in range(1000)]
+
+
+def test_hash_ring_deterministic():
+    """Test that the ring assignment does not depend on node order."""
+    ring1 = HashRing(["conserver/0", "conserver/1", "conserver/2"])
+    ring2 = HashRing(["conserver/2", "conserver/0", "conserver/1"])
+    assert all(ring1.node_for(name) == ring2.node_for(name) for name in CONSOLES)
+
+
+def test_hash_ring_balanced():
+    """Test that keys are spread roughly evenly across nodes."""
+    ring = HashRing(["conserver/0", "conserver/1", "conserver/2"])
+    counts = {}
+    for name in CONSOLES:
+        node = ring.node_for(name)
+        counts[node] = counts.get(node, 0) + 1
+    assert len(counts) == 3
+    assert all(200 < count < 470 for count in counts.values())
+
+
+def test_hash_ring_minimal_movement():
+    """Test that adding a node only moves keys to the new node."""
+    before = HashRing(["conserver/0", "conserver/1", "conserver/2"])
+    after = HashRing(["conserver/0", "conserver/1", "conserver/2", "conserver/3"])
+    moved = [name for name in CONSOLES if before.node_for(name) != after.node_for(name)]
+    assert all(after.node_for(name) == "conserver/3" for name in moved)
+    assert len(moved) < len(CONSOLES) / 2
+
+
+def test_hash_ring_empty():
+    """Test that an empty ring cannot own keys."""
+    pytest.raises(ValueError, HashRing([]).node_for, "node0")
+
+
+def test_shard_consoles():
+    """Test that console masters are rewritten to their owning unit."""
+    model = parse_config(
+        "default full { rw *; }\n"
+        "console a { master localhost; include full; }\n"
+        "console b { include full; }\n"
+    )
+    addresses = {"conserver/0": "10.0.0.1", "conserver/1": "10.0.0.2"}
+    sharded = shard_consoles(model, addresses)
+    ring = HashRing(addresses)
+    assert sharded.blocks[0] == model.blocks[0]
+    for name, console in sharded.consoles.items():
+        assert console.items[-1] == ("master", addresses[ring.node_for(name)])
+        assert [key for key, _ in console.items].count("master") == 1
+
+
+def test_partition_consoles():
+    """Test that each console goes to exactly one part, with all other blocks."""
+    model = parse_config(
+        "default full { rw *; }\n"
+        + "".join(f"console {name} {{ include full; }}\n" for name in CONSOLES)
+    )
+    parts = partition_consoles(model, ["0", "1", "2"])
+    assert sorted(name for part in parts.values() for name in part.consoles) == sorted(CONSOLES)
+    for part in parts.values():
+        assert part.blocks_of("default") == model.blocks_of("default")
+        assert part.consoles
@@ -0,0 +1,51 @@
+"""Unit tests for tracing.py."""
+
+import functools
+from unittest.mock import MagicMock, patch
+
+from tracing import traced
+
+
+@traced
+class Workload:
+    """Workload with every kind of member that is traced."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def start(self, value: int) -> int:
+        """Start the workload."""
+        return value + 1
+
+    @property
+    def running(self) -> bool:
+        """Check whether the workload is running."""
+        return True
+
+    @functools.cached_property
+    def package(self) -> int:
+        """Look up the package of the workload."""
+        self.calls += 1
+        return self.calls
+
+    @staticmethod
+    def _command(name: str) -> list[str]:
+        return [name]
+
+
+@patch("tracing.tracer")
+def test_traced(tracer_mock: MagicMock):
+    """Test that methods and properties run in spans named after them, unchanged."""
+    workload = Workload()
+    assert workload.start(1) == 2
+    assert workload.running is True
+    assert workload.package == workload.package == 1
+    assert Workload._command("ls") == ["ls"]
+    names = [call.args[0] for call in tracer_mock.start_as_current_span.call_args_list]
+    assert names == [
+        "Workload.start",
+        "Workload.running",
+        "Workload.package",
+        "Workload._command",
+    ]
+    assert Workload.start.__doc__ == "Start the workload."
@@ -0,0 +1,63 @@
+"""Unit tests for tuning.py."""
+
+import pytest
+
+from tuning import CapacityError, ResourcePlan
+
+
+def _plan(consoles: int, instances: int = 1, port: int = 3109, base_port: int = 33000):
+    return ResourcePlan(
+        consoles=consoles,
+        instances=instances,
+        port=port,
+        base_port=base_port,
+        port_range=1000,
+    )
+
+
+def test_small():
+    """Test that a small deployment keeps default-like limits."""
+    plan = _plan(10)
+    assert plan.children == 1
+    assert plan.nofile == 2048
+    assert plan.weight == 100
+    plan.check()
+
+
+def test_large():
+    """Test that limits grow with the consoles of each instance, in large steps."""
+    plan = _plan(10_000, instances=4)
+    assert plan.consoles_per_instance == 3125
+    assert plan.children == 196
+    assert plan.nofile == 32768
+    assert plan.tasks == 8192
+    assert plan.weight == 1000
+    assert _plan(9_000, instances=4).nofile == plan.nofile
+    assert "LimitNOFILE=32768\nTasksMax=8192\n" in plan.render_dropin()
+
+
+def test_reserved_ports():
+    """Test that the ports of the child processes of each instance are reserved."""
+    sysctl = _plan(1000, instances=2).render_sysctl()
+    assert "net.ipv4.ip_local_reserved_ports = 33000-33039,34000-34039\n" in sysctl
+
+
+def test_too_many_consoles():
+    """Test that consoles needing more ports than available are rejected."""
+    with pytest.raises(CapacityError, match="only 1000 available"):
+        _plan(40_000, instances=2).check()
+    with pytest.raises(CapacityError, match="only 36 available"):
+        _plan(1000, base_port=65500).check()
+
+
+def test_port_conflict():
+    """Test that a listen port used by the child processes is rejected."""
+    with pytest.raises(CapacityError, match="port 33010"):
+        _plan(1000, port=33010).check()
+
+
+def test_port_capacity():
+    """Test that the ports from base-port bound the consoles, shared unevenly by instances."""
+    assert _plan(10, base_port=65500).port_capacity == 36 * 16
+    assert _plan(10, instances=2).port_capacity == int(1000 * 16 * 2 / 1.25)
+    assert _plan(10, base_port=65535, instances=2).port_capacity == 0
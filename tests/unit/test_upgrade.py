@@ -0,0 +1,30 @@
+"""Unit tests for upgrade.py."""
+
+from upgrade import next_turn, takeover_unit
+
+
+def test_next_turn():
+    """Test that the turn goes to the lowest unit waiting, the last unit after the others."""
+    requests = {"conserver/10": "8.2.7", "conserver/2": "8.2.7", "conserver/0": "8.2.7"}
+    assert next_turn(requests, "", last="conserver/0") == "conserver/2"
+    assert next_turn({"conserver/0": "8.2.7"}, "", last="conserver/0") == "conserver/0"
+
+
+def test_next_turn_kept():
+    """Test that the unit holding the turn keeps it until it upgraded."""
+    requests = {"conserver/1": "8.2.7", "conserver/3": "8.2.7"}
+    assert next_turn(requests, "conserver/3") == "conserver/3"
+    assert next_turn({**requests, "conserver/3": ""}, "conserver/3") == "conserver/1"
+
+
+def test_next_turn_none():
+    """Test that no unit holds the turn once all units upgraded."""
+    assert next_turn({"conserver/1": ""}, "conserver/1") == ""
+
+
+def test_takeover_unit():
+    """Test that the active unit fails over to the lowest upgraded standby unit."""
+    requests = {"conserver/0": "8.2.7", "conserver/3": "", "conserver/2": "8.2.7"}
+    assert takeover_unit(requests, "conserver/0") == "conserver/3"
+    assert takeover_unit({**requests, "conserver/3": "8.2.7"}, "conserver/0") == "conserver/2"
+    assert takeover_unit({"conserver/0": "8.2.7"}, "conserver/0") == ""